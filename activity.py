@@ -0,0 +1,215 @@
+"""实时活动统计
+
+在内存中按分钟统计答题、答对、登录、开始考试、提交考试和AI提问的次数, 供管理后台和桌面管理工具
+绘制迷你走势图, 上课时实时查看班级的活动情况而不需要反复查询数据库。
+
+- 每种事件一个固定长度的环形缓冲区, 保存最近 LIVE_MINUTES 分钟的每分钟计数, 写入路径只做一次加法;
+- 多进程部署时各进程每隔 RELAY_INTERVAL 秒经失效总线把新增的计数广播给其他进程,
+  每个进程的缓冲区都包含全部进程的计数;
+- 持有租约的进程定期把已结束的时间段按 HISTORY_BUCKET 分钟合并后写入 activity_history 表,
+  用于查看更长时间的历史, 重启后历史数据仍然保留。
+"""
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cluster
+
+EVENTS = {
+    "answers": "答题",
+    "correct_answers": "答对",
+    "logins": "登录",
+    "exam_starts": "开始考试",
+    "exam_submits": "提交考试",
+    "chats": "AI提问",
+}
+
+# 内存中保存的分钟数
+LIVE_MINUTES = 180
+# 历史数据每个时间段的分钟数
+HISTORY_BUCKET = 5
+# 历史数据的保留天数
+HISTORY_RETENTION_DAYS = 90
+# 历史数据最多返回的点数, 时间范围较长时合并为更长的时间段
+MAX_HISTORY_POINTS = 288
+# 多进程部署时广播新增计数的间隔(秒)
+RELAY_INTERVAL = 5
+# 写入历史数据的间隔(秒)
+PERSIST_INTERVAL = 60
+
+def current_minute() -> int:
+    """当前时间的Unix分钟数"""
+    return int(time.time() // 60)
+
+class RingBuffer:
+    """固定长度的每分钟计数, 第m分钟保存在 m % size 的位置"""
+
+    __slots__ = ("size", "minutes", "counts")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.minutes = [-1] * size
+        self.counts = [0] * size
+
+    def add(self, minute: int, count: int = 1):
+        index = minute % self.size
+        if self.minutes[index] != minute:
+            if self.minutes[index] > minute:
+                # 该位置已被更新的分钟占用, 过旧的计数丢弃
+                return
+            self.minutes[index] = minute
+            self.counts[index] = 0
+        self.counts[index] += count
+
+    def get(self, minute: int) -> int:
+        index = minute % self.size
+        return self.counts[index] if self.minutes[index] == minute else 0
+
+    def series(self, start: int, end: int) -> List[int]:
+        """[start, end) 每分钟的计数"""
+        return [self.get(minute) for minute in range(start, end)]
+
+class ActivityMetrics:
+    """各类事件的每分钟计数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffers = {event: RingBuffer(LIVE_MINUTES) for event in EVENTS}
+        # 尚未广播给其他进程的计数: (分钟, 事件) -> 次数
+        self._pending: Dict[Tuple[int, str], int] = {}
+        self._relay = False
+        # 已写入历史数据的时间段终点
+        self._persisted_until: Optional[int] = None
+
+    def record(self, event: str, count: int = 1):
+        """记录事件发生"""
+        minute = current_minute()
+        with self._lock:
+            self._buffers[event].add(minute, count)
+            if self._relay:
+                key = (minute, event)
+                self._pending[key] = self._pending.get(key, 0) + count
+
+    def merge(self, payload):
+        """合并其他进程广播的计数"""
+        with self._lock:
+            for minute, event, count in payload or ():
+                if event in self._buffers:
+                    self._buffers[event].add(minute, count)
+
+    def flush_relay(self):
+        """把新增的计数广播给其他进程"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            cluster.publish("activity", [[minute, event, count] for (minute, event), count in pending.items()],
+                            local=False)
+
+    def _series_result(self, start: int, interval: int, series: Dict[str, List[int]]) -> dict:
+        return {
+            "start": start * 60,
+            "interval": interval * 60,
+            "labels": EVENTS,
+            "series": series,
+            "totals": {event: sum(values) for event, values in series.items()}
+        }
+
+    def live(self, minutes: int = 60) -> dict:
+        """最近 minutes 分钟(含当前分钟)的每分钟计数
+
+        Returns:
+            dict: start 为第一个点的Unix时间(秒), interval 为每个点的秒数, series 为各事件的计数
+        """
+        minutes = max(1, min(minutes, LIVE_MINUTES))
+        end = current_minute() + 1
+        start = end - minutes
+        with self._lock:
+            series = {event: buffer.series(start, end) for event, buffer in self._buffers.items()}
+        return self._series_result(start, 1, series)
+
+    def _bucket_sums(self, start: int, end: int, step: int) -> Dict[Tuple[int, str], int]:
+        """内存中 [start, end) 按step分钟合并的计数, 只包含缓冲区覆盖的分钟"""
+        start = max(start, current_minute() - LIVE_MINUTES + 1)
+        sums: Dict[Tuple[int, str], int] = {}
+        with self._lock:
+            for event, buffer in self._buffers.items():
+                for minute in range(start, end):
+                    count = buffer.get(minute)
+                    if count:
+                        key = (minute // step * step, event)
+                        sums[key] = sums.get(key, 0) + count
+        return sums
+
+    def persist(self):
+        """把已结束的时间段写入历史数据, 并清理过期的历史数据"""
+        from sqlalchemy import text
+        from db import engine
+
+        now = current_minute()
+        end = now // HISTORY_BUCKET * HISTORY_BUCKET
+        oldest = math.ceil((now - LIVE_MINUTES + 1) / HISTORY_BUCKET) * HISTORY_BUCKET
+        # 其他进程的计数最多延迟几秒到达, 上一个时间段再写入一次
+        start = oldest if self._persisted_until is None else max(oldest, self._persisted_until - HISTORY_BUCKET)
+        rows = [
+            {"bucket": bucket, "event": event, "count": count}
+            for (bucket, event), count in self._bucket_sums(start, end, HISTORY_BUCKET).items()
+        ]
+        with engine.begin() as connection:
+            if rows:
+                # 接管任务的进程缓冲区可能不完整, 保留较大的计数
+                connection.execute(text(
+                    "INSERT INTO activity_history (bucket, event, count) VALUES (:bucket, :event, :count) "
+                    "ON CONFLICT(bucket, event) DO UPDATE SET count = MAX(count, excluded.count)"
+                ), rows)
+            connection.execute(text("DELETE FROM activity_history WHERE bucket < :before"), {
+                "before": now - HISTORY_RETENTION_DAYS * 24 * 60
+            })
+        self._persisted_until = end
+
+    def history(self, hours: int = 24) -> dict:
+        """最近 hours 小时的计数, 按时间段合并, 点数不超过 MAX_HISTORY_POINTS
+
+        尚未写入数据库的最近时间段取内存中的计数。
+        """
+        from sqlalchemy import text
+        from db import engine
+
+        minutes = hours * 60
+        step = max(HISTORY_BUCKET, math.ceil(minutes / MAX_HISTORY_POINTS / HISTORY_BUCKET) * HISTORY_BUCKET)
+        end = (current_minute() // step + 1) * step
+        points = math.ceil(minutes / step)
+        start = end - points * step
+        with engine.connect() as connection:
+            rows = connection.execute(text(
+                "SELECT bucket / :step * :step AS point, event, SUM(count) FROM activity_history "
+                "WHERE bucket >= :start AND bucket < :end GROUP BY point, event"
+            ), {"step": step, "start": start, "end": end}).fetchall()
+        sums = {(point, event): count for point, event, count in rows}
+        for key, count in self._bucket_sums(start, end, step).items():
+            sums[key] = max(sums.get(key, 0), count)
+        series = {
+            event: [sums.get((start + i * step, event), 0) for i in range(points)]
+            for event in EVENTS
+        }
+        return self._series_result(start, step, series)
+
+activity = ActivityMetrics()
+
+cluster.register_handler("activity", activity.merge)
+
+def start_activity_worker():
+    """启动广播计数和写入历史数据的后台任务"""
+    if cluster.is_multi_worker() and not activity._relay:
+        activity._relay = True
+
+        def relay_loop():
+            while True:
+                time.sleep(RELAY_INTERVAL)
+                try:
+                    activity.flush_relay()
+                except Exception as e:
+                    print(f"广播活动统计失败: {e}")
+
+        threading.Thread(target=relay_loop, daemon=True).start()
+    cluster.run_periodic("activity_history", activity.persist, PERSIST_INTERVAL)
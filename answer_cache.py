@@ -0,0 +1,204 @@
+"""AI问答回答缓存
+
+同一个班级的学生经常提出几乎相同的问题, 对这些问题直接回放已有的回答, 不再请求大模型。
+查找分两步: 先按规范化后的问题文本精确匹配, 再用MinHash + LSH分桶查找近似重复的问题,
+估计的Jaccard相似度达到阈值即视为命中。缓存条目有存活时间和数量上限, 按LRU淘汰。
+MinHash在事件循环中同步计算, 耗时与问题长度成正比, 过长的问题(通常贴了整段代码)只做精确匹配。
+"""
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+import cluster
+from config import config
+from relevance import normalize_question
+
+# MinHash签名长度, 按 BANDS x ROWS 划分LSH分桶
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# 问题的字符 shingle 长度
+SHINGLE_SIZE = 3
+# shingle 数少于该值的短问题只做精确匹配, 避免"什么是列表"与"什么是元组"被判为相似
+MIN_SHINGLES = 8
+# 去掉标点和空白后超过该长度的问题只做精确匹配: 200字的签名约需几毫秒, 更长的问题按比例增加;
+# 只取开头计算签名也不可行, 开头相同、后面代码不同的两个问题会被误判为相似
+MAX_SHINGLE_CHARS = 200
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+# 计算相似度时忽略标点和空白
+_NOISE_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+def _shingles(compact: str) -> Set[int]:
+    """把去掉标点和空白的问题切成字符 shingle 并哈希为整数"""
+    if len(compact) < SHINGLE_SIZE:
+        return set()
+    return {
+        int.from_bytes(hashlib.blake2b(compact[i:i + SHINGLE_SIZE].encode("utf-8"), digest_size=8).digest(), "big")
+        for i in range(len(compact) - SHINGLE_SIZE + 1)
+    }
+
+def minhash(shingles: Set[int]) -> Tuple[int, ...]:
+    """计算MinHash签名"""
+    return tuple(
+        min((a * x + b) % _MERSENNE_PRIME for x in shingles)
+        for a, b in _PERMUTATIONS
+    )
+
+def _signature(text: str) -> Optional[Tuple[int, ...]]:
+    """计算近似匹配用的MinHash签名, 过短或过长的问题返回None, 只做精确匹配"""
+    compact = _NOISE_RE.sub("", text)
+    if len(compact) > MAX_SHINGLE_CHARS:
+        return None
+    shingles = _shingles(compact)
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    return minhash(shingles)
+
+def _bands(signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [(i, signature[i * ROWS:(i + 1) * ROWS]) for i in range(BANDS)]
+
+class _Entry:
+    __slots__ = ("answer", "created_at", "signature")
+
+    def __init__(self, answer: str, created_at: float, signature: Optional[Tuple[int, ...]]):
+        self.answer = answer
+        self.created_at = created_at
+        self.signature = signature
+
+class AnswerCache:
+    """带近似匹配的回答缓存"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+        # 管理员在后台切换的开关, 为None时使用配置文件中的值
+        self._enabled_override: Optional[bool] = None
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        """缓存是否启用"""
+        if self._enabled_override is not None:
+            return self._enabled_override
+        return config.answer_cache_enabled
+
+    def set_enabled(self, enabled: bool):
+        """管理员切换缓存开关, 重启后恢复为配置文件中的值"""
+        self._enabled_override = enabled
+        if not enabled:
+            self.clear()
+
+    def _remove(self, key: str):
+        """删除条目及其分桶索引(需持有锁)"""
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry.signature is not None:
+            for band in _bands(entry.signature):
+                bucket = self._buckets.get(band)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band]
+
+    def _alive(self, entry: _Entry, now: float) -> bool:
+        return now - entry.created_at < config.answer_cache_ttl
+
+    def lookup(self, question: str) -> Optional[str]:
+        """查找缓存的回答, 未命中时返回None"""
+        if not self.enabled:
+            return None
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._alive(entry, now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.answer
+                self._remove(key)
+
+        signature = _signature(key)
+        if signature is not None:
+            threshold = config.answer_cache_similarity
+            with self._lock:
+                candidates = set()
+                for band in _bands(signature):
+                    candidates.update(self._buckets.get(band, ()))
+                best_key, best_score = None, 0.0
+                for candidate in candidates:
+                    candidate_entry = self._entries[candidate]
+                    score = sum(1 for x, y in zip(signature, candidate_entry.signature) if x == y) / NUM_PERM
+                    if score > best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None and best_score >= threshold:
+                    best_entry = self._entries[best_key]
+                    if self._alive(best_entry, now):
+                        self._entries.move_to_end(best_key)
+                        self.hits += 1
+                        self.near_hits += 1
+                        return best_entry.answer
+                    self._remove(best_key)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, question: str, answer: str):
+        """缓存一个完整的回答"""
+        if not self.enabled or not answer:
+            return
+        key = normalize_question(question)
+        if not key:
+            return
+        signature = _signature(key)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _Entry(answer, time.time(), signature)
+            if signature is not None:
+                for band in _bands(signature):
+                    self._buckets.setdefault(band, set()).add(key)
+            max_entries = config.answer_cache_max_entries
+            while len(self._entries) > max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def get_stats(self) -> dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0
+            }
+
+answer_cache = AnswerCache()
+
+def _on_answer_cache_command(payload):
+    """处理其他进程发来的缓存开关/清空命令"""
+    payload = payload or {}
+    if "enabled" in payload:
+        answer_cache.set_enabled(payload["enabled"])
+    if payload.get("clear"):
+        answer_cache.clear()
+
+cluster.register_handler("answer_cache", _on_answer_cache_command)
@@ -1,6 +1,8 @@
+import argparse
+import asyncio
 from contextlib import asynccontextmanager
 from os.path import join as path_join, exists as path_exists
-from os import makedirs
+from os import makedirs, environ
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -8,8 +10,13 @@ from fastapi.staticfiles import StaticFiles
 import uvicorn
 
 from routes import page_routes, user_routes, practice_routes, exam_routes, admin_routes, chat_routes
-from middleware import exam_check_middleware
+from middleware import exam_check_middleware, session_cookie_middleware
 from db import init_db
+from llm_client import llm_clients
+from relevance import start_relevance_worker
+from explanations import start_prefetch_worker
+from activity import start_activity_worker
+import cluster
 from paths import get_base_path, get_static_path
 from config import config
 
@@ -21,6 +28,14 @@ async def lifespan(app: FastAPI):
         if not path_exists(data_path):
             makedirs(data_path)
         init_db()
+        # 创建共享的AI客户端, 所有问答请求复用同一个连接池
+        llm_clients.get()
+        # 后台批量判断待判断问题的相关性
+        start_relevance_worker(asyncio.get_running_loop())
+        # 后台为常见的错误答案预先生成AI讲解
+        start_prefetch_worker(asyncio.get_running_loop())
+        # 实时活动统计: 多进程间广播计数, 定期写入历史数据
+        start_activity_worker()
         
         # # 发送启动事件
         # send_event('start')
@@ -32,13 +47,15 @@ async def lifespan(app: FastAPI):
     finally:
         # # 发送停止事件
         # send_event('stop')
-        pass
+        # 关闭共享的AI客户端连接池
+        await llm_clients.aclose()
 
 # 创建FastAPI应用
 app = FastAPI(lifespan=lifespan)
 
 # 配置中间件
 app.middleware("http")(exam_check_middleware)
+app.middleware("http")(session_cookie_middleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -61,4 +78,19 @@ app.include_router(admin_routes.router)  # 用于页面路由
 app.include_router(admin_routes.api_router)  # 用于API路由
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    parser = argparse.ArgumentParser(description="Python学习系统服务")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--workers", type=int, default=config.server_workers, help="工作进程数")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # 工作进程继承该环境变量, 启用进程间失效通知和共享限流状态
+        environ[cluster.WORKERS_ENV] = str(args.workers)
+        # 在派生工作进程前完成建表和迁移, 避免多个进程同时修改表结构
+        init_db(start_background=False)
+        uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        # 单进程运行, 不继承外部环境中的多进程设置
+        environ.pop(cluster.WORKERS_ENV, None)
+        uvicorn.run(app, host=args.host, port=args.port)
@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
 from functools import wraps
-from typing import Tuple
+from typing import Optional, Tuple
 
 from fastapi import Request, HTTPException
 from fastapi.responses import RedirectResponse
@@ -11,7 +11,7 @@ import passlib.handlers.bcrypt  # 显式导入，确保 PyInstaller 可以检测
 
 
 from config import config
-from db import create_or_update_user, get_user_info, get_user_ip_info
+from db import create_or_update_user, get_user_info, get_user_ip_info, get_user_session_info, get_session_version
 from utils import get_client_ip
 
 # 密码加密上下文
@@ -22,6 +22,11 @@ SECRET_KEY = config.secret_key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = config.token_expire_minutes
 
+# 学生会话token相关配置
+SESSION_COOKIE = "session"
+SESSION_PERM_AI = 1
+SESSION_PERM_EXAM = 2
+
 async def verify_user_ip(student_id: str, request: Request) -> Tuple[bool, str]:
     """验证用户IP地址
     
@@ -46,6 +51,92 @@ async def verify_user_ip(student_id: str, request: Request) -> Tuple[bool, str]:
     # 如果是新用户,允许访问登录页面
     return True, ""
 
+def create_session_token(student_id: str) -> Optional[str]:
+    """为学生签发短期会话token
+    
+    token中包含学号、姓名、绑定IP、绑定日期、权限位和会话版本,
+    在有效期内校验token无需访问数据库。
+    
+    Returns:
+        str: 签名后的token, 用户不存在时返回None
+    """
+    info = get_user_session_info(student_id)
+    if not info:
+        return None
+    perm = 0
+    if info["enable_ai"]:
+        perm |= SESSION_PERM_AI
+    if info["enable_exam"]:
+        perm |= SESSION_PERM_EXAM
+    claims = {
+        "sub": student_id,
+        "typ": "student",
+        "name": info["name"],
+        "ip": info["bound_ip"],
+        "bd": info["bound_time"].date().isoformat() if info["bound_time"] else None,
+        "perm": perm,
+        "rv": info["session_version"],
+        "exp": datetime.utcnow() + timedelta(minutes=config.session_expire_minutes)
+    }
+    return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+
+def verify_session_token(request: Request, student_id: str) -> Optional[dict]:
+    """校验请求中的学生会话token
+    
+    签名、有效期、IP、绑定日期和会话版本全部通过时返回token内容,
+    否则返回None, 由调用方回退到数据库校验。
+    """
+    token = request.cookies.get(SESSION_COOKIE)
+    if not token:
+        return None
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if claims.get("typ") != "student" or claims.get("sub") != student_id:
+        return None
+    # 绑定日期不是今天时需要走数据库路径重新绑定IP
+    if claims.get("bd") != datetime.now().date().isoformat():
+        return None
+    if claims.get("ip") != get_client_ip(request):
+        return None
+    if claims.get("rv") != get_session_version(student_id):
+        return None
+    return claims
+
+async def authenticate_student(request: Request) -> Tuple[Optional[dict], int, str]:
+    """认证当前请求的学生
+    
+    优先校验会话token; token缺失、过期或已吊销时回退到数据库校验,
+    校验通过后签发新token并通过 request.state.session_token 交给中间件写入cookie。
+    
+    Returns:
+        tuple: (会话信息, 失败时的状态码, 失败时的错误信息)
+    """
+    student_id = request.cookies.get("studentId")
+    if not student_id:
+        return None, 401, "未登录,请重新登录"
+    
+    claims = verify_session_token(request, student_id)
+    if claims:
+        request.state.student = claims
+        return claims, 200, ""
+    
+    if not get_user_info(student_id):
+        return None, 401, "未登录,请重新登录"
+    
+    valid, error_msg = await verify_user_ip(student_id, request)
+    if not valid:
+        return None, 403, error_msg
+    
+    token = create_session_token(student_id)
+    if not token:
+        return None, 401, "未登录,请重新登录"
+    claims = jwt.get_unverified_claims(token)
+    request.state.session_token = token
+    request.state.student = claims
+    return claims, 200, ""
+
 def auth_required(is_page_route=False):
     """用户认证装饰器
     
@@ -55,25 +146,20 @@ def auth_required(is_page_route=False):
     def decorator(func):
         @wraps(func)
         async def wrapper(request: Request, *args, **kwargs):
-            student_id = request.cookies.get("studentId")
+            claims, status_code, error_msg = await authenticate_student(request)
             
             # 未登录处理
-            if not student_id:
+            if status_code == 401:
                 if is_page_route:
                     return RedirectResponse(url="/login")
-                raise HTTPException(status_code=401, detail="未登录,请重新登录")
-            
-            if not get_user_info(student_id):
-                if is_page_route:
-                    return RedirectResponse(url="/login")
-                raise HTTPException(status_code=401, detail="未登录,请重新登录")
+                raise HTTPException(status_code=401, detail=error_msg)
             
             # IP验证失败处理
-            valid, error_msg = await verify_user_ip(student_id, request)
-            if not valid:
+            if status_code == 403:
                 if is_page_route:
                     response = RedirectResponse(url="/login")
                     response.delete_cookie(key="studentId", path="/")
+                    response.delete_cookie(key=SESSION_COOKIE, path="/")
                     return response
                 raise HTTPException(status_code=403, detail=error_msg)
                 
@@ -134,24 +220,16 @@ def admin_required():
 
 async def get_current_user(request: Request):
     """获取当前登录用户"""
-    student_id = request.cookies.get("studentId")
-    
-    # 未登录
-    if not student_id:
-        return None
-    
-    # 用户不存在
-    name = get_user_info(student_id)
-    if not name:
-        return None
-    
-    # IP验证失败
-    valid, _ = await verify_user_ip(student_id, request)
-    if not valid:
+    # 未登录、用户不存在或IP验证失败
+    claims, _, _ = await authenticate_student(request)
+    if not claims:
         return None
     
     # 返回用户信息
+    perm = claims.get("perm", 0)
     return type('User', (), {
-        'student_id': student_id,
-        'name': name
+        'student_id': claims["sub"],
+        'name': claims["name"],
+        'enable_ai': bool(perm & SESSION_PERM_AI),
+        'enable_exam': bool(perm & SESSION_PERM_EXAM)
     })()
@@ -0,0 +1,176 @@
+"""多轮对话上下文
+
+学生开启连续对话时, 把最近的问答记录作为历史消息一起发送给大模型。
+历史只取最近一段时间内、未被标记为无关的记录, 并按轮数上限和token预算截断,
+每轮的token估计在加载时计算一次后随窗口缓存。每个学生的历史窗口缓存在进程内,
+有新记录时只增量加载新增的部分; 已加载的记录被重新标记相关性时丢弃整个窗口, 下次重新加载。
+
+消息顺序固定为 系统提示词 -> 历史问答(时间正序) -> 当前问题, 便于上游按前缀命中缓存。
+窗口的起点也不会每次提问都向后滑动: 超出预算或轮数上限时一次丢弃较早的若干轮,
+使剩余部分降到上限的一半, 之后的几次提问都在同一个起点上追加, 请求前缀保持不变。
+丢弃时总是保留最近的 MIN_RECENT_TURNS 轮, 追问时大模型总能看到上一轮问答;
+最近一轮单独超出预算时截断其回答, 而不是整轮丢弃。
+"""
+import math
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Iterable, List
+
+import cluster
+from config import config
+from db import get_recent_chat_turns
+
+# 每条消息在正文之外的固定token开销(角色标记等)
+MESSAGE_OVERHEAD = 4
+# 最多缓存多少个学生的历史窗口
+MAX_WINDOWS = 2048
+# 截断历史时至少保留的最近轮数(预算允许时)
+MIN_RECENT_TURNS = 2
+# 截断回答时追加的标记
+TRUNCATED_MARK = "……"
+
+# 中日韩文字和全角符号
+_WIDE_RE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计文本的token数: 中文等宽字符约0.6个token, 其他字符约0.3个token"""
+    if not text:
+        return 0
+    wide = len(_WIDE_RE.findall(text))
+    return math.ceil(wide * 0.6 + (len(text) - wide) * 0.3)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截取文本开头估计不超过 max_tokens 个token的部分"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    total = 0.0
+    for i, char in enumerate(text):
+        total += 0.6 if _WIDE_RE.match(char) else 0.3
+        if total > max_tokens:
+            return text[:i]
+    return text
+
+class _Turn:
+    """一轮历史问答"""
+
+    __slots__ = ("id", "question", "answer", "chat_time", "tokens")
+
+    def __init__(self, record: dict):
+        self.id = record["id"]
+        self.question = record["question"]
+        self.answer = record["answer"] or ""
+        self.chat_time = record["chat_time"]
+        self._count_tokens()
+
+    def _count_tokens(self):
+        self.tokens = estimate_tokens(self.question) + estimate_tokens(self.answer) + 2 * MESSAGE_OVERHEAD
+
+    def truncate(self, budget: int):
+        """截断回答(问题本身超出预算时也截断问题), 使本轮不超过 budget 个token"""
+        available = budget - 2 * MESSAGE_OVERHEAD - estimate_tokens(TRUNCATED_MARK)
+        question_tokens = estimate_tokens(self.question)
+        if question_tokens > available // 2:
+            # 问题至多占一半, 剩余留给回答的开头
+            self.question = truncate_to_tokens(self.question, available // 2) + TRUNCATED_MARK
+            question_tokens = estimate_tokens(self.question)
+        answer = truncate_to_tokens(self.answer, max(0, available - question_tokens))
+        if answer != self.answer:
+            self.answer = answer + TRUNCATED_MARK
+        self._count_tokens()
+
+class _Window:
+    """一个学生的历史窗口"""
+
+    __slots__ = ("turns", "last_id", "anchor_id", "stale")
+
+    def __init__(self):
+        self.turns: List[_Turn] = []
+        self.last_id = 0     # 已加载的最大记录ID
+        self.anchor_id = 0   # 窗口起点, ID小于该值的记录不再携带
+        self.stale = True    # 数据库中可能有尚未加载的新记录
+
+class ChatContext:
+    """多轮对话历史窗口管理"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows: "OrderedDict[str, _Window]" = OrderedDict()
+
+    def mark_stale(self, student_id: str):
+        """学生有了新的问答记录, 下次组装上下文时增量加载"""
+        with self._lock:
+            window = self._windows.get(student_id)
+            if window is not None:
+                window.stale = True
+
+    def reset(self, student_ids: Iterable[str]):
+        """学生的问答记录被重新标记相关性, 丢弃已缓存的窗口
+
+        增量加载只取ID更大的新记录, 窗口中已有的记录被标记为无关后不会自行消失。
+        """
+        with self._lock:
+            for student_id in student_ids:
+                self._windows.pop(student_id, None)
+
+    def _get_window(self, student_id: str) -> _Window:
+        with self._lock:
+            window = self._windows.get(student_id)
+            if window is None:
+                window = self._windows[student_id] = _Window()
+                while len(self._windows) > MAX_WINDOWS:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(student_id)
+        return window
+
+    def history(self, student_id: str) -> List[_Turn]:
+        """获取本次提问要携带的历史问答(时间正序)"""
+        max_turns = config.chat_context_max_turns
+        budget = config.chat_context_token_budget
+        since = datetime.now() - timedelta(minutes=config.chat_context_window_minutes)
+        window = self._get_window(student_id)
+
+        if window.stale:
+            # 先清除标记, 加载期间保存的新记录会重新标记
+            window.stale = False
+            records = get_recent_chat_turns(student_id, since, after_id=window.last_id, limit=max_turns)
+            if records:
+                window.turns.extend(_Turn(record) for record in records)
+                window.last_id = records[-1]["id"]
+
+        turns = [t for t in window.turns if t.id >= window.anchor_id and t.chat_time >= since]
+        total = sum(t.tokens for t in turns)
+        if total > budget or len(turns) > max_turns:
+            # 一次丢弃较早的若干轮, 剩余部分降到上限的一半, 但保留最近的几轮
+            keep = min(MIN_RECENT_TURNS, max_turns)
+            while len(turns) > keep and (total > budget // 2 or len(turns) > max_turns // 2):
+                total -= turns.pop(0).tokens
+            # 最近几轮合计仍超出预算时只保留最后一轮, 单独超出预算时截断
+            while len(turns) > min(1, keep) and total > budget:
+                total -= turns.pop(0).tokens
+            if turns and total > budget:
+                turns[-1].truncate(budget)
+            window.anchor_id = turns[0].id if turns else window.last_id + 1
+        window.turns = turns
+        return list(turns)
+
+def build_messages(system_prompt: str, question: str, history: List[_Turn] = ()) -> List[dict]:
+    """组装发送给大模型的消息列表: 系统提示词 -> 历史问答 -> 当前问题"""
+    messages = [{"role": "system", "content": system_prompt}]
+    for turn in history:
+        messages.append({"role": "user", "content": turn.question})
+        messages.append({"role": "assistant", "content": turn.answer})
+    messages.append({"role": "user", "content": question})
+    return messages
+
+chat_context = ChatContext()
+
+def _on_new_chats(student_ids: List[str]):
+    """处理新问答记录的通知"""
+    for student_id in set(student_ids):
+        chat_context.mark_stale(student_id)
+
+cluster.register_handler("chat_context", _on_new_chats)
+cluster.register_handler("chat_context_reset", chat_context.reset)
@@ -0,0 +1,278 @@
+"""多进程部署支持
+
+以多个uvicorn工作进程运行时, 各进程的内存状态(lru_cache、会话版本缓存、管理后台事件等)
+需要保持一致。本模块提供:
+
+- 失效通知总线: 通过SQLite中的 cache_invalidations 表在进程间广播失效消息,
+  每个进程的监听线程轮询新消息并调用本地注册的处理函数。每次写入都会产生的高频消息
+  (数据版本、管理后台事件)用 publish_batched 在内存中累积, 每隔 BATCH_INTERVAL 秒合并写入一次;
+- 后台任务选主: 通过 worker_leases 表的租约保证定时任务(如考试过期检查)只在一个进程中运行。
+
+单进程部署时, publish 只调用本地处理函数, 后台任务直接在本进程运行, 不访问数据库。
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+
+# 启动多个工作进程时由启动器设置, 子进程继承该环境变量
+WORKERS_ENV = "OPENJUDGE_WORKERS"
+
+# 当前进程的唯一标识
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+# 失效消息保留时间(秒), 由主进程定期清理
+INVALIDATION_RETENTION = 300
+# 合并发布的间隔(秒), 与监听线程的轮询间隔相同
+BATCH_INTERVAL = 0.5
+
+_handlers: Dict[str, List[Callable]] = {}
+_handlers_lock = threading.Lock()
+_listener_started = False
+_jobs_started = set()
+_jobs_lock = threading.Lock()
+# 待合并发布的消息: 主题 -> 消息内容列表
+_batched: Dict[str, list] = {}
+_batched_lock = threading.Lock()
+_batch_flusher_started = False
+
+def get_worker_count() -> int:
+    """获取部署的工作进程数
+
+    只以实际派生工作进程的启动器设置的环境变量为准: 配置文件中的 server.workers 只是启动参数的默认值,
+    桌面程序内置的服务和 --workers 1 启动时都只有一个进程。
+    """
+    try:
+        return max(1, int(os.environ.get(WORKERS_ENV, "1")))
+    except ValueError:
+        return 1
+
+def is_multi_worker() -> bool:
+    """是否以多进程方式部署"""
+    return get_worker_count() > 1
+
+def register_handler(topic: str, handler: Callable[[Optional[object]], None]):
+    """注册失效消息处理函数
+
+    Args:
+        topic: 消息主题, 如 user、questions
+        handler: 处理函数, 参数为消息内容
+    """
+    with _handlers_lock:
+        _handlers.setdefault(topic, []).append(handler)
+
+def _dispatch(topic: str, payload):
+    """调用本地处理函数"""
+    for handler in list(_handlers.get(topic, [])):
+        try:
+            handler(payload)
+        except Exception as e:
+            print(f"处理失效消息失败({topic}): {e}")
+
+def publish(topic: str, payload=None, local: bool = True):
+    """发布失效消息
+
+    本进程立即处理; 多进程部署时同时写入数据库, 由其他进程的监听线程处理。
+
+    Args:
+        topic: 消息主题
+        payload: 消息内容, 需可JSON序列化
+        local: 是否调用本进程的处理函数
+    """
+    if local:
+        _dispatch(topic, payload)
+    if not is_multi_worker():
+        return
+    try:
+        _write_messages({topic: payload})
+    except Exception as e:
+        print(f"发布失效消息失败({topic}): {e}")
+
+def _write_messages(messages: Dict[str, object]):
+    """在一个事务中写入失效消息, 每个主题一条"""
+    from sqlalchemy import text
+    from db import engine
+    now = time.time()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO cache_invalidations (topic, payload, origin, created_at) "
+            "VALUES (:topic, :payload, :origin, :created_at)"
+        ), [{
+            "topic": topic,
+            "payload": json.dumps(payload, ensure_ascii=False, default=str),
+            "origin": WORKER_ID,
+            "created_at": now
+        } for topic, payload in messages.items()])
+
+def publish_batched(topic: str, items: Iterable, local: bool = True):
+    """发布可以合并的消息, 处理函数的参数为消息内容的列表
+
+    本进程立即处理; 多进程部署时先在内存中累积, 由后台线程每隔 BATCH_INTERVAL 秒把每个主题累积的
+    内容合并为一条消息写入数据库, 高频写入路径不再每次都增加一个写事务。
+    内容为空列表时同样会发布, 用于只需要通知有变化的场景。
+
+    Args:
+        topic: 消息主题
+        items: 消息内容, 每项需可JSON序列化
+        local: 是否调用本进程的处理函数
+    """
+    items = list(items)
+    if local:
+        _dispatch(topic, items)
+    if not is_multi_worker():
+        return
+    with _batched_lock:
+        _batched.setdefault(topic, []).extend(items)
+    _start_batch_flusher()
+
+def flush_batched():
+    """把累积的消息写入数据库"""
+    global _batched
+    with _batched_lock:
+        messages, _batched = _batched, {}
+    if messages:
+        _write_messages(messages)
+
+def _start_batch_flusher():
+    global _batch_flusher_started
+    with _batched_lock:
+        if _batch_flusher_started:
+            return
+        _batch_flusher_started = True
+
+    def flush_loop():
+        while True:
+            time.sleep(BATCH_INTERVAL)
+            try:
+                flush_batched()
+            except Exception as e:
+                print(f"发布合并的失效消息失败: {e}")
+
+    threading.Thread(target=flush_loop, daemon=True).start()
+
+def start_invalidation_listener(poll_interval: float = 0.5):
+    """启动失效消息监听线程, 仅在多进程部署时生效"""
+    global _listener_started
+    if _listener_started or not is_multi_worker():
+        return
+    _listener_started = True
+
+    from sqlalchemy import text
+    from db import engine
+
+    with engine.connect() as connection:
+        last_id = connection.execute(text("SELECT COALESCE(MAX(id), 0) FROM cache_invalidations")).scalar()
+
+    def listen_loop():
+        nonlocal last_id
+        while True:
+            time.sleep(poll_interval)
+            try:
+                with engine.connect() as connection:
+                    rows = connection.execute(text(
+                        "SELECT id, topic, payload, origin FROM cache_invalidations "
+                        "WHERE id > :last_id ORDER BY id"
+                    ), {"last_id": last_id}).fetchall()
+            except Exception as e:
+                print(f"读取失效消息失败: {e}")
+                continue
+            for row_id, topic, payload, origin in rows:
+                last_id = row_id
+                if origin != WORKER_ID:
+                    _dispatch(topic, json.loads(payload) if payload else None)
+
+    threading.Thread(target=listen_loop, daemon=True).start()
+
+def try_acquire_lease(name: str, ttl: float) -> bool:
+    """尝试获取或续期指定名称的租约
+
+    Returns:
+        bool: 当前进程是否持有租约
+    """
+    from sqlalchemy import text
+    from db import engine
+    now = time.time()
+    params = {"name": name, "owner": WORKER_ID, "now": now, "expires_at": now + ttl}
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT OR IGNORE INTO worker_leases (name, owner, expires_at) VALUES (:name, :owner, :expires_at)"
+        ), params)
+        result = connection.execute(text(
+            "UPDATE worker_leases SET owner = :owner, expires_at = :expires_at "
+            "WHERE name = :name AND (owner = :owner OR expires_at < :now)"
+        ), params)
+        return result.rowcount == 1
+
+def _run_with_lease(name: str, func: Callable[[], None], ttl: float):
+    """执行任务期间每隔 ttl/3 续期租约, 执行时间超过ttl的任务不会被其他进程重复执行"""
+    done = threading.Event()
+
+    def renew_loop():
+        while not done.wait(ttl / 3):
+            try:
+                if not try_acquire_lease(name, ttl):
+                    print(f"后台任务租约已被其他进程接管({name})")
+                    return
+            except Exception as e:
+                print(f"续期后台任务租约失败({name}): {e}")
+
+    renewer = threading.Thread(target=renew_loop, daemon=True)
+    renewer.start()
+    try:
+        func()
+    finally:
+        done.set()
+
+def run_periodic(name: str, func: Callable[[], None], interval: float):
+    """启动只在一个进程中运行的定时任务
+
+    多进程部署时, 各进程竞争名为name的租约, 只有持有租约的进程执行任务, 执行期间持续续期;
+    持有者退出后租约过期, 由其他进程接管。同一进程内同名任务只启动一次。
+    """
+    with _jobs_lock:
+        if name in _jobs_started:
+            return
+        _jobs_started.add(name)
+    ttl = interval * 3
+
+    def job_loop():
+        while True:
+            try:
+                if not is_multi_worker():
+                    func()
+                elif try_acquire_lease(name, ttl=ttl):
+                    _run_with_lease(name, func, ttl)
+            except Exception as e:
+                print(f"后台任务执行失败({name}): {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=job_loop, daemon=True).start()
+
+def cleanup_invalidations():
+    """清理过期的失效消息"""
+    from sqlalchemy import text
+    from db import engine
+    with engine.begin() as connection:
+        connection.execute(text(
+            "DELETE FROM cache_invalidations WHERE created_at < :before"
+        ), {"before": time.time() - INVALIDATION_RETENTION})
+
+def start_cluster_services():
+    """启动多进程部署所需的后台服务"""
+    if not is_multi_worker():
+        return
+    from events import admin_events
+    # 管理后台事件经失效总线合并转发给其他进程的SSE订阅者
+    admin_events.relay = lambda event: publish_batched("admin_events", [event], local=False)
+    start_invalidation_listener()
+    run_periodic("cleanup_invalidations", cleanup_invalidations, 60)
+
+def _deliver_admin_events(events):
+    """把其他进程转发来的管理后台事件投递给本进程的订阅者"""
+    from events import admin_events
+    for event in events or ():
+        admin_events.deliver(event)
+
+register_handler("admin_events", _deliver_admin_events)
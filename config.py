@@ -2,12 +2,170 @@ import os
 import secrets
 import threading
 import time
-from typing import Optional, Any
+from typing import Optional, Any, Callable, List, Tuple
 import json
 from paths import get_base_path
 
+# 配置项不存在时用于区分"值为None"和"未找到"
+_MISSING = object()
+
+class ConfigSnapshot:
+    """配置快照
+
+    每次配置文件发生变化时解析生成一个新的快照对象, 生成后不可修改。
+    请求处理函数应在开始时读取一次 config.snapshot 并在整个请求中使用它,
+    这样即使请求处理过程中发生了重载, 也不会读到前后不一致的配置。
+    """
+
+    __slots__ = (
+        'version', 'data', '_lookup_cache',
+        'admin_username', 'admin_password',
+        'deepseek_api_key', 'deepseek_base_url', 'deepseek_model',
+        'deepseek_max_connections', 'deepseek_max_keepalive_connections', 'deepseek_keepalive_expiry',
+        'deepseek_connect_timeout', 'deepseek_read_timeout', 'deepseek_http2',
+        'deepseek_max_concurrent', 'deepseek_max_queue', 'deepseek_queue_timeout',
+        'token_expire_minutes', 'session_expire_minutes',
+        'cycle_days', 'correct_threshold', 'exam_duration', 'exam_question_count',
+        'question_range_days', 'pass_score', 'practice_threshold',
+        'rate_limit_max_requests', 'rate_limit_window', 'rate_limit_backend',
+        'relevance_local_enabled', 'relevance_threshold', 'relevance_batch_size', 'relevance_batch_interval',
+        'answer_cache_enabled', 'answer_cache_ttl', 'answer_cache_max_entries', 'answer_cache_similarity',
+        'chat_context_enabled', 'chat_context_max_turns', 'chat_context_token_budget', 'chat_context_window_minutes',
+        'explanation_enabled', 'explanation_prefetch_min_count', 'explanation_prefetch_interval',
+        'enable_registration', 'enable_exam', 'enable_ip_anti_cheat',
+        'default_ai_permission', 'default_exam_permission',
+        'db_file', 'db_pool_size', 'db_max_overflow', 'db_pool_timeout',
+        'server_workers',
+    )
+
+    def __init__(self, config_data: dict, version: int = 0):
+        """解析配置字典
+
+        Args:
+            config_data: 从config.json读取的原始配置
+            version: 快照版本号, 每次重载递增
+        """
+        values = {'version': version, 'data': config_data, '_lookup_cache': {}}
+
+        # 加载管理员配置
+        admin = config_data.get('admin', {})
+        values['admin_username'] = admin.get('username')
+        values['admin_password'] = admin.get('password')
+
+        # DeepSeek配置
+        deepseek = config_data.get('deepseek', {})
+        values['deepseek_api_key'] = deepseek.get('api_key', "")
+        values['deepseek_base_url'] = deepseek.get('base_url', "https://api.deepseek.com")
+        values['deepseek_model'] = deepseek.get('model', "deepseek-chat")
+        values['deepseek_max_connections'] = deepseek.get('max_connections', 100)
+        values['deepseek_max_keepalive_connections'] = deepseek.get('max_keepalive_connections', 20)
+        values['deepseek_keepalive_expiry'] = deepseek.get('keepalive_expiry', 30)
+        values['deepseek_connect_timeout'] = deepseek.get('connect_timeout', 10)
+        values['deepseek_read_timeout'] = deepseek.get('read_timeout', 60)
+        values['deepseek_http2'] = deepseek.get('http2', True)
+        values['deepseek_max_concurrent'] = max(1, int(deepseek.get('max_concurrent', 20)))
+        values['deepseek_max_queue'] = deepseek.get('max_queue', 200)
+        values['deepseek_queue_timeout'] = deepseek.get('queue_timeout', 60)
+
+        # Token配置
+        token = config_data.get('token', {})
+        values['token_expire_minutes'] = token.get('expire_minutes', 300)
+        values['session_expire_minutes'] = token.get('session_minutes', 30)
+
+        # 系统业务配置
+        system = config_data.get('system', {})
+        values['cycle_days'] = system.get('cycle_days', 7)
+        values['correct_threshold'] = system.get('correct_threshold', 3)
+        values['exam_duration'] = system.get('exam_duration', 30)
+        values['exam_question_count'] = system.get('exam_question_count', 10)
+        values['question_range_days'] = system.get('question_range_days', 7)
+        values['pass_score'] = float(system.get('pass_score', 60))
+        values['practice_threshold'] = system.get('practice_threshold', 10)
+
+        # 限流器配置
+        rate_limit = config_data.get('rate_limit', {})
+        values['rate_limit_max_requests'] = rate_limit.get('max_requests', 10)
+        values['rate_limit_window'] = rate_limit.get('window', 300)
+        values['rate_limit_backend'] = rate_limit.get('backend', 'memory')
+
+        # 问题相关性判断配置
+        relevance = config_data.get('relevance', {})
+        values['relevance_local_enabled'] = relevance.get('local_enabled', True)
+        values['relevance_threshold'] = float(relevance.get('threshold', 3.0))
+        values['relevance_batch_size'] = relevance.get('batch_size', 20)
+        values['relevance_batch_interval'] = relevance.get('batch_interval', 5)
+
+        # 回答缓存配置
+        answer_cache = config_data.get('answer_cache', {})
+        values['answer_cache_enabled'] = answer_cache.get('enabled', True)
+        values['answer_cache_ttl'] = answer_cache.get('ttl', 3600)
+        values['answer_cache_max_entries'] = answer_cache.get('max_entries', 1000)
+        values['answer_cache_similarity'] = float(answer_cache.get('similarity', 0.8))
+
+        # 多轮对话配置
+        chat = config_data.get('chat', {})
+        values['chat_context_enabled'] = chat.get('context_enabled', True)
+        values['chat_context_max_turns'] = chat.get('context_max_turns', 6)
+        values['chat_context_token_budget'] = chat.get('context_token_budget', 2000)
+        values['chat_context_window_minutes'] = chat.get('context_window_minutes', 60)
+
+        # 错题AI讲解配置
+        explanation = config_data.get('explanation', {})
+        values['explanation_enabled'] = explanation.get('enabled', True)
+        values['explanation_prefetch_min_count'] = explanation.get('prefetch_min_count', 3)
+        values['explanation_prefetch_interval'] = explanation.get('prefetch_interval', 300)
+
+        # 功能开关配置
+        features = config_data.get('features', {})
+        values['enable_registration'] = features.get('enable_registration', True)
+        values['enable_exam'] = features.get('enable_exam', True)
+        values['enable_ip_anti_cheat'] = features.get('enable_ip_anti_cheat', True)
+        values['default_ai_permission'] = features.get('default_ai_permission', True)
+        values['default_exam_permission'] = features.get('default_exam_permission', True)
+
+        # 数据库配置
+        database = config_data.get('database', {})
+        values['db_file'] = database.get('file', 'openjudge.db')
+        values['db_pool_size'] = database.get('pool_size', 50)
+        values['db_max_overflow'] = database.get('max_overflow', 100)
+        values['db_pool_timeout'] = database.get('pool_timeout', 60)
+
+        # 服务部署配置
+        server = config_data.get('server', {})
+        values['server_workers'] = server.get('workers', 1)
+
+        if values['practice_threshold'] < values['exam_question_count']:
+            raise ValueError("要求刷对的题目数量不能小于抽题数")
+
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("配置快照是只读的")
+
+    def __delattr__(self, name):
+        raise AttributeError("配置快照是只读的")
+
+    def get(self, key: str, default: Optional[Any] = None) -> Optional[Any]:
+        """通过.分隔的键名读取原始配置值, 结果按键名缓存在快照上"""
+        value = self._lookup_cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.data
+            try:
+                for k in key.split('.'):
+                    value = value[k]
+            except (KeyError, IndexError, TypeError):
+                value = _MISSING
+            self._lookup_cache[key] = value
+        return default if value is _MISSING else value
+
+
 class Config:
-    """配置管理类,用于加载和访问yaml配置文件"""
+    """配置管理类,用于加载和访问json配置文件
+
+    配置以不可变快照(ConfigSnapshot)的形式发布, 只有当配置文件的修改时间或大小
+    发生变化, 或GUI主动通知时才会重新解析。
+    """
     
     _instance = None
     
@@ -21,77 +179,106 @@ class Config:
     def _get_config_path(self) -> str:
         """获取配置文件路径"""
         return os.path.join(get_base_path(), 'config.json')
+
+    def _get_file_signature(self) -> Optional[Tuple[int, int]]:
+        """获取配置文件的(修改时间, 大小), 用于判断文件是否变化"""
+        try:
+            st = os.stat(self._get_config_path())
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
     
-    def reload_config(self):
-        """重新加载yaml配置文件"""
-        config_path = self._get_config_path()
+    def _load_secret_key(self) -> str:
+        """读取持久化的签名密钥, 不存在时生成一个
+
+        密钥保存在 data/secret.key 中, 服务重启或多个进程之间签发的token都能互相验证。
+        """
+        data_path = os.path.join(get_base_path(), 'data')
+        key_path = os.path.join(data_path, 'secret.key')
+        os.makedirs(data_path, exist_ok=True)
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config_data = json.load(f)
-            
-            # 加载管理员配置
-            admin = config_data.get('admin', {})
-            self._admin_username = admin.get('username')
-            self._admin_password = admin.get('password')
-            
-            # DeepSeek配置
-            deepseek = config_data.get('deepseek', {})
-            self._deepseek_api_key = deepseek.get('api_key', "")
-            self._deepseek_base_url = deepseek.get('base_url', "https://api.deepseek.com")
-            self._deepseek_model = deepseek.get('model', "deepseek-chat")
-            
-            # Token配置
-            token = config_data.get('token', {})
-            self._token_expire_minutes = token.get('expire_minutes', 300)
-            
-            # 系统业务配置
-            system = config_data.get('system', {})
-            self._cycle_days = system.get('cycle_days', 7)
-            self._correct_threshold = system.get('correct_threshold', 3)
-            self._exam_duration = system.get('exam_duration', 30)
-            self._exam_question_count = system.get('exam_question_count', 10)
-            self._question_range_days = system.get('question_range_days', 7)
-            self._pass_score = float(system.get('pass_score', 60))
-            self._practice_threshold = system.get('practice_threshold', 10)
-            
-            # 限流器配置
-            rate_limit = config_data.get('rate_limit', {})
-            self._rate_limit_max_requests = rate_limit.get('max_requests', 10)
-            self._rate_limit_window = rate_limit.get('window', 300)
-            
-            # 功能开关配置
-            features = config_data.get('features', {})
-            self._enable_registration = features.get('enable_registration', True)
-            self._enable_exam = features.get('enable_exam', True)
-            self._enable_ip_anti_cheat = features.get('enable_ip_anti_cheat', True)
-            self._default_ai_permission = features.get('default_ai_permission', True)
-            self._default_exam_permission = features.get('default_exam_permission', True)
-            
-            # 数据库配置
-            database = config_data.get('database', {})
-            self._db_file = database.get('file', 'openjudge.db')
-            self._db_pool_size = database.get('pool_size', 50)
-            self._db_max_overflow = database.get('max_overflow', 100)
-            self._db_pool_timeout = database.get('pool_timeout', 60)
+            # O_EXCL保证并发启动时只有一个进程写入密钥
+            fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+        # 其他进程可能刚创建文件还未写完, 稍等后重读
+        for _ in range(50):
+            with open(key_path, 'r') as f:
+                key = f.read().strip()
+            if key:
+                return key
+            time.sleep(0.1)
+        raise RuntimeError(f"签名密钥文件为空: {key_path}")
+
+    def reload_config(self, force: bool = False) -> bool:
+        """重新加载json配置文件
+
+        Args:
+            force: 为True时忽略文件签名, 强制重新解析
             
-            if self._practice_threshold < self.exam_question_count:
-                raise ValueError("要求刷对的题目数量不能小于抽题数")
-                
+        Returns:
+            bool: 是否发布了新的配置快照
+        """
+        with self._reload_lock:
+            signature = self._get_file_signature()
+            if not force and signature is not None and signature == self._file_signature:
+                return False
+
+            config_path = self._get_config_path()
+            try:
+                with open(config_path, 'r', encoding='utf-8') as f:
+                    config_data = json.load(f)
+                snapshot = ConfigSnapshot(config_data, version=self._snapshot_version + 1)
+            except Exception as e:
+                print(f"配置加载失败: {e}")
+                if self._snapshot is not None:
+                    # 保留旧快照, 同一份错误的文件不再重复解析
+                    self._file_signature = signature
+                raise
+
+            old_snapshot = self._snapshot
+            self._snapshot_version = snapshot.version
+            self._file_signature = signature
+            # 单次引用赋值即完成发布, 读取方要么拿到旧快照, 要么拿到新快照
+            self._snapshot = snapshot
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            try:
+                listener(old_snapshot, snapshot)
+            except Exception as e:
+                print(f"配置变更回调执行失败: {e}")
+        return True
+
+    def notify_changed(self):
+        """通知配置文件已被修改(供GUI保存配置后调用), 立即重新加载"""
+        try:
+            self.reload_config(force=True)
         except Exception as e:
-            print(f"配置加载失败: {e}")
-            raise
+            print(f"配置重载失败: {e}")
+
+    def add_listener(self, listener: Callable[[Optional[ConfigSnapshot], ConfigSnapshot], None]):
+        """注册配置变更回调, 回调参数为(旧快照, 新快照)"""
+        with self._reload_lock:
+            self._listeners.append(listener)
     
-    def start_config_reloader(self):
-        """启动配置重载定时器"""
-        def reload_loop():
+    def start_config_reloader(self, interval: float = 1.0):
+        """启动配置变化监视线程
+
+        线程只检查文件的修改时间和大小, 文件未变化时不会读取和解析配置。
+        """
+        def watch_loop():
             while True:
+                time.sleep(interval)
                 try:
                     self.reload_config()
                 except Exception as e:
                     print(f"配置重载失败: {e}")
-                time.sleep(1)  # 每秒重载一次
         
-        reloader_thread = threading.Thread(target=reload_loop, daemon=True)
+        reloader_thread = threading.Thread(target=watch_loop, daemon=True)
         reloader_thread.start()
     
     def __init__(self):
@@ -100,14 +287,24 @@ class Config:
             return
             
         # 初始化配置
-        self._secret_key = secrets.token_hex(32)
-        self.reload_config()
+        self._secret_key = self._load_secret_key()
+        self._reload_lock = threading.RLock()
+        self._listeners: List[Callable] = []
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._snapshot_version = 0
+        self._file_signature = None
+        self.reload_config(force=True)
         
-        # 启动配置重载器
+        # 启动配置监视器
         self.start_config_reloader()
         
         self._initialized = True
 
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        """获取当前配置快照"""
+        return self._snapshot
+
     @property
     def version(self) -> str:
         """获取系统版本"""
@@ -126,12 +323,12 @@ class Config:
     @property
     def admin_username(self) -> Optional[str]:
         """获取管理员用户名"""
-        return self._admin_username
+        return self._snapshot.admin_username
     
     @property
     def admin_password(self) -> Optional[str]:
         """获取管理员密码"""
-        return self._admin_password
+        return self._snapshot.admin_password
     
     @property
     def secret_key(self) -> Optional[str]:
@@ -141,113 +338,248 @@ class Config:
     @property
     def token_expire_minutes(self) -> int:
         """获取token过期时间(分钟)"""
-        return self._token_expire_minutes
+        return self._snapshot.token_expire_minutes
+    
+    @property
+    def session_expire_minutes(self) -> int:
+        """获取学生会话token有效期(分钟)"""
+        return self._snapshot.session_expire_minutes
     
     @property
     def cycle_days(self) -> int:
         """获取循环周期(天)"""
-        return self._cycle_days
+        return self._snapshot.cycle_days
     
     @property
     def correct_threshold(self) -> int:
         """获取答对阈值"""
-        return self._correct_threshold
+        return self._snapshot.correct_threshold
     
     @property
     def exam_duration(self) -> int:
         """获取考试时间(分钟)"""
-        return self._exam_duration
+        return self._snapshot.exam_duration
     
     @property
     def exam_question_count(self) -> int:
         """获取考试题目数量"""
-        return self._exam_question_count
+        return self._snapshot.exam_question_count
     
     @property
     def question_range_days(self) -> int:
         """获取抽题时间范围(天)"""
-        return self._question_range_days
+        return self._snapshot.question_range_days
     
     @property
     def pass_score(self) -> float:
         """获取考试合格分数线"""
-        return self._pass_score
+        return self._snapshot.pass_score
     
     @property
     def practice_threshold(self) -> int:
         """获取参加考试所需的最少练习题数"""
-        return self._practice_threshold
+        return self._snapshot.practice_threshold
     
     @property
     def deepseek_api_key(self) -> Optional[str]:
         """获取DeepSeek API密钥"""
-        return self._deepseek_api_key
+        return self._snapshot.deepseek_api_key
 
     @property
     def deepseek_base_url(self) -> str:
         """获取DeepSeek base URL"""
-        return self._deepseek_base_url
+        return self._snapshot.deepseek_base_url
 
     @property
     def deepseek_model(self) -> str:
         """获取DeepSeek 模型名称"""
-        return self._deepseek_model
+        return self._snapshot.deepseek_model
+
+    @property
+    def deepseek_max_connections(self) -> int:
+        """获取DeepSeek 最大连接数"""
+        return self._snapshot.deepseek_max_connections
+
+    @property
+    def deepseek_max_keepalive_connections(self) -> int:
+        """获取DeepSeek 最大保持连接数"""
+        return self._snapshot.deepseek_max_keepalive_connections
+
+    @property
+    def deepseek_keepalive_expiry(self) -> float:
+        """获取DeepSeek 空闲连接保持时间(秒)"""
+        return self._snapshot.deepseek_keepalive_expiry
+
+    @property
+    def deepseek_connect_timeout(self) -> float:
+        """获取DeepSeek 连接超时时间(秒)"""
+        return self._snapshot.deepseek_connect_timeout
+
+    @property
+    def deepseek_read_timeout(self) -> float:
+        """获取DeepSeek 读取超时时间(秒)"""
+        return self._snapshot.deepseek_read_timeout
+
+    @property
+    def deepseek_http2(self) -> bool:
+        """获取是否对DeepSeek启用HTTP/2"""
+        return self._snapshot.deepseek_http2
+
+    @property
+    def deepseek_max_concurrent(self) -> int:
+        """获取同时进行的DeepSeek请求数上限"""
+        return self._snapshot.deepseek_max_concurrent
+
+    @property
+    def deepseek_max_queue(self) -> int:
+        """获取等待DeepSeek并发名额的请求数上限"""
+        return self._snapshot.deepseek_max_queue
+
+    @property
+    def deepseek_queue_timeout(self) -> float:
+        """获取等待DeepSeek并发名额的超时时间(秒)"""
+        return self._snapshot.deepseek_queue_timeout
         
     @property
     def rate_limit_max_requests(self) -> int:
         """获取限流器最大请求数"""
-        return self._rate_limit_max_requests
+        return self._snapshot.rate_limit_max_requests
         
     @property
     def rate_limit_window(self) -> int:
         """获取限流器时间窗口(秒)"""
-        return self._rate_limit_window
+        return self._snapshot.rate_limit_window
+        
+    @property
+    def rate_limit_backend(self) -> str:
+        """获取限流状态存储方式(memory或sqlite)"""
+        return self._snapshot.rate_limit_backend
+
+    @property
+    def relevance_local_enabled(self) -> bool:
+        """获取是否启用本地相关性分类器"""
+        return self._snapshot.relevance_local_enabled
+
+    @property
+    def relevance_threshold(self) -> float:
+        """获取本地相关性判断的置信阈值(对数几率)"""
+        return self._snapshot.relevance_threshold
+
+    @property
+    def relevance_batch_size(self) -> int:
+        """获取每次请求大模型批量判断的问题数"""
+        return self._snapshot.relevance_batch_size
+
+    @property
+    def relevance_batch_interval(self) -> float:
+        """获取批量相关性判断任务的运行间隔(秒)"""
+        return self._snapshot.relevance_batch_interval
+
+    @property
+    def answer_cache_enabled(self) -> bool:
+        """获取是否启用回答缓存"""
+        return self._snapshot.answer_cache_enabled
+
+    @property
+    def answer_cache_ttl(self) -> int:
+        """获取回答缓存的存活时间(秒)"""
+        return self._snapshot.answer_cache_ttl
+
+    @property
+    def answer_cache_max_entries(self) -> int:
+        """获取回答缓存的最大条目数"""
+        return self._snapshot.answer_cache_max_entries
+
+    @property
+    def answer_cache_similarity(self) -> float:
+        """获取近似问题命中缓存所需的相似度"""
+        return self._snapshot.answer_cache_similarity
+
+    @property
+    def chat_context_enabled(self) -> bool:
+        """获取是否允许多轮对话"""
+        return self._snapshot.chat_context_enabled
+
+    @property
+    def chat_context_max_turns(self) -> int:
+        """获取多轮对话最多携带的历史轮数"""
+        return self._snapshot.chat_context_max_turns
+
+    @property
+    def chat_context_token_budget(self) -> int:
+        """获取多轮对话历史的token预算"""
+        return self._snapshot.chat_context_token_budget
+
+    @property
+    def chat_context_window_minutes(self) -> int:
+        """获取多轮对话只携带最近多少分钟内的历史"""
+        return self._snapshot.chat_context_window_minutes
+
+    @property
+    def explanation_enabled(self) -> bool:
+        """获取是否允许学生请求错题AI讲解"""
+        return self._snapshot.explanation_enabled
+
+    @property
+    def explanation_prefetch_min_count(self) -> int:
+        """获取同一错误答案出现多少次后预先生成讲解"""
+        return self._snapshot.explanation_prefetch_min_count
+
+    @property
+    def explanation_prefetch_interval(self) -> float:
+        """获取预先生成错题讲解任务的运行间隔(秒)"""
+        return self._snapshot.explanation_prefetch_interval
         
     @property
     def enable_registration(self) -> bool:
         """获取是否允许新用户注册"""
-        return self._enable_registration
+        return self._snapshot.enable_registration
         
     @property
     def enable_exam(self) -> bool:
         """获取是否允许参加考试"""
-        return self._enable_exam
+        return self._snapshot.enable_exam
         
     @property
     def enable_ip_anti_cheat(self) -> bool:
         """获取是否启用IP防作弊"""
-        return self._enable_ip_anti_cheat
+        return self._snapshot.enable_ip_anti_cheat
         
     @property
     def default_ai_permission(self) -> bool:
         """获取新用户默认AI权限"""
-        return self._default_ai_permission
+        return self._snapshot.default_ai_permission
         
     @property
     def default_exam_permission(self) -> bool:
         """获取新用户默认考试权限"""
-        return self._default_exam_permission
+        return self._snapshot.default_exam_permission
         
     @property
     def db_file(self) -> str:
         """获取数据库文件名"""
-        return self._db_file
+        return self._snapshot.db_file
         
     @property
     def db_pool_size(self) -> int:
         """获取数据库连接池大小"""
-        return self._db_pool_size
+        return self._snapshot.db_pool_size
         
     @property
     def db_max_overflow(self) -> int:
         """获取数据库最大溢出连接数"""
-        return self._db_max_overflow
+        return self._snapshot.db_max_overflow
         
     @property
     def db_pool_timeout(self) -> int:
         """获取数据库连接超时时间(秒)"""
-        return self._db_pool_timeout
-    
+        return self._snapshot.db_pool_timeout
+
+    @property
+    def server_workers(self) -> int:
+        """获取服务工作进程数"""
+        return self._snapshot.server_workers
+
     def get(self, key: str, default: Optional[Any] = None) -> Optional[Any]:
         """
         通过键名获取配置值
@@ -259,19 +591,7 @@ class Config:
         Returns:
             配置值或默认值
         """
-        try:
-            config_path = self._get_config_path()
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config_data = json.load(f)
-            
-            # 处理嵌套键
-            keys = key.split('.')
-            value = config_data
-            for k in keys:
-                value = value[k]
-            return value
-        except:
-            return default
+        return self._snapshot.get(key, default)
 
 # 创建全局配置实例
 config = Config()
@@ -1,20 +1,28 @@
+import base64
+import itertools
 import json
 import os
 import stat
 import sys
 import threading
-import time
+from collections import OrderedDict
 from contextlib import contextmanager
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy import create_engine, func, and_, inspect, text
+from sqlalchemy import create_engine, event, func, and_, or_, case, inspect, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import QueuePool
 
+import cluster
+from activity import activity
 from config import config
-from models import Base, User, Record, CodeRecord, Exam, ExamRecord, AIChatRecord
-from questions import get_question_by_id
+from events import admin_events
+from models import Base, User, Record, CodeRecord, Exam, ExamRecord, AIChatRecord, MistakeExplanation, StudentStats
+from models import StudentDailyStats
+from questions import get_question_map, decode_answer_mask, encode_answer_mask, normalize_answer, option_labels
+from versions import data_versions
 
 from paths import get_base_path
 
@@ -33,8 +41,41 @@ engine = create_engine(
     pool_timeout=config.db_pool_timeout
 )
 
+if cluster.is_multi_worker():
+    @event.listens_for(engine, "connect")
+    def _configure_sqlite(dbapi_connection, connection_record):
+        """多进程部署时启用WAL日志并设置写锁等待时间, 避免进程间读写互相阻塞"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
 SessionLocal = sessionmaker(bind=engine)
 
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_changed_students(session, flush_context):
+    """记录事务中数据有变化的学生, 提交后增加其数据版本(见 versions 模块)"""
+    changed = session.info.setdefault("changed_students", set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        changed.add(getattr(obj, "student_id", None))
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_data_versions(session):
+    changed = session.info.pop("changed_students", None)
+    if changed is not None:
+        data_versions.publish(changed)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_changed_students(session):
+    session.info.pop("changed_students", None)
+
+def mark_changed(db: Session, *student_ids: Optional[str]) -> None:
+    """批量UPDATE/DELETE不经过会话的对象跟踪, 需要手动记录数据有变化的学生
+
+    不传学号时只增加全局版本。
+    """
+    db.info.setdefault("changed_students", set()).update(student_ids or (None,))
+
 @contextmanager
 def get_db():
     """数据库会话上下文管理器"""
@@ -68,22 +109,20 @@ def check_expired_exams():
             db.commit()
 
 def start_exam_checker():
-    """启动定期检查考试状态的线程"""
-    def check_loop():
-        while True:
-            check_expired_exams()
-            time.sleep(15)  # 每15秒检查一次
-    
-    checker_thread = threading.Thread(target=check_loop, daemon=True)
-    checker_thread.start()
+    """启动定期检查考试状态的任务, 多进程部署时只在持有租约的进程中运行"""
+    cluster.run_periodic("exam_checker", check_expired_exams, 15)  # 每15秒检查一次
 
-def init_db():
+def init_db(start_background: bool = True):
     """初始化数据库
     
     通过导入models模块中的所有模型(User, Record, CodeRecord, AIChatRecord等),
     这些模型类已经被注册到了Base.metadata中。
     当执行Base.metadata.create_all()时,
     SQLAlchemy会自动创建所有已注册模型对应的数据库表。
+
+    Args:
+        start_background: 是否启动后台任务, 多进程部署时主进程在派生工作进程前
+            只建表和迁移, 后台任务由工作进程启动
     """
     # 自动修复data目录及内部文件的权限，以防万一（跨平台实现）
     try:
@@ -103,64 +142,522 @@ def init_db():
         print(f"警告：修复 data 目录权限失败: {e}")
 
     # 首先，确保所有表都已创建
+    inspector = inspect(engine)
+    has_student_stats = inspector.has_table('student_stats')
+    has_question_stats = inspector.has_table('question_stats')
+    has_student_daily_stats = inspector.has_table('student_daily_stats')
     Base.metadata.create_all(engine)
 
     # 数据库迁移：使用 SQLAlchemy 检查并添加新列
     inspector = inspect(engine)
-    # 检查 'users' 表是否存在，以防万一
-    if inspector.has_table("users"):
-        columns = [col['name'] for col in inspector.get_columns('users')]
-        if 'enable_exam' not in columns:
-            print("正在更新数据库结构：为 'users' 表添加 'enable_exam' 列...")
+    # (表名, 列名, 列定义)
+    new_columns = [
+        ('users', 'enable_exam', 'BOOLEAN DEFAULT 0'),
+        ('users', 'session_version', 'INTEGER NOT NULL DEFAULT 0'),
+        ('ai_chat_records', 'is_partial', 'BOOLEAN DEFAULT 0'),
+        ('ai_chat_records', 'labeled_by', 'VARCHAR(10)'),
+        ('records', 'answer_mask', 'SMALLINT'),
+        ('student_stats', 'best_exam_score', 'FLOAT'),
+        ('student_stats', 'week_start', 'DATE'),
+        ('student_stats', 'week_mastered', 'INTEGER NOT NULL DEFAULT 0'),
+        ('student_stats', 'streak_days', 'INTEGER NOT NULL DEFAULT 0'),
+        ('student_stats', 'last_active_date', 'DATE'),
+    ]
+    migrated_tables = set()
+    for table_name, column_name, column_ddl in new_columns:
+        # 检查表是否存在，以防万一
+        if not inspector.has_table(table_name):
+            continue
+        columns = [col['name'] for col in inspector.get_columns(table_name)]
+        if column_name not in columns:
+            print(f"正在更新数据库结构：为 '{table_name}' 表添加 '{column_name}' 列...")
             try:
                 with engine.begin() as connection:
-                    connection.execute(text('ALTER TABLE users ADD COLUMN enable_exam BOOLEAN DEFAULT 0'))
+                    connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_ddl}'))
+                migrated_tables.add(table_name)
                 print("数据库结构更新完成。")
             except Exception as e:
                 print(f"数据库迁移失败: {e}")
                 # 迁移失败时退出，避免后续错误
                 sys.exit(1)
 
-    # 启动考试状态检查器
+    # 已有的表不会由create_all补建索引
+    new_indexes = [
+        ('ix_users_name', 'users', 'name'),
+        ('idx_record_question_correct', 'records', 'question_id, is_correct'),
+    ]
+    for index_name, table_name, column_name in new_indexes:
+        with engine.begin() as connection:
+            connection.execute(text(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({column_name})'))
+
+    # 一次性的数据迁移, 已完成的版本记录在数据库的 user_version 中
+    with engine.connect() as connection:
+        data_migration_version = connection.execute(text("PRAGMA user_version")).scalar() or 0
+    migrated_answers = 0
+    if data_migration_version < 1:
+        # 把旧版本以JSON文本保存的选择题和判断题答案转换为位掩码, 之后需要重建选项分布
+        migrated_answers = migrate_legacy_answer_masks()
+        with engine.begin() as connection:
+            connection.execute(text("PRAGMA user_version = 1"))
+
+    # 新建或新增了列的统计汇总表需要用已有数据初始化
+    if not has_student_stats or 'student_stats' in migrated_tables:
+        rebuild_student_stats()
+    if not has_question_stats or migrated_answers:
+        rebuild_question_stats()
+    if not has_student_daily_stats:
+        rebuild_student_daily_stats()
+
+    if not start_background:
+        return
+
+    # 启动进程间失效通知和考试状态检查器
+    cluster.start_cluster_services()
     start_exam_checker()
 
-def save_chat_record(student_id: str, question: str, answer: str, is_irrelevant: bool = False) -> None:
-    """保存AI问答记录"""
+# 相关性标签的来源(AIChatRecord.labeled_by)
+LABELED_BY_TEACHER = "teacher"    # 教师手动标记
+LABELED_BY_LLM = "llm"            # 大模型批量判断
+LABELED_BY_LOCAL = "local"        # 本地分类器在保存时判断
+LABELED_BY_FALLBACK = "fallback"  # 大模型多次判断失败后按相关处理
+# 可以用于训练本地分类器的标签来源, 分类器自己给出的标签不能再用来训练它;
+# 记录来源之前的旧数据(NULL)来自教师或逐条调用的大模型, 同样可用
+TRAINING_LABEL_SOURCES = (LABELED_BY_TEACHER, LABELED_BY_LLM)
+
+def save_chat_record(student_id: str, question: str, answer: str, is_irrelevant: Optional[bool] = False,
+                     is_partial: bool = False) -> None:
+    """保存AI问答记录
+
+    Args:
+        is_irrelevant: 是否是无关问题, 由本地分类器给出; 为None时表示待判断, 由后台任务批量判断
+        is_partial: 学生中途离开, 只保存了已生成的部分回答
+    """
     with get_db() as db:
         chat_record = AIChatRecord(
             student_id=student_id,
             question=question,
             answer=answer,
             chat_time=datetime.now(),
-            is_irrelevant=is_irrelevant
+            is_irrelevant=is_irrelevant,
+            labeled_by=None if is_irrelevant is None else LABELED_BY_LOCAL,
+            is_partial=is_partial
         )
         db.add(chat_record)
+        _add_to_daily_stats(db, student_id, chat_record.chat_time.date(), chats=1)
+    activity.record("chats")
+    admin_events.publish("chat", student_id=student_id, is_irrelevant=bool(is_irrelevant),
+                         pending=is_irrelevant is None)
+    # 通知各进程该学生的多轮对话历史有了新记录, 多进程部署时与其他通知合并写入
+    cluster.publish_batched("chat_context", [student_id])
+
+def get_recent_chat_turns(student_id: str, since: datetime, after_id: int = 0, limit: int = 20) -> list:
+    """获取学生最近的问答记录, 用于组装多轮对话上下文
 
-def get_chat_records(student_id: str) -> list:
-    """获取学生的问答记录"""
+    只返回 since 之后、ID大于 after_id 且未被标记为无关的记录, 按时间正序排列。
+    """
     with get_db() as db:
-        chats = db.query(AIChatRecord).filter(
-            AIChatRecord.student_id == student_id
-        ).order_by(AIChatRecord.chat_time.desc()).all()
-        
+        chats = db.query(
+            AIChatRecord.id, AIChatRecord.question, AIChatRecord.answer, AIChatRecord.chat_time
+        ).filter(
+            AIChatRecord.student_id == student_id,
+            AIChatRecord.chat_time >= since,
+            AIChatRecord.id > after_id,
+            AIChatRecord.is_irrelevant.isnot(True)
+        ).order_by(AIChatRecord.id.desc()).limit(limit).all()
+        return [{
+            "id": chat.id,
+            "question": chat.question,
+            "answer": chat.answer,
+            "chat_time": chat.chat_time
+        } for chat in reversed(chats)]
+
+def find_recent_chat_record(student_id: str, question: str, answer: str, within_minutes: int = 30) -> dict:
+    """查找最近保存的相同问答记录, 不存在时返回None"""
+    with get_db() as db:
+        chat = db.query(AIChatRecord).filter(
+            AIChatRecord.student_id == student_id,
+            AIChatRecord.chat_time >= datetime.now() - timedelta(minutes=within_minutes),
+            AIChatRecord.question == question,
+            AIChatRecord.answer == answer
+        ).order_by(AIChatRecord.id.desc()).first()
+        if not chat:
+            return None
+        return {"id": chat.id, "is_irrelevant": chat.is_irrelevant}
+
+def encode_chat_cursor(chat_time: datetime, chat_id: int) -> str:
+    """把问答记录的(时间, ID)编码为分页游标"""
+    return f"{chat_time.isoformat()}_{chat_id}"
+
+def decode_chat_cursor(cursor: str) -> tuple:
+    """解析分页游标
+
+    Raises:
+        ValueError: 游标格式错误
+    """
+    chat_time, _, chat_id = cursor.rpartition("_")
+    return datetime.fromisoformat(chat_time), int(chat_id)
+
+def get_chat_records(student_id: str, before: str = None, limit: int = 20) -> tuple:
+    """按时间倒序分页获取学生的问答记录
+
+    使用(chat_time, id)作为游标, 每页查询只扫描需要的记录。
+
+    Args:
+        student_id: 学生ID
+        before: 上一页返回的游标, 为空时从最新的记录开始
+        limit: 每页记录数
+
+    Returns:
+        tuple: (问答记录列表, 下一页游标), 没有更多记录时游标为None
+
+    Raises:
+        ValueError: 游标格式错误
+    """
+    with get_db() as db:
+        query = db.query(AIChatRecord).filter(AIChatRecord.student_id == student_id)
+        if before:
+            cursor_time, cursor_id = decode_chat_cursor(before)
+            query = query.filter(or_(
+                AIChatRecord.chat_time < cursor_time,
+                and_(AIChatRecord.chat_time == cursor_time, AIChatRecord.id < cursor_id)
+            ))
+        chats = query.order_by(
+            AIChatRecord.chat_time.desc(), AIChatRecord.id.desc()
+        ).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(chats) > limit:
+            chats = chats[:limit]
+            next_cursor = encode_chat_cursor(chats[-1].chat_time, chats[-1].id)
+
         return [{
             "id": chat.id,
             "question": chat.question,
             "answer": chat.answer,
             "chat_time": chat.chat_time,
-            "is_irrelevant": chat.is_irrelevant
-        } for chat in chats]
+            "is_irrelevant": bool(chat.is_irrelevant),
+            "is_pending": chat.is_irrelevant is None,
+            "is_partial": bool(chat.is_partial)
+        } for chat in chats], next_cursor
+
+def get_chat_counts(student_id: str) -> tuple:
+    """获取学生的问答总数、无关问题数和待判断问题数"""
+    with get_db() as db:
+        total_chats, irrelevant_chats, pending_chats = db.query(
+            func.count(AIChatRecord.id),
+            func.sum(case((AIChatRecord.is_irrelevant == True, 1), else_=0)),
+            func.sum(case((AIChatRecord.is_irrelevant.is_(None), 1), else_=0))
+        ).filter(AIChatRecord.student_id == student_id).one()
+        return total_chats or 0, irrelevant_chats or 0, pending_chats or 0
+
+# 管理后台学生进度列表可以排序的列
+PROGRESS_SORT_COLUMNS = {
+    "bound_time": User.bound_time,
+    "student_id": User.student_id,
+    "name": User.name,
+    "total_questions": StudentStats.total_questions,
+    "accuracy": StudentStats.accuracy,
+    "exam_count": StudentStats.exam_count,
+    "last_exam_score": StudentStats.last_exam_score,
+}
+
+def encode_progress_cursor(value, student_id: str) -> str:
+    """把最后一行的(排序列的值, 学号)编码为分页游标"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([value, student_id], ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_progress_cursor(cursor: str, sort: str) -> tuple:
+    """解析分页游标
+
+    Raises:
+        ValueError: 游标格式错误
+    """
+    try:
+        value, student_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (TypeError, UnicodeError) as e:
+        raise ValueError("无效的分页游标") from e
+    if not isinstance(student_id, str):
+        raise ValueError("无效的分页游标")
+    if sort == "bound_time" and value is not None:
+        value = datetime.fromisoformat(value)
+    return value, student_id
+
+def _prefix_condition(column, prefix: str):
+    """前缀匹配, 写成范围比较以便使用索引"""
+    return and_(column >= prefix, column < prefix + "\U0010ffff")
+
+def _after_cursor(column, key_column, value, student_id: str, descending: bool):
+    """键集分页条件: 排在游标之后的行
+
+    SQLite升序时NULL排在最前, 降序时排在最后。
+    """
+    if descending:
+        if value is None:
+            return and_(column.is_(None), key_column < student_id)
+        return or_(
+            column < value,
+            and_(column == value, key_column < student_id),
+            column.is_(None)
+        )
+    if value is None:
+        return or_(column.isnot(None), and_(column.is_(None), key_column > student_id))
+    return or_(column > value, and_(column == value, key_column > student_id))
+
+def get_users_progress_page(
+    sort: str = "bound_time",
+    descending: bool = True,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    q: Optional[str] = None,
+    ip: Optional[str] = None,
+    has_code: Optional[bool] = None,
+    min_accuracy: Optional[float] = None,
+    max_accuracy: Optional[float] = None,
+    enable_ai: Optional[bool] = None,
+    enable_exam: Optional[bool] = None
+) -> tuple:
+    """分页获取学生的进度信息
+
+    累计统计直接读取 student_stats 汇总表, 按(排序列, 学号)做键集分页,
+    今天的认证码和问答统计只为当前页的学生查询。
+
+    Args:
+        sort: 排序列, 见 PROGRESS_SORT_COLUMNS
+        descending: 是否降序
+        cursor: 上一页返回的游标, 为空时从第一页开始
+        limit: 每页人数
+        q: 学号或姓名前缀
+        ip: 绑定IP前缀
+        has_code: 今天是否已获得认证码
+        min_accuracy, max_accuracy: 练习正确率范围(%)
+        enable_ai, enable_exam: AI和考试权限
+
+    Returns:
+        tuple: (进度列表, 下一页游标, 符合条件的总人数), 没有更多时游标为None,
+        总人数只在第一页计算, 之后的页为None
+
+    Raises:
+        ValueError: 排序列或游标无效
+    """
+    column = PROGRESS_SORT_COLUMNS.get(sort)
+    if column is None:
+        raise ValueError(f"不支持的排序列: {sort}")
+    # 排序列所在表的学号作为第二排序键, 与复合索引的列顺序一致
+    key_column = StudentStats.student_id if column.class_ is StudentStats else User.student_id
+    today_start = datetime.combine(datetime.now().date(), datetime.min.time())
 
-def toggle_chat_relevance(chat_id: int) -> bool:
-    """切换问题的相关性标记"""
+    with get_db() as db:
+        conditions = []
+        if q:
+            conditions.append(or_(_prefix_condition(User.student_id, q), _prefix_condition(User.name, q)))
+        if ip:
+            conditions.append(_prefix_condition(User.bound_ip, ip))
+        if has_code is not None:
+            code_today = db.query(CodeRecord.id).filter(
+                CodeRecord.student_id == User.student_id,
+                CodeRecord.get_time >= today_start
+            ).exists()
+            conditions.append(code_today if has_code else ~code_today)
+        if min_accuracy is not None:
+            conditions.append(StudentStats.accuracy >= min_accuracy)
+        if max_accuracy is not None:
+            conditions.append(StudentStats.accuracy <= max_accuracy)
+        if enable_ai is not None:
+            conditions.append(User.enable_ai == enable_ai)
+        if enable_exam is not None:
+            conditions.append(User.enable_exam == enable_exam)
+
+        base_query = db.query(User, StudentStats).join(
+            StudentStats, StudentStats.student_id == User.student_id
+        ).filter(*conditions)
+
+        total = None
+        if not cursor:
+            total = db.query(func.count()).select_from(
+                base_query.with_entities(User.student_id).subquery()
+            ).scalar()
+
+        query = base_query
+        if cursor:
+            value, student_id = decode_progress_cursor(cursor, sort)
+            query = query.filter(_after_cursor(column, key_column, value, student_id, descending))
+        if descending:
+            query = query.order_by(column.desc(), key_column.desc())
+        else:
+            query = query.order_by(column.asc(), key_column.asc())
+        rows = query.limit(limit + 1).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_user, last_stats = rows[-1]
+            last_value = getattr(last_stats if column.class_ is StudentStats else last_user, column.key)
+            next_cursor = encode_progress_cursor(last_value, last_user.student_id)
+
+        # 今天的认证码和问答统计只查询当前页的学生
+        student_ids = [user.student_id for user, _ in rows]
+        code_ids = set()
+        chat_stats = {}
+        if student_ids:
+            code_ids = {student_id for (student_id,) in db.query(CodeRecord.student_id).filter(
+                CodeRecord.student_id.in_(student_ids),
+                CodeRecord.get_time >= today_start
+            ).distinct()}
+            chat_stats = {row[0]: row[1:] for row in db.query(
+                AIChatRecord.student_id,
+                func.count(AIChatRecord.id),
+                func.sum(case((AIChatRecord.is_irrelevant == True, 1), else_=0)),
+                func.sum(case((AIChatRecord.is_irrelevant.is_(None), 1), else_=0))
+            ).filter(
+                AIChatRecord.student_id.in_(student_ids),
+                AIChatRecord.chat_time >= today_start
+            ).group_by(AIChatRecord.student_id)}
+
+        items = []
+        for user, stats in rows:
+            chat_count, irrelevant_chats, pending_chats = chat_stats.get(user.student_id, (0, 0, 0))
+            items.append({
+                "student_id": user.student_id,
+                "name": user.name,
+                "bound_ip": user.bound_ip,
+                "bound_time": user.bound_time,
+                "total_questions": stats.total_questions,
+                "correct_questions": stats.correct_questions,
+                "accuracy": stats.accuracy,
+                "exam_count": stats.exam_count,
+                "last_exam_score": round(stats.last_exam_score, 2) if stats.last_exam_score is not None else None,
+                "has_code": user.student_id in code_ids,
+                "chat_count": chat_count or 0,
+                "today_irrelevant_chats": irrelevant_chats or 0,
+                "today_pending_chats": pending_chats or 0,
+                "enable_ai": user.enable_ai,
+                "enable_exam": user.enable_exam
+            })
+        return items, next_cursor, total
+
+def set_chat_relevance(chat_id: int, is_irrelevant: bool) -> bool:
+    """设置问题的相关性标记
+
+    由教师指定目标值而不是取反: 待判断(NULL)的记录取反会被误标为无关。
+    """
     with get_db() as db:
         chat = db.query(AIChatRecord).filter(AIChatRecord.id == chat_id).first()
         if not chat:
             return False
-        
-        chat.is_irrelevant = not chat.is_irrelevant
+
+        if chat.is_irrelevant == is_irrelevant:
+            # 重复提交同一个值, 不重复通知仪表盘计数
+            return True
+        was_pending = chat.is_irrelevant is None
+        chat.is_irrelevant = is_irrelevant
+        chat.labeled_by = LABELED_BY_TEACHER
+        db.commit()
+        # 教师修正的标签是本地相关性分类器的训练数据
+        cluster.publish("relevance_labels")
+        # 已缓存的多轮对话窗口可能包含这条记录
+        cluster.publish("chat_context_reset", [chat.student_id])
+        admin_events.publish(
+            "chat_relevance",
+            student_id=chat.student_id,
+            chat_id=chat.id,
+            is_irrelevant=chat.is_irrelevant,
+            was_pending=was_pending,
+            today=chat.chat_time.date() == datetime.now().date()
+        )
         return True
 
+def get_chat_relevance_samples(limit: int = 5000) -> list:
+    """获取最近的问答相关性标签, 用于训练本地相关性分类器
+
+    只取教师和大模型给出的标签(TRAINING_LABEL_SOURCES), 不含本地分类器自己的判断。
+
+    Returns:
+        list: [(问题, 是否无关), ...]
+    """
+    with get_db() as db:
+        rows = db.query(AIChatRecord.question, AIChatRecord.is_irrelevant).filter(
+            AIChatRecord.question.isnot(None),
+            AIChatRecord.is_irrelevant.isnot(None),
+            or_(AIChatRecord.labeled_by.is_(None), AIChatRecord.labeled_by.in_(TRAINING_LABEL_SOURCES))
+        ).order_by(AIChatRecord.id.desc()).limit(limit).all()
+        return [(question, bool(is_irrelevant)) for question, is_irrelevant in rows]
+
+def get_pending_relevance_chats(limit: int = 100) -> list:
+    """获取待判断相关性的问答记录, 按保存顺序排列
+
+    Returns:
+        list: [(记录ID, 问题), ...]
+    """
+    with get_db() as db:
+        rows = db.query(AIChatRecord.id, AIChatRecord.question).filter(
+            AIChatRecord.is_irrelevant.is_(None)
+        ).order_by(AIChatRecord.id).limit(limit).all()
+        return [(chat_id, question or "") for chat_id, question in rows]
+
+def update_chat_relevance_bulk(labels: dict, sources: dict) -> int:
+    """用一条UPDATE写回批量判断的相关性结果
+
+    只更新仍处于待判断状态的记录, 期间已被教师手动标记的记录保持不变。
+
+    Args:
+        labels: {记录ID: 是否无关}
+        sources: {记录ID: 标签来源}, 取值为 LABELED_BY_LLM 等
+
+    Returns:
+        int: 更新的记录数
+    """
+    if not labels:
+        return 0
+    ids = list(labels)
+    today = datetime.now().date()
+    with get_db() as db:
+        rows = db.query(AIChatRecord.id, AIChatRecord.student_id, AIChatRecord.chat_time).filter(
+            AIChatRecord.id.in_(ids),
+            AIChatRecord.is_irrelevant.is_(None)
+        ).all()
+        if not rows:
+            return 0
+        mark_changed(db, *{row.student_id for row in rows})
+        db.query(AIChatRecord).filter(
+            AIChatRecord.id.in_([row.id for row in rows]),
+            AIChatRecord.is_irrelevant.is_(None)
+        ).update({
+            AIChatRecord.is_irrelevant: case(
+                {chat_id: is_irrelevant for chat_id, is_irrelevant in labels.items()},
+                value=AIChatRecord.id
+            ),
+            AIChatRecord.labeled_by: case(
+                {chat_id: sources[chat_id] for chat_id in labels},
+                value=AIChatRecord.id
+            )
+        }, synchronize_session=False)
+    # 大模型给出的标签同样是本地分类器的训练数据
+    if any(sources[row.id] in TRAINING_LABEL_SOURCES for row in rows):
+        cluster.publish("relevance_labels")
+    # 待判断的记录会被加载进多轮对话窗口, 判为无关后需要移出
+    if any(labels[row.id] for row in rows):
+        cluster.publish("chat_context_reset", sorted({row.student_id for row in rows if labels[row.id]}))
+    for row in rows:
+        admin_events.publish(
+            "chat_relevance",
+            student_id=row.student_id,
+            chat_id=row.id,
+            is_irrelevant=labels[row.id],
+            was_pending=True,
+            today=row.chat_time.date() == today
+        )
+    return len(rows)
+
+def get_codes_signature() -> Optional[tuple]:
+    """获取codes.txt的(修改时间, 大小), 用于判断剩余的认证码是否有变化"""
+    try:
+        st = os.stat(os.path.join(get_base_path(), 'data', 'codes.txt'))
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
 def get_code_from_file() -> str:
     """从codes.txt文件中获取一个认证码并删除该行"""
     code = None
@@ -237,6 +734,7 @@ def get_user_stats(student_id: str) -> dict:
                 )
                 db.add(code_record)
                 db.commit()
+                admin_events.publish("code", student_id=student_id)
         
         return {
             "totalQuestions": total,
@@ -244,16 +742,376 @@ def get_user_stats(student_id: str) -> dict:
             "todayCode": code_record.code if code_record else None
         }
 
-def save_answer_record(student_id: str, question_id: str, is_correct: bool):
-    """保存答题记录"""
+def week_start_of(day: date) -> date:
+    """获取日期所在周的周一"""
+    return day - timedelta(days=day.weekday())
+
+def rebuild_student_stats() -> None:
+    """根据答题记录和考试记录重新计算所有学生的统计汇总"""
+    week_start = week_start_of(date.today())
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM student_stats"))
+        # 连续练习天数: 日期减去其在学生练习日期中的序号, 同一段连续日期得到相同的值,
+        # 取最后一段连续日期的天数
+        connection.execute(text(
+            "INSERT INTO student_stats (student_id, total_questions, correct_questions, accuracy, "
+            "exam_count, last_exam_score, last_exam_time, best_exam_score, week_start, week_mastered, "
+            "streak_days, last_active_date) "
+            "SELECT u.student_id, COALESCE(r.total, 0), COALESCE(r.correct, 0), "
+            "CASE WHEN r.total > 0 THEN r.correct * 100.0 / r.total ELSE 0 END, "
+            "COALESCE(e.exam_count, 0), "
+            "(SELECT x.correct_count * 100.0 / x.question_count FROM exams x "
+            " WHERE x.student_id = u.student_id AND x.status = '已完成' AND x.question_count > 0 "
+            " ORDER BY x.submit_time DESC LIMIT 1), "
+            "e.last_exam_time, e.best_exam_score, :week_start, COALESCE(w.mastered, 0), "
+            "COALESCE(s.streak_days, 0), s.last_active_date "
+            "FROM users u "
+            "LEFT JOIN (SELECT student_id, COUNT(*) AS total, "
+            "           SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) AS correct "
+            "           FROM records GROUP BY student_id) r ON r.student_id = u.student_id "
+            "LEFT JOIN (SELECT student_id, COUNT(*) AS exam_count, MAX(submit_time) AS last_exam_time, "
+            "           MAX(CASE WHEN question_count > 0 THEN correct_count * 100.0 / question_count END) "
+            "           AS best_exam_score "
+            "           FROM exams WHERE status = '已完成' GROUP BY student_id) e ON e.student_id = u.student_id "
+            "LEFT JOIN (SELECT student_id, COUNT(DISTINCT question_id) AS mastered FROM records "
+            "           WHERE is_correct AND answer_time >= :week_start GROUP BY student_id) w "
+            "           ON w.student_id = u.student_id "
+            "LEFT JOIN (SELECT student_id, COUNT(*) AS streak_days, MAX(day) AS last_active_date "
+            "           FROM (SELECT student_id, day, "
+            "                 julianday(day) - ROW_NUMBER() OVER (PARTITION BY student_id ORDER BY day) AS island, "
+            "                 julianday(MAX(day) OVER (PARTITION BY student_id)) "
+            "                 - COUNT(*) OVER (PARTITION BY student_id) AS last_island "
+            "                 FROM (SELECT DISTINCT student_id, date(answer_time) AS day FROM records)) "
+            "           WHERE island = last_island GROUP BY student_id) s ON s.student_id = u.student_id"
+        ), {"week_start": week_start.isoformat()})
+    # 排行榜需要重新加载
+    cluster.publish("leaderboard")
+
+def rebuild_student_daily_stats() -> None:
+    """根据答题、考试和问答记录重新计算所有学生每天的活动计数"""
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM student_daily_stats"))
+        connection.execute(text(
+            "INSERT INTO student_daily_stats (student_id, day, answers, correct_answers, mastered, exams, chats) "
+            "SELECT student_id, day, SUM(answers), SUM(correct_answers), SUM(mastered), SUM(exams), SUM(chats) "
+            "FROM (SELECT student_id, date(answer_time) AS day, COUNT(*) AS answers, "
+            "      SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) AS correct_answers, "
+            "      COUNT(DISTINCT CASE WHEN is_correct THEN question_id END) AS mastered, "
+            "      0 AS exams, 0 AS chats "
+            "      FROM records GROUP BY student_id, day "
+            "      UNION ALL "
+            "      SELECT student_id, date(submit_time), 0, 0, 0, COUNT(*), 0 FROM exams "
+            "      WHERE status = '已完成' AND submit_time IS NOT NULL GROUP BY student_id, date(submit_time) "
+            "      UNION ALL "
+            "      SELECT student_id, date(chat_time), 0, 0, 0, 0, COUNT(*) FROM ai_chat_records "
+            "      GROUP BY student_id, date(chat_time)) "
+            "WHERE student_id IS NOT NULL AND day IS NOT NULL "
+            "GROUP BY student_id, day"
+        ))
+
+# 活动时间线每天的计数
+DAILY_COUNTERS = {
+    "answers": "练习题数",
+    "correct_answers": "答对题数",
+    "mastered": "掌握题数",
+    "exams": "完成考试",
+    "chats": "AI提问",
+}
+
+def get_student_timeline(student_id: str, start: date, end: date) -> List[dict]:
+    """获取学生在 [start, end] 内每天的活动计数, 只包含有活动的日期, 按日期升序排列"""
     with get_db() as db:
+        rows = db.query(StudentDailyStats).filter(
+            StudentDailyStats.student_id == student_id,
+            StudentDailyStats.day >= start,
+            StudentDailyStats.day <= end
+        ).order_by(StudentDailyStats.day).all()
+        return [{
+            "date": row.day.isoformat(),
+            **{counter: getattr(row, counter) for counter in DAILY_COUNTERS}
+        } for row in rows]
+
+# 学生至少有这么多练习记录时, 才把其正确率作为能力估计计入题目的区分度
+MIN_ABILITY_ANSWERS = 5
+
+def rebuild_question_stats() -> None:
+    """根据答题记录重新计算所有题目的作答统计
+
+    重建时学生的能力取其当前的练习正确率, 之后的增量更新取作答前的正确率。
+    """
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM question_stats"))
+        connection.execute(text("DELETE FROM question_answer_counts"))
+        connection.execute(text(
+            "INSERT INTO question_stats (question_id, attempts, correct_count, ability_count, ability_correct, "
+            "ability_sum, ability_square_sum, ability_correct_sum, last_answer_time) "
+            "SELECT question_id, COUNT(*), SUM(x), SUM(known), SUM(known * x), "
+            "SUM(known * y), SUM(known * y * y), SUM(known * x * y), MAX(answer_time) "
+            "FROM (SELECT r.question_id, r.answer_time, "
+            "      CASE WHEN r.is_correct THEN 1 ELSE 0 END AS x, "
+            "      CASE WHEN s.total_questions >= :min_answers THEN 1 ELSE 0 END AS known, "
+            "      COALESCE(s.correct_questions * 1.0 / NULLIF(s.total_questions, 0), 0) AS y "
+            "      FROM records r LEFT JOIN student_stats s ON s.student_id = r.student_id "
+            "      WHERE r.question_id IS NOT NULL) "
+            "GROUP BY question_id"
+        ), {"min_answers": MIN_ABILITY_ANSWERS})
+        connection.execute(text(
+            "INSERT INTO question_answer_counts (question_id, answer_mask, count) "
+            "SELECT question_id, answer_mask, COUNT(*) FROM records "
+            "WHERE question_id IS NOT NULL AND answer_mask IS NOT NULL "
+            "GROUP BY question_id, answer_mask"
+        ))
+
+def migrate_legacy_answer_masks() -> int:
+    """把以JSON文本保存在 student_answer 中的选择题和判断题答案转换为 answer_mask
+
+    只有旧版本写入的记录需要转换, 转换后 student_answer 置为NULL, 与新记录的格式相同。
+
+    Returns:
+        int: 转换的记录数
+    """
+    questions = {
+        question_id: question for question_id, question in get_question_map().items()
+        if option_labels(question)
+    }
+    if not questions:
+        return 0
+    migrated = 0
+    with engine.begin() as connection:
+        # 按(题目, 答案)分组, 不同的组合很少, 每组一条UPDATE
+        rows = connection.execute(text(
+            "SELECT DISTINCT question_id, student_answer FROM records "
+            "WHERE answer_mask IS NULL AND student_answer IS NOT NULL"
+        )).fetchall()
+        for question_id, student_answer in rows:
+            question = questions.get(question_id)
+            if question is None:
+                continue
+            try:
+                answer_mask = encode_answer_mask(question, json.loads(student_answer))
+            except (ValueError, TypeError):
+                continue
+            if answer_mask is None:
+                continue
+            migrated += connection.execute(text(
+                "UPDATE records SET answer_mask = :answer_mask, student_answer = NULL "
+                "WHERE question_id = :question_id AND student_answer = :student_answer AND answer_mask IS NULL"
+            ), {"answer_mask": answer_mask, "question_id": question_id, "student_answer": student_answer}).rowcount
+    if migrated:
+        print(f"已将 {migrated} 条选择题和判断题答题记录转换为位掩码")
+    return migrated
+
+def _add_answer_to_question_stats(db: Session, student_id: str, question_id: str, is_correct: bool,
+                                  answer_mask: Optional[int], answer_time: datetime) -> None:
+    """在同一事务中把一次答题计入题目的作答统计, 需在更新学生统计之前调用"""
+    ability = db.execute(text(
+        "SELECT correct_questions * 1.0 / total_questions FROM student_stats "
+        "WHERE student_id = :student_id AND total_questions >= :min_answers"
+    ), {"student_id": student_id, "min_answers": MIN_ABILITY_ANSWERS}).scalar()
+    x = 1 if is_correct else 0
+    known = 0 if ability is None else 1
+    y = ability or 0.0
+    db.execute(text(
+        "INSERT INTO question_stats (question_id, attempts, correct_count, ability_count, ability_correct, "
+        "ability_sum, ability_square_sum, ability_correct_sum, last_answer_time) "
+        "VALUES (:question_id, 1, :x, :known, :known * :x, :y, :y * :y, :x * :y, :answer_time) "
+        "ON CONFLICT(question_id) DO UPDATE SET "
+        "attempts = attempts + 1, correct_count = correct_count + :x, "
+        "ability_count = ability_count + :known, ability_correct = ability_correct + :known * :x, "
+        "ability_sum = ability_sum + :y, ability_square_sum = ability_square_sum + :y * :y, "
+        "ability_correct_sum = ability_correct_sum + :x * :y, last_answer_time = :answer_time"
+    ), {"question_id": question_id, "x": x, "known": known, "y": y, "answer_time": answer_time})
+    if answer_mask is not None:
+        db.execute(text(
+            "INSERT INTO question_answer_counts (question_id, answer_mask, count) "
+            "VALUES (:question_id, :answer_mask, 1) "
+            "ON CONFLICT(question_id, answer_mask) DO UPDATE SET count = count + 1"
+        ), {"question_id": question_id, "answer_mask": answer_mask})
+
+def _add_answer_to_stats(db: Session, student_id: str, is_correct: bool) -> None:
+    """在同一事务中把一次答题计入学生的统计汇总"""
+    correct = 1 if is_correct else 0
+    db.execute(text(
+        "INSERT INTO student_stats (student_id, total_questions, correct_questions, accuracy, exam_count, "
+        "week_mastered, streak_days) "
+        "VALUES (:student_id, 1, :correct, :correct * 100.0, 0, 0, 0) "
+        "ON CONFLICT(student_id) DO UPDATE SET "
+        "total_questions = total_questions + 1, "
+        "correct_questions = correct_questions + :correct, "
+        "accuracy = (correct_questions + :correct) * 100.0 / (total_questions + 1)"
+    ), {"student_id": student_id, "correct": correct})
+
+def _add_exam_to_stats(db: Session, exam: Exam) -> None:
+    """在同一事务中把一次完成的考试计入学生的统计汇总"""
+    score = exam.correct_count * 100.0 / exam.question_count if exam.question_count else None
+    db.execute(text(
+        "INSERT INTO student_stats (student_id, total_questions, correct_questions, accuracy, "
+        "exam_count, last_exam_score, last_exam_time, best_exam_score, week_mastered, streak_days) "
+        "VALUES (:student_id, 0, 0, 0, 1, :score, :submit_time, :score, 0, 0) "
+        "ON CONFLICT(student_id) DO UPDATE SET "
+        "exam_count = exam_count + 1, last_exam_score = :score, last_exam_time = :submit_time, "
+        "best_exam_score = MAX(COALESCE(best_exam_score, :score), COALESCE(:score, best_exam_score))"
+    ), {"student_id": exam.student_id, "score": score, "submit_time": exam.submit_time})
+    _add_to_daily_stats(db, exam.student_id, (exam.submit_time or datetime.now()).date(), exams=1)
+
+def _add_to_daily_stats(db: Session, student_id: str, day: date, answers: int = 0, correct_answers: int = 0,
+                        mastered: int = 0, exams: int = 0, chats: int = 0) -> None:
+    """在同一事务中增加学生当天的活动计数"""
+    db.execute(text(
+        "INSERT INTO student_daily_stats (student_id, day, answers, correct_answers, mastered, exams, chats) "
+        "VALUES (:student_id, :day, :answers, :correct_answers, :mastered, :exams, :chats) "
+        "ON CONFLICT(student_id, day) DO UPDATE SET "
+        "answers = answers + :answers, correct_answers = correct_answers + :correct_answers, "
+        "mastered = mastered + :mastered, exams = exams + :exams, chats = chats + :chats"
+    ), {
+        "student_id": student_id,
+        "day": day.isoformat(),
+        "answers": answers,
+        "correct_answers": correct_answers,
+        "mastered": mastered,
+        "exams": exams,
+        "chats": chats
+    })
+
+def _correct_before(db: Session, student_id: str, question_id: str, week_start: date,
+                    today: date) -> Tuple[bool, bool]:
+    """学生本周和今天是否已经答对过这道题, 需在添加本次答题记录之前调用"""
+    row = db.execute(text(
+        "SELECT COUNT(*), COALESCE(MAX(answer_time) >= :today, 0) FROM records "
+        "WHERE student_id = :student_id AND answer_time >= :week_start "
+        "AND question_id = :question_id AND is_correct"
+    ), {
+        "student_id": student_id,
+        "week_start": week_start.isoformat(),
+        "question_id": question_id,
+        "today": today.isoformat()
+    }).first()
+    return bool(row[0]), bool(row[1])
+
+def _add_answer_to_leaderboard(db: Session, student_id: str, today: date, mastered: int) -> None:
+    """在同一事务中更新排行榜指标(本周掌握题数、连续练习天数)
+
+    Args:
+        mastered: 本周第一次答对这道题时为1
+    """
+    week_start = week_start_of(today)
+    db.execute(text(
+        "INSERT INTO student_stats (student_id, total_questions, correct_questions, accuracy, exam_count, "
+        "week_start, week_mastered, streak_days, last_active_date) "
+        "VALUES (:student_id, 0, 0, 0, 0, :week_start, :mastered, 1, :today) "
+        "ON CONFLICT(student_id) DO UPDATE SET "
+        "week_mastered = CASE WHEN week_start = :week_start THEN week_mastered + :mastered ELSE :mastered END, "
+        "week_start = :week_start, "
+        "streak_days = CASE WHEN last_active_date = :today THEN streak_days "
+        "                   WHEN last_active_date = :yesterday THEN streak_days + 1 ELSE 1 END, "
+        "last_active_date = :today"
+    ), {
+        "student_id": student_id,
+        "week_start": week_start.isoformat(),
+        "mastered": mastered,
+        "today": today.isoformat(),
+        "yesterday": (today - timedelta(days=1)).isoformat()
+    })
+
+def save_answer_record(student_id: str, question_id: str, is_correct: bool,
+                       student_answer: Optional[str] = None, answer_mask: Optional[int] = None):
+    """保存答题记录, 同时更新学生和题目的统计
+
+    Args:
+        student_answer: 填空题和问答题规范化后的答案, 用于统计常见的错误答案
+        answer_mask: 选择题和判断题的答案位掩码, 见 questions.encode_answer_mask
+    """
+    answer_time = datetime.now()
+    today = answer_time.date()
+    with get_db() as db:
+        # 本周和今天第一次答对这道题时分别计入本周掌握题数和当天掌握题数
+        new_in_week = new_in_day = False
+        if is_correct:
+            correct_in_week, correct_in_day = _correct_before(db, student_id, question_id, week_start_of(today), today)
+            new_in_week, new_in_day = not correct_in_week, not correct_in_day
+        _add_answer_to_leaderboard(db, student_id, today, int(new_in_week))
+        _add_to_daily_stats(db, student_id, today, answers=1, correct_answers=int(bool(is_correct)),
+                            mastered=int(new_in_day))
         record = Record(
             student_id=student_id,
             question_id=question_id,
             is_correct=is_correct,
-            answer_time=datetime.now()
+            student_answer=student_answer,
+            answer_mask=answer_mask,
+            answer_time=answer_time
         )
         db.add(record)
+        _add_answer_to_question_stats(db, student_id, question_id, is_correct, answer_mask, answer_time)
+        _add_answer_to_stats(db, student_id, is_correct)
+    activity.record("answers")
+    if is_correct:
+        activity.record("correct_answers")
+    admin_events.publish("answer", student_id=student_id, question_id=question_id, is_correct=is_correct)
+
+def get_mistake_explanation(question_id: str, answer_key: str) -> Optional[str]:
+    """获取已生成的错题讲解, 没有时返回None"""
+    with get_db() as db:
+        row = db.query(MistakeExplanation.explanation).filter(
+            MistakeExplanation.question_id == question_id,
+            MistakeExplanation.answer_key == answer_key
+        ).first()
+        return row.explanation if row else None
+
+def save_mistake_explanation(question_id: str, answer_key: str, explanation: str, is_prefetched: bool = False) -> None:
+    """保存错题讲解, 其他进程已经保存过同一错误答案的讲解时保留已有的"""
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT OR IGNORE INTO mistake_explanations "
+            "(question_id, answer_key, explanation, is_prefetched, created_at) "
+            "VALUES (:question_id, :answer_key, :explanation, :is_prefetched, :created_at)"
+        ), {
+            "question_id": question_id,
+            "answer_key": answer_key,
+            "explanation": explanation,
+            "is_prefetched": is_prefetched,
+            "created_at": datetime.now()
+        })
+
+def get_frequent_mistakes(min_count: int, since: datetime, limit: int = 10) -> list:
+    """统计since之后出现至少min_count次、还没有讲解的错误答案, 按出现次数降序排列
+
+    选择题和判断题的答案以位掩码保存, 统计后还原为与讲解相同的规范化答案再去掉已有讲解的。
+
+    Returns:
+        list: [(题目ID, 规范化的错误答案, 出现次数), ...]
+    """
+    questions = get_question_map()
+    with get_db() as db:
+        count = func.count(Record.id)
+        rows = db.query(Record.question_id, Record.answer_mask, Record.student_answer, count).filter(
+            Record.answer_time >= since,
+            Record.is_correct == False,
+            or_(Record.answer_mask.isnot(None), Record.student_answer.isnot(None))
+        ).group_by(
+            Record.question_id, Record.answer_mask, Record.student_answer
+        ).all()
+
+        counts = {}
+        for question_id, answer_mask, answer_key, n in rows:
+            if answer_mask is not None:
+                question = questions.get(question_id)
+                if question is None:
+                    continue
+                answer_key = normalize_answer(question, decode_answer_mask(question, answer_mask))
+            key = (question_id, answer_key)
+            counts[key] = counts.get(key, 0) + n
+        # 同一个错误答案可能同时以位掩码和文本保存, 合并后再按次数筛选
+        counts = {key: n for key, n in counts.items() if n >= min_count}
+        if not counts:
+            return []
+
+        explained = {(question_id, answer_key) for question_id, answer_key in db.query(
+            MistakeExplanation.question_id, MistakeExplanation.answer_key
+        ).filter(MistakeExplanation.question_id.in_({question_id for question_id, _ in counts}))}
+        mistakes = [(question_id, answer_key, n) for (question_id, answer_key), n in counts.items()
+                    if (question_id, answer_key) not in explained]
+        mistakes.sort(key=lambda item: item[2], reverse=True)
+        return mistakes[:limit]
 
 @lru_cache(maxsize=100)
 def get_user_info(student_id: str) -> str:
@@ -274,6 +1132,74 @@ def get_user_full_info(student_id: str) -> dict:
             "enable_exam": user.enable_exam
         }
 
+# 学生会话版本缓存: student_id -> session_version, 按最近使用淘汰
+# 会话token中带有签发时的版本号, 版本不一致即视为已吊销
+MAX_SESSION_VERSIONS = 10000
+_session_versions: "OrderedDict[str, int]" = OrderedDict()
+_session_versions_lock = threading.Lock()
+
+def _remember_session_version(student_id: str, version: int) -> None:
+    """缓存学生的会话版本, 超出上限时淘汰最久未使用的"""
+    with _session_versions_lock:
+        _session_versions[student_id] = version
+        _session_versions.move_to_end(student_id)
+        while len(_session_versions) > MAX_SESSION_VERSIONS:
+            _session_versions.popitem(last=False)
+
+def get_session_version(student_id: str) -> int:
+    """获取学生当前的会话版本, 优先读取进程内缓存
+    
+    Returns:
+        int: 会话版本, 用户不存在时返回-1
+    """
+    with _session_versions_lock:
+        version = _session_versions.get(student_id)
+        if version is not None:
+            _session_versions.move_to_end(student_id)
+            return version
+    with get_db() as db:
+        row = db.query(User.session_version).filter(User.student_id == student_id).first()
+    version = (row[0] or 0) if row else -1
+    _remember_session_version(student_id, version)
+    return version
+
+def forget_session_version(student_id: str) -> None:
+    """丢弃缓存的会话版本, 下次校验时重新从数据库读取"""
+    with _session_versions_lock:
+        _session_versions.pop(student_id, None)
+
+def _on_user_changed(student_id) -> None:
+    """用户信息变化时清除本进程的用户缓存"""
+    get_user_info.cache_clear()
+    if student_id:
+        forget_session_version(student_id)
+
+def invalidate_user(student_id: str) -> None:
+    """通知所有进程用户信息已变化"""
+    cluster.publish("user", student_id)
+
+cluster.register_handler("user", _on_user_changed)
+
+def _revoke_sessions(user: User) -> None:
+    """递增用户的会话版本, 使已签发的会话token失效(需在事务内调用)"""
+    user.session_version = (user.session_version or 0) + 1
+
+def get_user_session_info(student_id: str) -> dict:
+    """获取签发会话token所需的用户信息"""
+    with get_db() as db:
+        user = db.query(User).filter(User.student_id == student_id).first()
+        if not user:
+            return None
+        _remember_session_version(student_id, user.session_version or 0)
+        return {
+            "name": user.name,
+            "bound_ip": user.bound_ip,
+            "bound_time": user.bound_time,
+            "enable_ai": user.enable_ai,
+            "enable_exam": user.enable_exam,
+            "session_version": user.session_version or 0
+        }
+
 async def update_user_ai_permission(student_id: str, enable: bool) -> bool:
     """更新用户的AI使用权限
     
@@ -289,8 +1215,10 @@ async def update_user_ai_permission(student_id: str, enable: bool) -> bool:
         if not user:
             return False
         user.enable_ai = enable
+        _revoke_sessions(user)
         db.commit()
-        get_user_info.cache_clear()  # 清除缓存
+        invalidate_user(student_id)  # 清除缓存
+        admin_events.publish("user", student_id=student_id, enable_ai=enable)
         return True
 
 def update_user_ai_permission_no_async(student_id: str, enable: bool) -> bool:
@@ -308,8 +1236,10 @@ def update_user_ai_permission_no_async(student_id: str, enable: bool) -> bool:
         if not user:
             return False
         user.enable_ai = enable
+        _revoke_sessions(user)
         db.commit()
-        get_user_info.cache_clear()  # 清除缓存
+        invalidate_user(student_id)  # 清除缓存
+        admin_events.publish("user", student_id=student_id, enable_ai=enable)
         return True
 
 def update_user_exam_permission_no_async(student_id: str, enable: bool) -> bool:
@@ -327,7 +1257,10 @@ def update_user_exam_permission_no_async(student_id: str, enable: bool) -> bool:
         if not user:
             return False
         user.enable_exam = enable
+        _revoke_sessions(user)
         db.commit()
+        invalidate_user(student_id)
+        admin_events.publish("user", student_id=student_id, enable_exam=enable)
         return True
 
 def create_or_update_user(student_id: str, name: str, ip: str, default_ai_permission: bool = True, default_exam_permission: bool = False) -> None:
@@ -344,10 +1277,15 @@ def create_or_update_user(student_id: str, name: str, ip: str, default_ai_permis
                 enable_exam=default_exam_permission
             )
             db.add(user)
-            get_user_info.cache_clear()
+            db.add(StudentStats(student_id=student_id))
         else:
+            if user.bound_ip != ip:
+                # 换绑IP后,旧IP上签发的会话不能继续使用
+                _revoke_sessions(user)
             user.bound_ip = ip
             user.bound_time = datetime.now()
+    invalidate_user(student_id)
+    admin_events.publish("user", student_id=student_id)
 
 def get_user_ip_info(student_id: str) -> tuple:
     """获取用户IP绑定信息"""
@@ -380,7 +1318,10 @@ def unbind_user_ip(student_id: str) -> bool:
             return False
         user.bound_ip = None
         user.bound_time = None
+        _revoke_sessions(user)
         db.commit()
+        invalidate_user(student_id)
+        admin_events.publish("user", student_id=student_id)
         return True
 
 def delete_user(student_id: str) -> bool:
@@ -397,14 +1338,19 @@ def delete_user(student_id: str) -> bool:
         if not user:
             return False
         # 删除用户相关的所有记录
+        mark_changed(db, student_id)
         db.query(Record).filter(Record.student_id == student_id).delete()
         db.query(CodeRecord).filter(CodeRecord.student_id == student_id).delete()
         db.query(ExamRecord).filter(ExamRecord.student_id == student_id).delete()
         db.query(Exam).filter(Exam.student_id == student_id).delete()
         db.query(AIChatRecord).filter(AIChatRecord.student_id == student_id).delete()
+        db.query(StudentStats).filter(StudentStats.student_id == student_id).delete()
+        db.query(StudentDailyStats).filter(StudentDailyStats.student_id == student_id).delete()
         # 最后删除用户
         db.delete(user)
         db.commit()
+        invalidate_user(student_id)
+        admin_events.publish("user_deleted", student_id=student_id)
         return True
 
 def get_excluded_questions(student_id: str) -> set:
@@ -537,6 +1483,8 @@ def create_exam(student_id: str, selected_questions: list) -> dict:
         db.add(exam)
         db.add_all(exam_records)
         db.commit()
+        activity.record("exam_starts")
+        admin_events.publish("exam_started", student_id=student_id, exam_id=exam.exam_id)
         
         return {
             "exam_id": exam.exam_id,
@@ -586,6 +1534,17 @@ def get_student_exams(student_id: str) -> list:
             "correct_count": exam.correct_count
         } for exam in exams]
 
+def _publish_exam_finished(exam: Exam) -> None:
+    """发布考试完成事件"""
+    activity.record("exam_submits")
+    score = exam.correct_count / exam.question_count * 100 if exam.question_count else 0
+    admin_events.publish(
+        "exam_finished",
+        student_id=exam.student_id,
+        exam_id=exam.exam_id,
+        score=round(score, 2)
+    )
+
 def submit_exam(exam_id: str) -> bool:
     """将未提交的考试标记为已提交
     
@@ -608,36 +1567,66 @@ def submit_exam(exam_id: str) -> bool:
             
         exam.status = "已完成"
         exam.submit_time = datetime.now()
+        _add_exam_to_stats(db, exam)
         db.commit()
+        _publish_exam_finished(exam)
         return True
 
+def _exam_question_details(db: Session, exam_ids: List[str]) -> Dict[str, List[dict]]:
+    """一次查询取出多场考试的答题记录, 按题库解析为题目详情
+
+    Returns:
+        Dict[str, List[dict]]: 考试ID到题目列表的映射, 题目按出题顺序排列, 包含答案、
+        学生答案和是否正确; 题库中已删除的题目不返回
+    """
+    result = {exam_id: [] for exam_id in exam_ids}
+    if not exam_ids:
+        return result
+    question_map = get_question_map()
+    records = db.query(
+        ExamRecord.exam_id, ExamRecord.question_id, ExamRecord.student_answer, ExamRecord.is_correct
+    ).filter(ExamRecord.exam_id.in_(exam_ids)).order_by(ExamRecord.id)
+    for exam_id, question_id, student_answer, is_correct in records:
+        question = question_map.get(question_id)
+        if question is None:
+            continue
+        question_dict = question.model_dump()
+        question_dict["student_answer"] = json.loads(student_answer) if student_answer else None
+        question_dict["is_correct"] = is_correct
+        result[exam_id].append(question_dict)
+    return result
+
+def get_admin_exam_details(exam_ids: List[str]) -> List[dict]:
+    """批量获取管理员查看的考试详情, 顺序与给定的考试ID相同, 不存在的考试不返回"""
+    with get_db() as db:
+        rows = db.query(Exam, User.name).join(User, User.student_id == Exam.student_id).filter(
+            Exam.exam_id.in_(exam_ids)
+        ).all()
+        exams = {exam.exam_id: (exam, name) for exam, name in rows}
+        questions = _exam_question_details(db, list(exams))
+        details = []
+        for exam_id in exam_ids:
+            if exam_id not in exams:
+                continue
+            exam, name = exams[exam_id]
+            details.append({
+                "exam_id": exam.exam_id,
+                "student_name": name,
+                "student_id": exam.student_id,
+                "start_time": exam.start_time,
+                "submit_time": exam.submit_time,
+                "status": exam.status,
+                "question_count": exam.question_count,
+                "correct_count": exam.correct_count,
+                "score": round(exam.correct_count / exam.question_count * 100, 1),
+                "questions": questions[exam_id]
+            })
+        return details
+
 def get_admin_exam_detail(exam_id: str) -> dict:
     """获取管理员查看的考试详情"""
-    with get_db() as db:
-        # 获取考试信息
-        exam = db.query(Exam).filter(Exam.exam_id == exam_id).first()
-        if not exam:
-            return None
-            
-        # 获取学生信息
-        student = db.query(User).filter(User.student_id == exam.student_id).first()
-        if not student:
-            return None
-            
-        # 获取考试详情
-        exam_detail = get_exam_detail(exam_id, exam.student_id)
-        if not exam_detail:
-            return None
-            
-        return {
-            "student_name": student.name,
-            "student_id": student.student_id,
-            "start_time": exam.start_time,
-            "question_count": exam.question_count,
-            "correct_count": exam.correct_count,
-            "score": round(exam.correct_count / exam.question_count * 100, 1),
-            "questions": exam_detail["questions"]
-        }
+    details = get_admin_exam_details([exam_id])
+    return details[0] if details else None
 
 def get_exam_detail(exam_id: str, student_id: str) -> dict:
     """获取考试的详细信息,包括题目内容、答案和解析"""
@@ -652,20 +1641,7 @@ def get_exam_detail(exam_id: str, student_id: str) -> dict:
         if not exam:
             return None
         
-        exam_records = db.query(ExamRecord).filter(
-            ExamRecord.exam_id == exam_id
-        ).all()
-
-        questions_info = []
-        for record in exam_records:
-            try:
-                question = get_question_by_id(record.question_id, include_answer=True)
-                question_dict = question.model_dump()
-                question_dict["student_answer"] = json.loads(record.student_answer) if record.student_answer else None
-                question_dict["is_correct"] = record.is_correct
-                questions_info.append(question_dict)
-            except:
-                continue
+        questions_info = _exam_question_details(db, [exam_id])[exam_id]
         
         return {
             "exam_id": exam.exam_id,
@@ -718,8 +1694,11 @@ def update_exam_answer(exam_id: str, student_id: str, question_id: str, is_corre
         if exam.current_progress == exam.question_count:
             exam.status = "已完成"
             exam.submit_time = datetime.now()
+            _add_exam_to_stats(db, exam)
         
         db.commit()
+        if exam.status == "已完成":
+            _publish_exam_finished(exam)
         
         return {
             "is_correct": is_correct,
@@ -0,0 +1,103 @@
+import asyncio
+import itertools
+import json
+import threading
+from datetime import datetime
+from typing import Optional
+
+def format_sse(data, event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    """按 text/event-stream 格式编码一个事件
+
+    Args:
+        data: 事件数据, 非字符串时编码为JSON
+        event: 事件类型, 为空时客户端按默认的message事件处理
+        event_id: 事件序号
+    """
+    if not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False, default=str)
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    for line in data.split("\n"):
+        lines.append(f"data: {line}")
+    return "\n".join(lines) + "\n\n"
+
+class EventBroker:
+    """进程内事件广播器
+
+    数据库写入路径调用 publish 发布增量事件, 每个订阅者(SSE连接)持有一个有界队列。
+    publish 可以在任意线程调用(例如GUI线程), 事件会被投递到订阅者所在的事件循环。
+    订阅者消费过慢导致队列溢出时, 丢弃积压事件并发送一个resync事件, 让客户端重新拉取全量数据。
+    """
+
+    def __init__(self, max_queue_size: int = 1000):
+        self.max_queue_size = max_queue_size
+        self._subscribers = {}  # queue -> loop
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        # 多进程部署时由cluster模块设置, 把事件转发给其他进程
+        self.relay = None
+
+    @property
+    def has_subscribers(self) -> bool:
+        """是否有订阅者"""
+        return bool(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        """订阅事件, 必须在事件循环中调用"""
+        queue = asyncio.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        """取消订阅"""
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def publish(self, event_type: str, **data):
+        """发布事件
+
+        Args:
+            event_type: 事件类型, 如 answer、chat、exam_finished
+            data: 事件数据
+        """
+        # 没有订阅者时直接返回, 写入路径几乎没有额外开销
+        if not self._subscribers and self.relay is None:
+            return
+        event = {
+            "id": next(self._seq),
+            "type": event_type,
+            "time": datetime.now().isoformat(),
+            **data
+        }
+        if self.relay is not None:
+            self.relay(event)
+        self.deliver(event)
+
+    def deliver(self, event: dict):
+        """把事件投递给本进程的订阅者"""
+        if not self._subscribers:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, event)
+            except RuntimeError:
+                # 事件循环已关闭
+                self.unsubscribe(queue)
+
+    def _put(self, queue: asyncio.Queue, event: dict):
+        """在订阅者的事件循环中投递事件"""
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"id": event["id"], "type": "resync", "time": event["time"]})
+
+# 管理后台实时事件
+admin_events = EventBroker()
@@ -0,0 +1,158 @@
+"""错题的AI讲解
+
+学生在练习中答错后可以请求AI讲解错因。讲解按 (题目ID, 规范化后的错误答案) 保存在
+mistake_explanations 表中, 同一种常见错误只生成一次, 之后的学生直接读取, 大模型的调用量
+随"不同错误答案的种数"而不是随学生人数增长。同一进程中同时请求同一讲解的学生共用一次生成。
+
+后台任务定期统计最近答错次数最多、还没有讲解的错误答案, 提前生成讲解,
+学生第一次请求时就能直接读取。
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import cluster
+from config import config
+from db import get_mistake_explanation, save_mistake_explanation, get_frequent_mistakes
+from llm_client import get_llm_client, llm_governor
+from models import Question, QuestionType
+from questions import load_questions
+
+MISTAKE_PROMPT = """你是一个Python编程老师, 正在给答错练习题的学生讲解错因。
+请根据题目、正确答案和学生的答案:
+1. 指出学生的答案错在哪里, 可能是哪个知识点理解有误
+2. 说明正确答案为什么正确, 必要时给出简短的代码示例
+3. 语气友好, 使用中文, 不超过300字
+"""
+
+# 预先生成讲解的排队通道, 与学生的请求轮转分配并发名额
+PREFETCH_LANE = "__explanation__"
+# 讲解的最大token数
+MAX_EXPLANATION_TOKENS = 600
+# 每次后台任务最多预先生成的讲解数
+MAX_PREFETCH_PER_RUN = 5
+# 统计最近多少天内的错误答案
+PREFETCH_WINDOW_DAYS = 30
+
+_TYPE_NAMES = {
+    QuestionType.SINGLE: "单选题",
+    QuestionType.MULTIPLE: "多选题",
+    QuestionType.JUDGE: "判断题",
+    QuestionType.BLANK: "填空题",
+    QuestionType.ESSAY: "问答题",
+}
+
+def _format_answer(question: Question, answer) -> str:
+    """把答案转换为讲解提示中的文字"""
+    if question.type == QuestionType.JUDGE and isinstance(answer, bool):
+        return "正确" if answer else "错误"
+    if isinstance(answer, list):
+        return "、".join(str(x) for x in answer) or "(未选择)"
+    return str(answer)
+
+def build_messages(question: Question, answer_key: str) -> list:
+    """组装讲解请求的消息列表"""
+    lines = [f"题型: {_TYPE_NAMES.get(question.type, question.type)}", f"题目: {question.content}"]
+    if question.options:
+        lines.append("选项:\n" + "\n".join(question.options))
+    lines.append(f"正确答案: {_format_answer(question, question.answer)}")
+    lines.append(f"学生的答案: {_format_answer(question, json.loads(answer_key))}")
+    if question.explanation:
+        lines.append(f"题目解析: {question.explanation}")
+    return [
+        {"role": "system", "content": MISTAKE_PROMPT},
+        {"role": "user", "content": "\n".join(lines)}
+    ]
+
+class MistakeExplainer:
+    """错题讲解的生成和缓存"""
+
+    def __init__(self):
+        # 正在生成的讲解, 同时请求同一讲解的学生等待同一个任务
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.stats = {"hits": 0, "generated": 0, "prefetched": 0, "failed": 0}
+
+    async def lookup(self, question_id: str, answer_key: str) -> Optional[str]:
+        """读取已生成的讲解, 没有时返回None"""
+        explanation = await asyncio.to_thread(get_mistake_explanation, question_id, answer_key)
+        if explanation is not None:
+            self.stats["hits"] += 1
+        return explanation
+
+    async def _generate(self, question: Question, answer_key: str, lane: str, is_prefetched: bool) -> str:
+        client = get_llm_client()
+        async with llm_governor.slot(lane):
+            response = await client.chat.completions.create(
+                model=config.deepseek_model,
+                messages=build_messages(question, answer_key),
+                temperature=0.3,
+                max_tokens=MAX_EXPLANATION_TOKENS,
+                stream=False
+            )
+        explanation = (response.choices[0].message.content or "").strip()
+        if not explanation:
+            raise ValueError("大模型返回了空的讲解")
+        await asyncio.to_thread(save_mistake_explanation, question.id, answer_key, explanation, is_prefetched)
+        self.stats["prefetched" if is_prefetched else "generated"] += 1
+        return explanation
+
+    async def generate(self, question: Question, answer_key: str, lane: str, is_prefetched: bool = False) -> str:
+        """生成并保存讲解, 同一讲解正在生成时等待已有的任务
+
+        Raises:
+            LLMBusyError: 排队人数已满或等待超时
+        """
+        key = (question.id, answer_key)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._generate(question, answer_key, lane, is_prefetched))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        try:
+            # 某个学生离开时不取消生成, 其他等待的学生和后续请求仍然需要这个结果
+            return await asyncio.shield(task)
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+
+    async def prefetch(self) -> int:
+        """为最近最常见、还没有讲解的错误答案预先生成讲解
+
+        Returns:
+            int: 生成的讲解数
+        """
+        since = datetime.now() - timedelta(days=PREFETCH_WINDOW_DAYS)
+        mistakes = await asyncio.to_thread(
+            get_frequent_mistakes, max(1, config.explanation_prefetch_min_count), since, MAX_PREFETCH_PER_RUN
+        )
+        if not mistakes:
+            return 0
+        questions = {q.id: q for q in load_questions()}
+        generated = 0
+        for question_id, answer_key, _ in mistakes:
+            question = questions.get(question_id)
+            if question is None:
+                continue
+            try:
+                await self.generate(question, answer_key, PREFETCH_LANE, is_prefetched=True)
+                generated += 1
+            except Exception as e:
+                print(f"预先生成错题讲解失败: {e}")
+        return generated
+
+    def get_stats(self) -> dict:
+        """获取统计信息"""
+        return {**self.stats, "generating": len(self._inflight)}
+
+mistake_explainer = MistakeExplainer()
+
+def start_prefetch_worker(loop: asyncio.AbstractEventLoop):
+    """启动预先生成错题讲解的后台任务, 调度方式同 relevance.start_relevance_worker"""
+    def job():
+        if not config.explanation_enabled:
+            return
+        future = asyncio.run_coroutine_threadsafe(mistake_explainer.prefetch(), loop)
+        future.result()
+
+    cluster.run_periodic("mistake_prefetch", job, config.explanation_prefetch_interval)
@@ -0,0 +1,510 @@
+"""数据导出
+
+把学生进度、考试成绩、考试答卷、练习记录和问答记录导出为CSV、XLSX或JSONL, 供管理后台接口和
+桌面管理工具使用。数据用 yield_per 按批从SQLite游标中读取, 边读边编码输出, 内存占用与导出的行数无关。
+只查询选中的列, 支持按日期范围和学号前缀(班级/年级)筛选。题目内容从内存中的题库按ID查找。
+
+XLSX 由一个最小的流式写入器生成: 工作表按行写入ZIP条目, 字符串使用内联字符串,
+不需要先在内存中构建整个工作簿, 也不依赖openpyxl。
+"""
+import csv
+import io
+import json
+import re
+import zipfile
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+from sqlalchemy import case, func, literal, true
+
+from db import get_db
+from models import User, Record, Exam, ExamRecord, AIChatRecord
+from questions import get_question_map, decode_answer_mask, normalize_answer
+
+# 每批从数据库游标读取的行数
+FETCH_SIZE = 1000
+# 累积到这么多字节后输出一次
+FLUSH_BYTES = 64 * 1024
+# XLSX单元格的最大字符数
+XLSX_MAX_CELL = 32767
+
+class ExportFilters:
+    """导出的筛选条件"""
+
+    __slots__ = ("start", "end", "cohort")
+
+    def __init__(self, start: Optional[date] = None, end: Optional[date] = None, cohort: Optional[str] = None):
+        """
+        Args:
+            start: 起始日期(包含)
+            end: 结束日期(包含)
+            cohort: 学号前缀, 如入学年份或班级编号
+        """
+        self.start = datetime.combine(start, datetime.min.time()) if start else None
+        self.end = datetime.combine(end, datetime.min.time()) + timedelta(days=1) if end else None
+        self.cohort = cohort.strip() if cohort and cohort.strip() else None
+
+    def apply(self, query, time_column, student_column):
+        """把日期范围和学号前缀条件加到查询上"""
+        if self.start is not None:
+            query = query.filter(time_column >= self.start)
+        if self.end is not None:
+            query = query.filter(time_column < self.end)
+        if self.cohort is not None:
+            query = query.filter(student_column.startswith(self.cohort, autoescape=True))
+        return query
+
+    def time_conditions(self, time_column) -> list:
+        """日期范围条件, 用于聚合子查询"""
+        conditions = []
+        if self.start is not None:
+            conditions.append(time_column >= self.start)
+        if self.end is not None:
+            conditions.append(time_column < self.end)
+        return conditions
+
+def _progress_query(db, filters: ExportFilters, keys: List[str]):
+    """学生进度: 每个学生一行, 统计日期范围内的练习、考试和问答"""
+    practice_sub = (
+        db.query(
+            Record.student_id,
+            func.count(Record.id).label("total_questions"),
+            func.sum(case((Record.is_correct == true(), 1), else_=0)).label("correct_questions")
+        )
+        .filter(*filters.time_conditions(Record.answer_time))
+        .group_by(Record.student_id)
+        .subquery()
+    )
+    exam_score = Exam.correct_count * 100.0 / Exam.question_count
+    exam_sub = (
+        db.query(
+            Exam.student_id,
+            func.count(Exam.exam_id).label("exam_count"),
+            func.max(exam_score).label("best_exam_score"),
+            func.avg(exam_score).label("avg_exam_score")
+        )
+        .filter(Exam.status == "已完成", Exam.question_count > 0, *filters.time_conditions(Exam.submit_time))
+        .group_by(Exam.student_id)
+        .subquery()
+    )
+    chat_sub = (
+        db.query(
+            AIChatRecord.student_id,
+            func.count(AIChatRecord.id).label("chat_count"),
+            func.sum(case((AIChatRecord.is_irrelevant == true(), 1), else_=0)).label("irrelevant_chats")
+        )
+        .filter(*filters.time_conditions(AIChatRecord.chat_time))
+        .group_by(AIChatRecord.student_id)
+        .subquery()
+    )
+    total = func.coalesce(practice_sub.c.total_questions, 0)
+    correct = func.coalesce(practice_sub.c.correct_questions, 0)
+    exprs = {
+        "student_id": User.student_id,
+        "name": User.name,
+        "bound_ip": User.bound_ip,
+        "bound_time": User.bound_time,
+        "total_questions": total,
+        "correct_questions": correct,
+        "accuracy": case((total > 0, correct * 100.0 / total), else_=0),
+        "exam_count": func.coalesce(exam_sub.c.exam_count, 0),
+        "best_exam_score": exam_sub.c.best_exam_score,
+        "avg_exam_score": exam_sub.c.avg_exam_score,
+        "chat_count": func.coalesce(chat_sub.c.chat_count, 0),
+        "irrelevant_chats": func.coalesce(chat_sub.c.irrelevant_chats, 0),
+        "enable_ai": User.enable_ai,
+        "enable_exam": User.enable_exam,
+    }
+    query = (
+        db.query(*[exprs[key].label(key) for key in keys])
+        .select_from(User)
+        .outerjoin(practice_sub, User.student_id == practice_sub.c.student_id)
+        .outerjoin(exam_sub, User.student_id == exam_sub.c.student_id)
+        .outerjoin(chat_sub, User.student_id == chat_sub.c.student_id)
+    )
+    if filters.cohort is not None:
+        query = query.filter(User.student_id.startswith(filters.cohort, autoescape=True))
+    return query.order_by(User.student_id)
+
+def _exams_query(db, filters: ExportFilters, keys: List[str]):
+    """考试成绩: 每场考试一行, 按开始时间筛选"""
+    exprs = {
+        "exam_id": Exam.exam_id,
+        "student_id": Exam.student_id,
+        "name": User.name,
+        "start_time": Exam.start_time,
+        "submit_time": Exam.submit_time,
+        "status": Exam.status,
+        "question_count": Exam.question_count,
+        "correct_count": Exam.correct_count,
+        "score": case((Exam.question_count > 0, Exam.correct_count * 100.0 / Exam.question_count)),
+    }
+    query = db.query(*[exprs[key].label(key) for key in keys]).select_from(Exam)
+    if "name" in keys:
+        query = query.outerjoin(User, User.student_id == Exam.student_id)
+    query = filters.apply(query, Exam.start_time, Exam.student_id)
+    return query.order_by(Exam.start_time)
+
+# 考试答卷中从题库读取的列
+_QUESTION_COLUMNS = ("question_type", "content", "options", "answer", "explanation")
+
+def _exam_details_query(db, filters: ExportFilters, keys: List[str]):
+    """考试答卷: 每场考试的每道题一行, 按考试开始时间筛选, 题目内容由 _convert_exam_detail 填入"""
+    exprs = {
+        "exam_id": Exam.exam_id,
+        "student_id": Exam.student_id,
+        "name": User.name,
+        "start_time": Exam.start_time,
+        "status": Exam.status,
+        "score": case((Exam.question_count > 0, Exam.correct_count * 100.0 / Exam.question_count)),
+        "position": func.row_number().over(partition_by=ExamRecord.exam_id, order_by=ExamRecord.id),
+        "question_id": ExamRecord.question_id,
+        "student_answer": ExamRecord.student_answer,
+        "is_correct": ExamRecord.is_correct,
+    }
+    columns = [(literal(None) if key in _QUESTION_COLUMNS else exprs[key]).label(key) for key in keys]
+    columns.append(ExamRecord.question_id.label("_question_id"))
+    query = db.query(*columns).select_from(ExamRecord).join(Exam, Exam.exam_id == ExamRecord.exam_id)
+    if "name" in keys:
+        query = query.outerjoin(User, User.student_id == Exam.student_id)
+    query = filters.apply(query, Exam.start_time, Exam.student_id)
+    return query.order_by(Exam.start_time, Exam.exam_id, ExamRecord.id)
+
+def _convert_exam_detail(values: list, row, keys: List[str]):
+    """填入题目内容, 把学生答案还原为原始的值"""
+    if "student_answer" in keys:
+        index = keys.index("student_answer")
+        values[index] = json.loads(values[index]) if values[index] else None
+    question = get_question_map().get(row._mapping["_question_id"])
+    if question is None:
+        return
+    for key in _QUESTION_COLUMNS:
+        if key in keys:
+            # 题型写出枚举值: str(QuestionType.SINGLE) 在 Python 3.11 起是 "QuestionType.SINGLE"
+            values[keys.index(key)] = question.type.value if key == "question_type" else getattr(question, key)
+
+def _records_query(db, filters: ExportFilters, keys: List[str]):
+    """练习记录: 每次答题一行"""
+    exprs = {
+        "id": Record.id,
+        "student_id": Record.student_id,
+        "name": User.name,
+        "question_id": Record.question_id,
+        "is_correct": Record.is_correct,
+        "student_answer": Record.student_answer,
+        "answer_time": Record.answer_time,
+    }
+    columns = [exprs[key].label(key) for key in keys]
+    if "student_answer" in keys:
+        # 选择题和判断题的答案以位掩码保存, 由 _convert_record 还原
+        columns += [Record.question_id.label("_question_id"), Record.answer_mask.label("_answer_mask")]
+    query = db.query(*columns).select_from(Record)
+    if "name" in keys:
+        query = query.outerjoin(User, User.student_id == Record.student_id)
+    query = filters.apply(query, Record.answer_time, Record.student_id)
+    return query.order_by(Record.id)
+
+def _convert_record(values: list, row, keys: List[str]):
+    """把答案位掩码还原为规范化的答案"""
+    if "student_answer" not in keys:
+        return
+    answer_mask = row._mapping["_answer_mask"]
+    if answer_mask is None:
+        return
+    question = get_question_map().get(row._mapping["_question_id"])
+    if question is not None:
+        values[keys.index("student_answer")] = normalize_answer(question, decode_answer_mask(question, answer_mask))
+
+def _chats_query(db, filters: ExportFilters, keys: List[str]):
+    """问答记录: 每次提问一行"""
+    exprs = {
+        "id": AIChatRecord.id,
+        "student_id": AIChatRecord.student_id,
+        "name": User.name,
+        "chat_time": AIChatRecord.chat_time,
+        "question": AIChatRecord.question,
+        "answer": AIChatRecord.answer,
+        "is_irrelevant": AIChatRecord.is_irrelevant,
+        "is_partial": AIChatRecord.is_partial,
+    }
+    query = db.query(*[exprs[key].label(key) for key in keys]).select_from(AIChatRecord)
+    if "name" in keys:
+        query = query.outerjoin(User, User.student_id == AIChatRecord.student_id)
+    query = filters.apply(query, AIChatRecord.chat_time, AIChatRecord.student_id)
+    return query.order_by(AIChatRecord.id)
+
+class Dataset:
+    """一种可导出的数据"""
+
+    __slots__ = ("name", "title", "columns", "build", "convert")
+
+    def __init__(self, name: str, title: str, columns: List[Tuple[str, str]], build: Callable,
+                 convert: Optional[Callable] = None):
+        self.name = name
+        self.title = title
+        self.columns = columns  # [(列名, 表头), ...]
+        self.build = build
+        self.convert = convert  # 可选, 在格式化之前修改一行的值
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return dict(self.columns)
+
+    def select_columns(self, keys: Optional[Sequence[str]] = None) -> List[str]:
+        """校验并返回要导出的列, 为空时导出全部列
+
+        Raises:
+            ValueError: 包含未知的列名
+        """
+        if not keys:
+            return [key for key, _ in self.columns]
+        headers = self.headers
+        unknown = [key for key in keys if key not in headers]
+        if unknown:
+            raise ValueError(f"未知的列: {', '.join(unknown)}")
+        return list(dict.fromkeys(keys))
+
+DATASETS: Dict[str, Dataset] = {dataset.name: dataset for dataset in [
+    Dataset("progress", "学生进度", [
+        ("student_id", "学号"), ("name", "姓名"), ("bound_ip", "IP地址"), ("bound_time", "绑定时间"),
+        ("total_questions", "练习题数"), ("correct_questions", "答对题数"), ("accuracy", "正确率(%)"),
+        ("exam_count", "考试次数"), ("best_exam_score", "最高分"), ("avg_exam_score", "平均分"),
+        ("chat_count", "提问次数"), ("irrelevant_chats", "无关提问"),
+        ("enable_ai", "AI权限"), ("enable_exam", "考试权限"),
+    ], _progress_query),
+    Dataset("exams", "考试成绩", [
+        ("exam_id", "考试ID"), ("student_id", "学号"), ("name", "姓名"), ("start_time", "开始时间"),
+        ("submit_time", "提交时间"), ("status", "状态"), ("question_count", "题目数"),
+        ("correct_count", "答对数"), ("score", "得分"),
+    ], _exams_query),
+    Dataset("exam_details", "考试答卷", [
+        ("exam_id", "考试ID"), ("student_id", "学号"), ("name", "姓名"), ("start_time", "开始时间"),
+        ("status", "状态"), ("score", "得分"), ("position", "题号"), ("question_id", "题目ID"),
+        ("question_type", "题型"), ("content", "题目"), ("options", "选项"), ("answer", "正确答案"),
+        ("student_answer", "学生答案"), ("is_correct", "是否正确"), ("explanation", "解析"),
+    ], _exam_details_query, _convert_exam_detail),
+    Dataset("records", "练习记录", [
+        ("id", "记录ID"), ("student_id", "学号"), ("name", "姓名"), ("question_id", "题目ID"),
+        ("is_correct", "是否正确"), ("student_answer", "学生答案"), ("answer_time", "答题时间"),
+    ], _records_query, _convert_record),
+    Dataset("chats", "问答记录", [
+        ("id", "记录ID"), ("student_id", "学号"), ("name", "姓名"), ("chat_time", "提问时间"),
+        ("question", "问题"), ("answer", "回答"), ("is_irrelevant", "无关问题"), ("is_partial", "回答不完整"),
+    ], _chats_query),
+]}
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "jsonl": ("application/x-ndjson; charset=utf-8", "jsonl"),
+}
+
+def _format_value(value):
+    """把数据库中的值转换为导出的单元格值"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "是" if value else "否"
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value)
+    return value
+
+def _json_value(value):
+    """把数据库中的值转换为JSONL中的值, 保留原始类型"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+def iter_rows(dataset: Dataset, filters: ExportFilters, keys: List[str],
+              format_value: Callable = _format_value) -> Iterator[list]:
+    """按批从数据库游标读取并产出格式化后的行"""
+    with get_db() as db:
+        query = dataset.build(db, filters, keys).yield_per(FETCH_SIZE)
+        for row in query:
+            values = list(row[:len(keys)])
+            if dataset.convert is not None:
+                dataset.convert(values, row, keys)
+            yield [format_value(value) for value in values]
+
+def iter_jsonl(keys: List[str], rows: Iterator[list]) -> Iterator[bytes]:
+    """编码为JSON Lines, 每行一个以列名为键的对象"""
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(keys, row)), ensure_ascii=False)
+        lines.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines.clear()
+            size = 0
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+# 以这些字符开头的单元格会被Excel等表格软件当作公式执行
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def _csv_safe(value):
+    """学生输入的文本(姓名、问答、答案等)以公式字符开头时加单引号前缀, 防止打开CSV时被当作公式执行"""
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def iter_csv(headers: List[str], rows: Iterator[list]) -> Iterator[bytes]:
+    """编码为CSV, 带UTF-8 BOM以便Excel正确识别中文"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow([_csv_safe(value) for value in row])
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+class _ChunkSink(io.RawIOBase):
+    """只能追加写入的输出, 写入的数据由生成器取走; zipfile在不可seek的输出上使用数据描述符"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+# XML 1.0 不允许的控制字符
+_ILLEGAL_XML_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+def _xlsx_cell(value) -> str:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c t="n"><v>{value}</v></c>'
+    text = _ILLEGAL_XML_RE.sub("", str(value))[:XLSX_MAX_CELL]
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+def _xlsx_row(values) -> str:
+    return "<row>" + "".join(_xlsx_cell(value) for value in values) + "</row>"
+
+def iter_xlsx(headers: List[str], rows: Iterator[list], sheet_name: str = "Sheet1") -> Iterator[bytes]:
+    """编码为只有一个工作表的XLSX, 工作表逐行压缩输出"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _ROOT_RELS)
+        archive.writestr("xl/workbook.xml", _WORKBOOK.format(name=escape(sheet_name, {'"': "&quot;"})))
+        archive.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            pending = [_SHEET_HEAD, _xlsx_row(headers)]
+            size = 0
+            for row in rows:
+                xml = _xlsx_row(row)
+                pending.append(xml)
+                size += len(xml)
+                if size >= FLUSH_BYTES:
+                    sheet.write("".join(pending).encode("utf-8"))
+                    pending.clear()
+                    size = 0
+                    data = sink.drain()
+                    if data:
+                        yield data
+            pending.append(_SHEET_TAIL)
+            sheet.write("".join(pending).encode("utf-8"))
+    yield sink.drain()
+
+def stream_export(dataset_name: str, fmt: str, filters: ExportFilters,
+                  columns: Optional[Sequence[str]] = None) -> Iterator[bytes]:
+    """生成导出文件的内容
+
+    参数在调用时校验, 返回的生成器在迭代时才开始查询数据库。
+
+    Raises:
+        KeyError: 未知的数据集
+        ValueError: 未知的格式或列名
+    """
+    dataset = DATASETS[dataset_name]
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    keys = dataset.select_columns(columns)
+    if fmt == "jsonl":
+        return iter_jsonl(keys, iter_rows(dataset, filters, keys, _json_value))
+    headers = [dataset.headers[key] for key in keys]
+    rows = iter_rows(dataset, filters, keys)
+    if fmt == "xlsx":
+        return iter_xlsx(headers, rows, dataset.title)
+    return iter_csv(headers, rows)
+
+def export_filename(dataset_name: str, fmt: str) -> str:
+    """导出文件的默认文件名"""
+    return f"{dataset_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{FORMATS[fmt][1]}"
+
+def write_export(path: str, dataset_name: str, fmt: str, filters: ExportFilters,
+                 columns: Optional[Sequence[str]] = None) -> int:
+    """把导出内容写入文件, 返回写入的字节数"""
+    written = 0
+    with open(path, "wb") as f:
+        for chunk in stream_export(dataset_name, fmt, filters, columns):
+            f.write(chunk)
+            written += len(chunk)
+    return written
@@ -9,9 +9,19 @@ class Config(QConfig):
     deepseekApiKey = ConfigItem("deepseek", "api_key", "")
     deepseekBaseUrl = ConfigItem("deepseek", "base_url", "https://api.deepseek.com")
     deepseekModel = ConfigItem("deepseek", "model", "deepseek-chat")
+    deepseekMaxConnections = ConfigItem("deepseek", "max_connections", 100)
+    deepseekMaxKeepaliveConnections = ConfigItem("deepseek", "max_keepalive_connections", 20)
+    deepseekKeepaliveExpiry = ConfigItem("deepseek", "keepalive_expiry", 30)
+    deepseekConnectTimeout = ConfigItem("deepseek", "connect_timeout", 10)
+    deepseekReadTimeout = ConfigItem("deepseek", "read_timeout", 60)
+    deepseekHttp2 = ConfigItem("deepseek", "http2", True, BoolValidator())
+    deepseekMaxConcurrent = ConfigItem("deepseek", "max_concurrent", 20)
+    deepseekMaxQueue = ConfigItem("deepseek", "max_queue", 200)
+    deepseekQueueTimeout = ConfigItem("deepseek", "queue_timeout", 60)
     
     # Token配置
     tokenExpireMinutes = ConfigItem("token", "expire_minutes", 300)
+    tokenSessionMinutes = ConfigItem("token", "session_minutes", 30)
     
     # 系统配置
     systemCycleDays = ConfigItem("system", "cycle_days", 3)
@@ -25,6 +35,30 @@ class Config(QConfig):
     # 速率限制配置
     rateLimitMaxRequests = ConfigItem("rate_limit", "max_requests", 5)
     rateLimitWindow = ConfigItem("rate_limit", "window", 120)
+    rateLimitBackend = ConfigItem("rate_limit", "backend", "memory")
+    
+    # 问题相关性判断配置
+    relevanceLocalEnabled = ConfigItem("relevance", "local_enabled", True, BoolValidator())
+    relevanceThreshold = ConfigItem("relevance", "threshold", 3.0)
+    relevanceBatchSize = ConfigItem("relevance", "batch_size", 20)
+    relevanceBatchInterval = ConfigItem("relevance", "batch_interval", 5)
+    
+    # 回答缓存配置
+    answerCacheEnabled = ConfigItem("answer_cache", "enabled", True, BoolValidator())
+    answerCacheTtl = ConfigItem("answer_cache", "ttl", 3600)
+    answerCacheMaxEntries = ConfigItem("answer_cache", "max_entries", 1000)
+    answerCacheSimilarity = ConfigItem("answer_cache", "similarity", 0.8)
+    
+    # 多轮对话配置
+    chatContextEnabled = ConfigItem("chat", "context_enabled", True, BoolValidator())
+    chatContextMaxTurns = ConfigItem("chat", "context_max_turns", 6)
+    chatContextTokenBudget = ConfigItem("chat", "context_token_budget", 2000)
+    chatContextWindowMinutes = ConfigItem("chat", "context_window_minutes", 60)
+    
+    # 错题AI讲解配置
+    explanationEnabled = ConfigItem("explanation", "enabled", True, BoolValidator())
+    explanationPrefetchMinCount = ConfigItem("explanation", "prefetch_min_count", 3)
+    explanationPrefetchInterval = ConfigItem("explanation", "prefetch_interval", 300)
     
     # 功能开关配置
     featureEnableRegistration = ConfigItem("features", "enable_registration", False, BoolValidator())
@@ -38,6 +72,9 @@ class Config(QConfig):
     databasePoolSize = ConfigItem("database", "pool_size", 50)
     databaseMaxOverflow = ConfigItem("database", "max_overflow", 100)
     databasePoolTimeout = ConfigItem("database", "pool_timeout", 60)
+    
+    # 服务部署配置
+    serverWorkers = ConfigItem("server", "workers", 1)
 
 # 创建全局配置实例
 cfg = Config()
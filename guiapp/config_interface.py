@@ -11,8 +11,15 @@ from qfluentwidgets import (SubtitleLabel, FluentIcon, InfoBar, BodyLabel,
                            SwitchButton, IndicatorPosition, ExpandLayout)
 from qfluentwidgets import qconfig
 from .config import cfg
+from config import config as server_config
 from threading import Thread
 
+
+def save_config():
+    """保存配置文件并通知服务端立即加载新配置"""
+    qconfig.save()
+    server_config.notify_changed()
+
 class CustomEditableComboBox(EditableComboBox):
     ReturnPressed = pyqtSignal()
     def __init__(self, parent=None):
@@ -36,7 +43,7 @@ class SpinSettingCard(SettingCard):
 
     def valueChanged(self, value):
         self.config.value = value
-        qconfig.save()
+        save_config()
 
     def setValue(self, value):
         self.spinbox.setValue(value)
@@ -54,7 +61,7 @@ class LineEditSettingCard(SettingCard):
 
     def textChanged(self, value):
         self.config.value = value
-        qconfig.save()
+        save_config()
 
     def setText(self, value):
         self.lineEdit.setText(value)
@@ -77,7 +84,7 @@ class ComboBoxSettingCard(SettingCard):
         if value not in currentItemList:
             return
         self.config.value = value
-        qconfig.save()
+        save_config()
         self.itemChanged.emit(value)
 
     def setCurrentText(self, value):
@@ -126,7 +133,7 @@ def showAdminSettingDialog(window):
         # 保存设置
         cfg.adminUsername.value = w.getUsername()
         cfg.adminPassword.value = w.getPassword()
-        qconfig.save()
+        save_config()
         
         # 显示成功提示
         InfoBar.success(
@@ -152,7 +159,7 @@ class ConfigInterface(ScrollArea):
 
     def changeDatabaseFile(self):
         cfg.databaseFile.value = self.databaseFileCard.comboBox.currentText()
-        qconfig.save()
+        save_config()
         self.restart_application()
         
     def setup_ui(self):
@@ -370,7 +377,7 @@ class ExamSettingCard(ExpandGroupSettingCard):
         
     def _updateConfig(self, config: ConfigItem, value):
         config.value = value
-        qconfig.save()
+        save_config()
 
 class AdvancedSettingCard(ExpandGroupSettingCard):
     def __init__(self, parent=None):
@@ -461,4 +468,4 @@ class AdvancedSettingCard(ExpandGroupSettingCard):
         
     def _updateConfig(self, config: ConfigItem, value):
         config.value = value
-        qconfig.save()
+        save_config()
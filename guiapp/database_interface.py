@@ -1,6 +1,6 @@
 from PyQt5.QtWidgets import (QFrame, QHBoxLayout, QVBoxLayout, QWidget, 
-                            QTableWidgetItem, QStackedWidget)
-from PyQt5.QtCore import pyqtSignal
+                            QTableWidgetItem, QStackedWidget, QFileDialog)
+from PyQt5.QtCore import pyqtSignal, QThread
 from PyQt5.QtGui import QColor
 from qfluentwidgets import (SubtitleLabel, FluentIcon, PrimaryPushButton, 
                            PushButton, InfoBar, BodyLabel, SearchLineEdit,
@@ -8,9 +8,10 @@ from qfluentwidgets import (SubtitleLabel, FluentIcon, PrimaryPushButton,
                            FlowLayout, MessageBoxBase, CardWidget,
                            SingleDirectionScrollArea, SwitchButton,
                            FastCalendarPicker, PrimarySplitPushButton,
-                           RoundMenu, Action, TabBar)
+                           RoundMenu, Action, TabBar, ComboBox, LineEdit, CheckBox)
 
 from db import get_admin_exam_detail, get_db, update_user_ai_permission_no_async, update_user_exam_permission_no_async, submit_exam
+from exports import DATASETS, FORMATS, ExportFilters, export_filename, write_export
 from models import Exam, User
 
 class StatisticsCard(CardWidget):
@@ -202,6 +203,113 @@ class ExamTable(TableWidget):
         layout.addStretch()
         self.setCellWidget(row, 6, btnWidget)
 
+class ExportThread(QThread):
+    """导出数据的后台线程, 大量记录导出时不阻塞界面"""
+    finished = pyqtSignal(int)  # 导出成功信号, 参数为文件字节数
+    error = pyqtSignal(str)     # 错误信号
+    
+    def __init__(self, path: str, dataset: str, fmt: str, filters: ExportFilters, columns: list):
+        super().__init__()
+        self.path = path
+        self.dataset = dataset
+        self.fmt = fmt
+        self.filters = filters
+        self.columns = columns
+        
+    def run(self):
+        try:
+            self.finished.emit(write_export(self.path, self.dataset, self.fmt, self.filters, self.columns))
+        except Exception as e:
+            self.error.emit(str(e))
+
+class ExportDialog(MessageBoxBase):
+    """导出选项对话框: 数据、格式、日期范围、学号前缀和导出的列"""
+    def __init__(self, dataset: str, parent=None):
+        super().__init__(parent)
+        self.titleLabel = SubtitleLabel('导出数据', self)
+        self.viewLayout.addWidget(self.titleLabel)
+        
+        # 数据和格式
+        self.datasetCombo = ComboBox(self)
+        for name, item in DATASETS.items():
+            self.datasetCombo.addItem(item.title, userData=name)
+        self.formatCombo = ComboBox(self)
+        self.formatCombo.addItems(list(FORMATS))
+        
+        optionWidget = QWidget(self)
+        optionLayout = QHBoxLayout(optionWidget)
+        optionLayout.setContentsMargins(0, 0, 0, 0)
+        optionLayout.addWidget(BodyLabel('数据:', self))
+        optionLayout.addWidget(self.datasetCombo)
+        optionLayout.addSpacing(10)
+        optionLayout.addWidget(BodyLabel('格式:', self))
+        optionLayout.addWidget(self.formatCombo)
+        optionLayout.addStretch(1)
+        self.viewLayout.addWidget(optionWidget)
+        
+        # 日期范围和学号前缀
+        self.startPicker = FastCalendarPicker(self)
+        self.startPicker.setDateFormat('yyyy-MM-dd')
+        self.endPicker = FastCalendarPicker(self)
+        self.endPicker.setDateFormat('yyyy-MM-dd')
+        self.cohortEdit = LineEdit(self)
+        self.cohortEdit.setPlaceholderText('学号前缀, 如 2023')
+        
+        filterWidget = QWidget(self)
+        filterLayout = QHBoxLayout(filterWidget)
+        filterLayout.setContentsMargins(0, 0, 0, 0)
+        filterLayout.addWidget(BodyLabel('从:', self))
+        filterLayout.addWidget(self.startPicker)
+        filterLayout.addWidget(BodyLabel('到:', self))
+        filterLayout.addWidget(self.endPicker)
+        filterLayout.addSpacing(10)
+        filterLayout.addWidget(self.cohortEdit)
+        self.viewLayout.addWidget(filterWidget)
+        
+        # 导出的列
+        self.columnWidget = QWidget(self)
+        self.columnLayout = FlowLayout(self.columnWidget)
+        self.columnChecks = []
+        self.viewLayout.addWidget(BodyLabel('导出的列:', self))
+        self.viewLayout.addWidget(self.columnWidget)
+        
+        self.datasetCombo.currentIndexChanged.connect(self.update_columns)
+        self.datasetCombo.setCurrentIndex(list(DATASETS).index(dataset))
+        self.update_columns()
+        
+        self.yesButton.setText('导出')
+        self.cancelButton.setText('取消')
+        self.widget.setMinimumWidth(560)
+        
+    @property
+    def dataset(self) -> str:
+        return self.datasetCombo.currentData()
+        
+    def update_columns(self):
+        """切换数据时重建列的复选框, 默认全选"""
+        for check in self.columnChecks:
+            self.columnLayout.removeWidget(check)
+            check.deleteLater()
+        self.columnChecks = []
+        for key, title in DATASETS[self.dataset].columns:
+            check = CheckBox(title, self.columnWidget)
+            check.setChecked(True)
+            check.setProperty('column', key)
+            self.columnLayout.addWidget(check)
+            self.columnChecks.append(check)
+            
+    def selected_columns(self) -> list:
+        return [check.property('column') for check in self.columnChecks if check.isChecked()]
+        
+    def filters(self) -> ExportFilters:
+        start = self.startPicker.date
+        end = self.endPicker.date
+        return ExportFilters(
+            start.toPyDate() if start and start.isValid() else None,
+            end.toPyDate() if end and end.isValid() else None,
+            self.cohortEdit.text()
+        )
+
 class DatabaseInterface(QFrame):
     def __init__(self, parent=None):
         super().__init__(parent=parent)
@@ -272,6 +380,11 @@ class DatabaseInterface(QFrame):
         menu.addAction(Action(FluentIcon.DELETE, '批量删除', triggered=self.batch_delete_users))
         self.batchUserButton.setFlyout(menu)
         
+        # 导出按钮
+        self.exportUserButton = PushButton('导出', self)
+        self.exportUserButton.setIcon(FluentIcon.DOWNLOAD)
+        self.exportUserButton.clicked.connect(lambda: self.show_export_dialog('progress'))
+        
         self.userFilterLayout.addWidget(BodyLabel('学号:', self))
         self.userFilterLayout.addWidget(self.userIdFilter)
         self.userFilterLayout.addSpacing(10)
@@ -282,6 +395,7 @@ class DatabaseInterface(QFrame):
         self.userFilterLayout.addSpacing(10)
         self.userFilterLayout.addWidget(self.refreshUserButton)
         self.userFilterLayout.addWidget(self.batchUserButton)
+        self.userFilterLayout.addWidget(self.exportUserButton)
         self.userFilterLayout.addStretch(1)
         
         self.userLayout.addWidget(self.userFilterWidget)
@@ -331,6 +445,12 @@ class DatabaseInterface(QFrame):
         self.submitAllButton.clicked.connect(self.submit_all_unsubmitted)
         self.filterLayout.addWidget(self.submitAllButton)
         
+        # 导出按钮
+        self.exportExamButton = PushButton('导出', self)
+        self.exportExamButton.setIcon(FluentIcon.DOWNLOAD)
+        self.exportExamButton.clicked.connect(lambda: self.show_export_dialog('exams'))
+        self.filterLayout.addWidget(self.exportExamButton)
+        
         self.filterLayout.addStretch(1)
         
         self.examLayout.addWidget(self.filterWidget)
@@ -349,6 +469,60 @@ class DatabaseInterface(QFrame):
         self.vBoxLayout.addWidget(self.tabBar)
         self.vBoxLayout.addWidget(self.stackedWidget)
     
+    def show_export_dialog(self, dataset: str):
+        """选择导出选项并在后台线程中导出"""
+        dialog = ExportDialog(dataset, self)
+        if not dialog.exec():
+            return
+        
+        columns = dialog.selected_columns()
+        if not columns:
+            InfoBar.warning(
+                title='提示',
+                content='请至少选择一列',
+                parent=self
+            ).show()
+            return
+        
+        fmt = dialog.formatCombo.currentText()
+        file_path, _ = QFileDialog.getSaveFileName(
+            self,
+            "导出数据",
+            export_filename(dialog.dataset, fmt),
+            f"{fmt.upper()} 文件 (*.{fmt})"
+        )
+        if not file_path:
+            return
+        if not file_path.endswith(f'.{fmt}'):
+            file_path += f'.{fmt}'
+        
+        self.exportUserButton.setEnabled(False)
+        self.exportExamButton.setEnabled(False)
+        self.exportThread = ExportThread(file_path, dialog.dataset, fmt, dialog.filters(), columns)
+        self.exportThread.finished.connect(lambda size: self.on_export_finished(file_path, size))
+        self.exportThread.error.connect(self.on_export_error)
+        self.exportThread.start()
+    
+    def on_export_finished(self, file_path: str, size: int):
+        """导出完成的处理"""
+        self.exportUserButton.setEnabled(True)
+        self.exportExamButton.setEnabled(True)
+        InfoBar.success(
+            title='成功',
+            content=f'已导出到 {file_path} ({size / 1024:.1f} KB)',
+            parent=self
+        ).show()
+    
+    def on_export_error(self, error: str):
+        """导出失败的处理"""
+        self.exportUserButton.setEnabled(True)
+        self.exportExamButton.setEnabled(True)
+        InfoBar.error(
+            title='错误',
+            content=f'导出失败: {error}',
+            parent=self
+        ).show()
+    
     def show_delete_confirm(self, student_id: str):
         """显示删除确认对话框"""
         dialog = MessageBoxBase(self)
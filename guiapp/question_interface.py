@@ -9,6 +9,7 @@ from qfluentwidgets import (SubtitleLabel, FluentIcon, PushButton, InfoBar, Body
                            CardWidget, FlowLayout)
 
 from questions import get_question_by_id, update_question, load_questions, delete_question
+from item_analysis import get_item_analysis, get_question_analysis, FLAG_LABELS
 import json
 
 class StatisticsCard(CardWidget):
@@ -31,6 +32,25 @@ question_types = {
     'blank': '填空题'
 }
 
+def format_analysis(analysis: dict) -> str:
+    """把题目分析结果格式化为表格中的一行文字"""
+    if not analysis or not analysis['attempts']:
+        return '暂无作答'
+    text = f"{analysis['attempts']}次 通过率{analysis['difficulty'] * 100:.0f}%"
+    if analysis['discrimination'] is not None:
+        text += f" 区分度{analysis['discrimination']:.2f}"
+    if analysis['flags']:
+        text = '⚠ ' + text
+    return text
+
+def format_answer(answer) -> str:
+    """把答案格式化为文字"""
+    if isinstance(answer, bool):
+        return '正确' if answer else '错误'
+    if isinstance(answer, list):
+        return ''.join(answer) or '(未选择)'
+    return str(answer)
+
 class QuestionDetailDialog(MessageBoxBase):
     def __init__(self, question_id: str, parent=None):
         super().__init__(parent)
@@ -56,6 +76,13 @@ class QuestionDetailDialog(MessageBoxBase):
         if hasattr(self.question, 'explanation') and self.question.explanation:
             self.explanationLabel = BodyLabel(f'解释：{self.question.explanation}')
         
+        # 作答分析
+        try:
+            analysis = get_question_analysis(self.question.id)
+        except Exception:
+            analysis = None
+        self.analysisLabel = BodyLabel(self.analysis_text(analysis))
+        
         # 添加到布局
         self.viewLayout.addWidget(self.titleLabel)
         self.viewLayout.addSpacing(16)
@@ -70,10 +97,30 @@ class QuestionDetailDialog(MessageBoxBase):
         self.viewLayout.addWidget(self.answerLabel)
         if hasattr(self, 'explanationLabel'):
             self.viewLayout.addWidget(self.explanationLabel)
+        self.viewLayout.addWidget(self.analysisLabel)
             
         # 设置对话框的最小宽度
         self.widget.setMinimumWidth(500)
 
+    def analysis_text(self, analysis: dict) -> str:
+        """作答分析的文字说明"""
+        if not analysis or not analysis['attempts']:
+            return '作答统计：暂无作答'
+        lines = [f'作答统计：{format_analysis(analysis).lstrip("⚠ ")}']
+        if analysis['last_answer_time']:
+            lines.append(f'最近作答：{analysis["last_answer_time"].strftime("%Y-%m-%d %H:%M")}')
+        if analysis['options']:
+            lines.append('选项分布：' + '  '.join(
+                f'{o["label"]}{"✓" if o["is_correct"] else ""} {o["count"]}' for o in analysis['options']
+            ))
+        if analysis['common_wrong_answers']:
+            lines.append('常见错误答案：' + '  '.join(
+                f'{format_answer(w["answer"])}({w["count"]}次)' for w in analysis['common_wrong_answers']
+            ))
+        if analysis['flags']:
+            lines.append('提示：' + '、'.join(FLAG_LABELS[flag] for flag in analysis['flags']))
+        return '\n'.join(lines)
+
 class OptionsEditDialog(MessageBoxBase):
     def __init__(self, options: list, parent=None):
         super().__init__(parent)
@@ -305,8 +352,8 @@ class QuestionTable(TableWidget):
     
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.setColumnCount(6)
-        self.setHorizontalHeaderLabels(['ID', '类型', '难度', '内容', '标签', '操作'])
+        self.setColumnCount(7)
+        self.setHorizontalHeaderLabels(['ID', '类型', '难度', '内容', '标签', '作答统计', '操作'])
 
         # 启用排序和多选
         self.setSortingEnabled(True)
@@ -318,10 +365,16 @@ class QuestionTable(TableWidget):
         self.setColumnWidth(2, 100)  # 难度列
         self.setColumnWidth(3, 300)  # 内容列
         self.setColumnWidth(4, 150)  # 标签列
-        self.setColumnWidth(5, 150)  # 操作列
+        self.setColumnWidth(5, 220)  # 作答统计列
+        self.setColumnWidth(6, 150)  # 操作列
         
-    def add_question(self, question: dict):
-        """添加题目到表格"""
+    def add_question(self, question: dict, analysis: dict = None):
+        """添加题目到表格
+        
+        Args:
+            question: 题目数据
+            analysis: 题目的作答分析, 见 item_analysis.get_item_analysis
+        """
         row = self.rowCount()
         self.insertRow(row)
         
@@ -331,12 +384,17 @@ class QuestionTable(TableWidget):
             question_types[question['type']],
             str(question['difficulty']),
             question['content'],
-            ', '.join(question.get('tags', []))
+            ', '.join(question.get('tags', [])),
+            format_analysis(analysis)
         ]):
             item = QTableWidgetItem(value)
             item.setFlags(item.flags() & ~Qt.ItemIsEditable)  # 设置为不可编辑
             self.setItem(row, col, item)
         
+        # 有提示的题目在作答统计列显示提示内容
+        if analysis and analysis['flags']:
+            self.item(row, 5).setToolTip('、'.join(FLAG_LABELS[flag] for flag in analysis['flags']))
+        
         # 添加操作按钮
         btnWidget = QWidget()
         layout = QHBoxLayout(btnWidget)
@@ -370,7 +428,7 @@ class QuestionTable(TableWidget):
         layout.addWidget(editBtn)
         layout.addWidget(viewBtn)
         
-        self.setCellWidget(row, 5, btnWidget)
+        self.setCellWidget(row, 6, btnWidget)
 
 class QuestionInterface(QFrame):
     def __init__(self, parent=None):
@@ -557,9 +615,16 @@ class QuestionInterface(QFrame):
             if current_tag in self.all_tags:
                 self.tagFilter.setCurrentText(current_tag)
             
+            # 题目的作答分析, 读取失败时不影响题目列表
+            try:
+                analysis = {item['question_id']: item for item in get_item_analysis()}
+            except Exception as e:
+                print(f"加载题目分析失败: {e}")
+                analysis = {}
+            
             # 添加题目到表格
             for q in questions:
-                self.table.add_question(q.model_dump())
+                self.table.add_question(q.model_dump(), analysis.get(q.id))
         except Exception as e:
             InfoBar.error(
                 title='错误',
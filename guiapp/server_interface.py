@@ -5,14 +5,64 @@ import requests
 import uvicorn
 import webbrowser
 from PyQt5.QtWidgets import (QFrame, QHBoxLayout, QVBoxLayout, QWidget)
-from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtCore import QThread, QTimer, QPointF, pyqtSignal
+from PyQt5.QtGui import QPainter, QPen, QColor, QPolygonF
 from qfluentwidgets import (FluentIcon, PrimaryPushButton, 
                            PushButton, PlainTextEdit, InfoBar,
-                           BodyLabel, CompactSpinBox)
+                           BodyLabel, CompactSpinBox, CardWidget)
 
 from app import app as fastapi_app
+from activity import activity, EVENTS
 from config import config
 
+# 走势图显示的分钟数和刷新间隔(毫秒)
+ACTIVITY_MINUTES = 60
+ACTIVITY_REFRESH_INTERVAL = 5000
+
+class Sparkline(QWidget):
+    """迷你走势图"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.values = []
+        self.setMinimumHeight(36)
+        
+    def setValues(self, values: list):
+        self.values = values
+        self.update()
+        
+    def paintEvent(self, event):
+        if len(self.values) < 2:
+            return
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(QPen(QColor(74, 144, 226), 1.5))
+        width, height = self.width(), self.height()
+        peak = max(max(self.values), 1)
+        step = width / (len(self.values) - 1)
+        painter.drawPolyline(QPolygonF([
+            QPointF(i * step, height - 2 - value / peak * (height - 4))
+            for i, value in enumerate(self.values)
+        ]))
+
+class SparklineCard(CardWidget):
+    """一种事件的计数和走势"""
+    def __init__(self, title: str, parent=None):
+        super().__init__(parent)
+        self.title = title
+        self.titleLabel = BodyLabel(title, self)
+        self.sparkline = Sparkline(self)
+        self.latestLabel = BodyLabel('', self)
+        
+        self.vBoxLayout = QVBoxLayout(self)
+        self.vBoxLayout.addWidget(self.titleLabel)
+        self.vBoxLayout.addWidget(self.sparkline)
+        self.vBoxLayout.addWidget(self.latestLabel)
+        
+    def setValues(self, values: list):
+        self.titleLabel.setText(f'{self.title}: {sum(values)}')
+        self.latestLabel.setText(f'最近1分钟: {values[-1] if values else 0}')
+        self.sparkline.setValues(values)
+
 class QueueHandler(logging.Handler):
     def __init__(self, signal):
         super().__init__()
@@ -160,7 +210,21 @@ class ServerInterface(QFrame):
         self.logViewer.setReadOnly(True)
         self.logViewer.setPlaceholderText("服务器日志输出...")
         
+        # 最近一小时的实时活动, 数据来自本进程内存中的每分钟计数
+        self.activityWidget = QWidget(self)
+        self.activityLayout = QHBoxLayout(self.activityWidget)
+        self.activityLayout.setContentsMargins(0, 0, 0, 0)
+        self.activityCards = {}
+        for event, label in EVENTS.items():
+            card = SparklineCard(label, self.activityWidget)
+            self.activityLayout.addWidget(card)
+            self.activityCards[event] = card
+        self.activityTimer = QTimer(self)
+        self.activityTimer.timeout.connect(self.refresh_activity)
+        self.activityTimer.start(ACTIVITY_REFRESH_INTERVAL)
+        
         self.vBoxLayout.addWidget(self.buttonWidget)
+        self.vBoxLayout.addWidget(self.activityWidget)
         self.vBoxLayout.addWidget(self.logViewer)
         
         # 连接信号
@@ -227,6 +291,14 @@ class ServerInterface(QFrame):
             parent=self
         ).show()
         
+    def refresh_activity(self):
+        """刷新实时活动走势"""
+        if not self.isVisible():
+            return
+        data = activity.live(ACTIVITY_MINUTES)
+        for event, card in self.activityCards.items():
+            card.setValues(data['series'][event])
+        
     def append_log(self, text: str):
         self.logViewer.appendPlainText(text)
         if "Application startup complete" in text:
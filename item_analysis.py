@@ -0,0 +1,143 @@
+"""题目分析
+
+为每道题提供练习作答的统计指标, 帮助教师发现过难、过易或答案设置有误的题目:
+
+- 通过率(难度): 答对次数 / 作答次数;
+- 区分度: 是否答对与学生能力(作答前的练习正确率)的点二列相关系数。接近0的题目不能区分
+  掌握程度不同的学生, 为负时常常是答案设置错误;
+- 选项分布: 选择题和判断题每个选项被选择的次数, 以及最常见的错误答案;
+- 最近一次作答时间。
+
+这些指标由 question_stats 和 question_answer_counts 表中增量维护的计数直接算出, 不需要扫描答题记录。
+填空题和问答题的常见错误答案只在查看单道题时按题目索引查询。
+"""
+import json
+import math
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+
+from db import get_db
+from models import Question, QuestionType, Record, QuestionStats, QuestionAnswerCount
+from questions import load_questions, get_question_map, option_labels, encode_answer_mask, decode_answer_mask
+
+# 作答次数达到后才给出提示
+MIN_ATTEMPTS = 20
+# 计入区分度的作答次数达到后才计算区分度
+MIN_DISCRIMINATION_COUNT = 20
+# 通过率低于该值视为过难, 高于EASY_THRESHOLD视为过易
+HARD_THRESHOLD = 0.2
+EASY_THRESHOLD = 0.95
+# 区分度低于该值视为区分度低
+LOW_DISCRIMINATION = 0.1
+# 返回的常见错误答案数
+TOP_WRONG_ANSWERS = 5
+
+FLAG_LABELS = {
+    "too_hard": "过难",
+    "too_easy": "过易",
+    "negative_discrimination": "区分度为负",
+    "low_discrimination": "区分度低",
+    "distractor": "错误答案比正确答案更常见",
+}
+
+def point_biserial(n: int, sum_x: float, sum_y: float, sum_yy: float, sum_xy: float) -> Optional[float]:
+    """由累计量计算点二列相关系数, 样本不足或没有变化时返回None"""
+    if n < MIN_DISCRIMINATION_COUNT:
+        return None
+    var_x = n * sum_x - sum_x * sum_x  # x只取0和1, Σx² = Σx
+    var_y = n * sum_yy - sum_y * sum_y
+    if var_x <= 0 or var_y <= 1e-9 * n * n:
+        return None
+    return (n * sum_xy - sum_x * sum_y) / math.sqrt(var_x * var_y)
+
+def _analyze(question: Question, stats: Optional[QuestionStats], counts: Dict[int, int]) -> dict:
+    """计算一道题的分析结果"""
+    attempts = stats.attempts if stats else 0
+    correct_count = stats.correct_count if stats else 0
+    difficulty = correct_count / attempts if attempts else None
+    discrimination = None
+    if stats:
+        discrimination = point_biserial(
+            stats.ability_count, stats.ability_correct, stats.ability_sum,
+            stats.ability_square_sum, stats.ability_correct_sum
+        )
+
+    correct_mask = encode_answer_mask(question, question.answer)
+    options = [{
+        "label": label,
+        "count": sum(n for mask, n in counts.items() if mask >> i & 1),
+        "is_correct": correct_mask is not None and bool(correct_mask >> i & 1)
+    } for i, label in enumerate(option_labels(question))]
+    wrong = sorted(((mask, n) for mask, n in counts.items() if mask != correct_mask), key=lambda item: -item[1])
+    common_wrong_answers = [
+        {"answer": decode_answer_mask(question, mask), "count": n} for mask, n in wrong[:TOP_WRONG_ANSWERS]
+    ]
+
+    flags = []
+    if attempts >= MIN_ATTEMPTS:
+        if difficulty < HARD_THRESHOLD:
+            flags.append("too_hard")
+        elif difficulty > EASY_THRESHOLD:
+            flags.append("too_easy")
+        if wrong and wrong[0][1] > counts.get(correct_mask, 0):
+            flags.append("distractor")
+    if discrimination is not None:
+        if discrimination < 0:
+            flags.append("negative_discrimination")
+        elif discrimination < LOW_DISCRIMINATION:
+            flags.append("low_discrimination")
+
+    return {
+        "question_id": question.id,
+        "type": question.type,
+        "content": question.content,
+        "enabled": question.enabled,
+        "attempts": attempts,
+        "correct_count": correct_count,
+        "difficulty": round(difficulty, 4) if difficulty is not None else None,
+        "discrimination": round(discrimination, 4) if discrimination is not None else None,
+        "last_answer_time": stats.last_answer_time if stats else None,
+        "options": options,
+        "common_wrong_answers": common_wrong_answers,
+        "flags": flags,
+    }
+
+def get_item_analysis() -> List[dict]:
+    """获取题库中所有题目的分析结果, 顺序与题库相同"""
+    questions = load_questions()
+    with get_db() as db:
+        stats = {row.question_id: row for row in db.query(QuestionStats)}
+        counts: Dict[str, Dict[int, int]] = {}
+        for question_id, answer_mask, count in db.query(
+            QuestionAnswerCount.question_id, QuestionAnswerCount.answer_mask, QuestionAnswerCount.count
+        ):
+            counts.setdefault(question_id, {})[answer_mask] = count
+        return [_analyze(q, stats.get(q.id), counts.get(q.id, {})) for q in questions]
+
+def get_question_analysis(question_id: str) -> Optional[dict]:
+    """获取一道题的分析结果, 题目不存在时返回None
+
+    填空题和问答题另外统计最常见的错误答案。
+    """
+    question = get_question_map().get(question_id)
+    if question is None:
+        return None
+    with get_db() as db:
+        stats = db.query(QuestionStats).filter(QuestionStats.question_id == question_id).first()
+        counts = dict(db.query(QuestionAnswerCount.answer_mask, QuestionAnswerCount.count).filter(
+            QuestionAnswerCount.question_id == question_id
+        ).all())
+        result = _analyze(question, stats, counts)
+
+        if question.type in (QuestionType.BLANK, QuestionType.ESSAY):
+            count = func.count(Record.id)
+            rows = db.query(Record.student_answer, count).filter(
+                Record.question_id == question_id,
+                Record.is_correct == False,
+                Record.student_answer.isnot(None)
+            ).group_by(Record.student_answer).order_by(count.desc()).limit(TOP_WRONG_ANSWERS).all()
+            result["common_wrong_answers"] = [
+                {"answer": json.loads(answer), "count": n} for answer, n in rows
+            ]
+        return result
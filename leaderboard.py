@@ -0,0 +1,291 @@
+"""排行榜
+
+提供三种排名: 本周掌握题数(本周答对过的不同题目数)、考试最高分和连续练习天数。
+
+每个学生的指标保存在 student_stats 表中, 在写入答题记录和完成考试的同一事务中更新(见 db.py),
+重启或崩溃后不会丢失。每个进程在内存中为每种指标维护一个按分数排序的可索引跳表,
+前K名和某个学生的名次都是 O(log n) 的查询:
+
+- 首次查询或跨天时从 student_stats 加载所有学生, 本周掌握题数和连续天数在跨周、断签后归零;
+- 数据写入后经失效总线的 data_version 消息把学生标记为待更新(不访问数据库),
+  下次查询前用一次主键查询刷新这些学生的分数;
+- 重建统计汇总后收到 leaderboard 消息, 下次查询时重新加载。
+"""
+import random
+import threading
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional, Set
+
+import cluster
+from db import get_db, week_start_of
+from models import StudentStats, User
+
+METRICS = {
+    "mastered_week": "本周掌握题数",
+    "exam_best": "考试最高分",
+    "streak": "连续练习天数",
+}
+
+# 跳表的最大层数, 支持约百万名学生
+MAX_LEVEL = 20
+# 每次刷新最多查询的学生数, 避免超过SQLite的参数上限
+REFRESH_BATCH = 500
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next: List[Optional["_Node"]] = [None] * level
+        # width[i] 为第i层指针跨过的元素数
+        self.width = [1] * level
+
+class IndexableSkipList:
+    """可按位置访问的跳表, 元素按键升序排列
+
+    插入、删除、统计小于某个键的元素数和定位第i个元素都是期望 O(log n)。
+    """
+
+    def __init__(self):
+        self._head = _Node(None, MAX_LEVEL)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _random_level() -> int:
+        level = 1
+        while level < MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        return level
+
+    def _predecessors(self, key):
+        """每一层中最后一个小于key的节点及其位置(头节点位置为0)"""
+        chain = [None] * MAX_LEVEL
+        positions = [0] * MAX_LEVEL
+        node = self._head
+        position = 0
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            positions[level] = position
+        return chain, positions
+
+    def insert(self, key):
+        """插入一个键, 键不能重复"""
+        chain, positions = self._predecessors(key)
+        node = _Node(key, self._random_level())
+        position = positions[0] + 1
+        for level in range(MAX_LEVEL):
+            previous = chain[level]
+            if level < len(node.next):
+                # 新节点把前驱的指针分成两段
+                node.next[level] = previous.next[level]
+                previous.next[level] = node
+                node.width[level] = previous.width[level] - (position - positions[level]) + 1
+                previous.width[level] = position - positions[level]
+            else:
+                previous.width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        """删除一个键
+
+        Raises:
+            KeyError: 键不存在
+        """
+        chain, _ = self._predecessors(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for level in range(MAX_LEVEL):
+            previous = chain[level]
+            if level < len(node.next):
+                previous.width[level] += node.width[level] - 1
+                previous.next[level] = node.next[level]
+            else:
+                previous.width[level] -= 1
+        self._size -= 1
+
+    def count_less(self, key) -> int:
+        """小于key的元素数"""
+        _, positions = self._predecessors(key)
+        return positions[0]
+
+    def iter_from(self, index: int) -> Iterator:
+        """从第index个元素(从0开始)起按顺序迭代"""
+        if index >= self._size:
+            return
+        node = self._head
+        position = 0
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and position + node.width[level] <= index + 1:
+                position += node.width[level]
+                node = node.next[level]
+        while node is not None:
+            yield node.key
+            node = node.next[0]
+
+class Leaderboard:
+    """一种指标的排名, 只有分数大于0的学生参与排名, 分数相同的名次相同"""
+
+    def __init__(self):
+        self._scores: Dict[str, float] = {}
+        self._list = IndexableSkipList()
+
+    def __len__(self) -> int:
+        return len(self._list)
+
+    def set(self, student_id: str, score: Optional[float]):
+        """设置学生的分数, 为0或None时移出排名"""
+        old = self._scores.pop(student_id, None)
+        if old is not None:
+            self._list.remove((-old, student_id))
+        if score:
+            self._scores[student_id] = score
+            self._list.insert((-score, student_id))
+
+    def score(self, student_id: str) -> Optional[float]:
+        return self._scores.get(student_id)
+
+    def rank(self, student_id: str) -> Optional[int]:
+        """学生的名次(从1开始), 未参与排名时返回None"""
+        score = self._scores.get(student_id)
+        if score is None:
+            return None
+        # 空字符串小于任何学号, 得到分数更高的学生数
+        return self._list.count_less((-score, "")) + 1
+
+    def top(self, k: int) -> List[tuple]:
+        """前k名, 返回 [(名次, 学号, 分数), ...]"""
+        result = []
+        rank = 0
+        previous = None
+        for i, (negative_score, student_id) in enumerate(self._list.iter_from(0)):
+            if i >= k:
+                break
+            if negative_score != previous:
+                rank = i + 1
+                previous = negative_score
+            result.append((rank, student_id, -negative_score))
+        return result
+
+def _metric_scores(row, today: date) -> Dict[str, float]:
+    """由 student_stats 的一行计算当前有效的各项指标"""
+    mastered = row.week_mastered if row.week_start == week_start_of(today) else 0
+    active = row.last_active_date is not None and row.last_active_date >= today - timedelta(days=1)
+    return {
+        "mastered_week": mastered,
+        "exam_best": round(row.best_exam_score, 1) if row.best_exam_score else 0,
+        "streak": row.streak_days if active else 0,
+    }
+
+class LeaderboardService:
+    """各项指标的排行榜"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._boards = {metric: Leaderboard() for metric in METRICS}
+        self._names: Dict[str, str] = {}
+        self._loaded_day: Optional[date] = None
+        self._dirty: Set[str] = set()
+        self.stats = {"reloads": 0, "refreshed": 0}
+
+    def mark_dirty(self, student_ids):
+        """学生的数据有变化, 下次查询前刷新"""
+        with self._lock:
+            self._dirty.update(student_id for student_id in student_ids if student_id)
+
+    def reset(self):
+        """下次查询时重新加载所有学生"""
+        with self._lock:
+            self._loaded_day = None
+
+    def _query(self, db, student_ids: Optional[List[str]] = None):
+        query = db.query(
+            StudentStats.student_id, User.name, StudentStats.best_exam_score, StudentStats.week_start,
+            StudentStats.week_mastered, StudentStats.streak_days, StudentStats.last_active_date
+        ).join(User, User.student_id == StudentStats.student_id)
+        if student_ids is not None:
+            query = query.filter(StudentStats.student_id.in_(student_ids))
+        return query
+
+    def _apply(self, student_id: str, scores: Optional[Dict[str, float]]):
+        for metric, board in self._boards.items():
+            board.set(student_id, scores[metric] if scores else None)
+
+    def _sync(self):
+        """加载或刷新待更新的学生, 需持有锁"""
+        today = date.today()
+        if self._loaded_day != today:
+            # 首次加载、跨天(连续天数和本周题数可能失效)或重建了统计汇总
+            self._boards = {metric: Leaderboard() for metric in METRICS}
+            self._names = {}
+            self._dirty.clear()
+            with get_db() as db:
+                for row in self._query(db):
+                    self._names[row.student_id] = row.name
+                    self._apply(row.student_id, _metric_scores(row, today))
+            self._loaded_day = today
+            self.stats["reloads"] += 1
+            return
+        if not self._dirty:
+            return
+        dirty = list(self._dirty)
+        self._dirty.clear()
+        with get_db() as db:
+            for i in range(0, len(dirty), REFRESH_BATCH):
+                batch = dirty[i:i + REFRESH_BATCH]
+                found = set()
+                for row in self._query(db, batch):
+                    found.add(row.student_id)
+                    self._names[row.student_id] = row.name
+                    self._apply(row.student_id, _metric_scores(row, today))
+                # 已删除的学生
+                for student_id in set(batch) - found:
+                    self._names.pop(student_id, None)
+                    self._apply(student_id, None)
+        self.stats["refreshed"] += len(dirty)
+
+    def top(self, metric: str, k: int) -> List[dict]:
+        """获取前k名
+
+        Raises:
+            KeyError: 未知的指标
+        """
+        with self._lock:
+            self._sync()
+            return [{
+                "rank": rank,
+                "student_id": student_id,
+                "name": self._names.get(student_id, ""),
+                "score": score
+            } for rank, student_id, score in self._boards[metric].top(k)]
+
+    def rank(self, metric: str, student_id: str) -> dict:
+        """获取学生的名次, 未参与排名时名次为None
+
+        Raises:
+            KeyError: 未知的指标
+        """
+        with self._lock:
+            self._sync()
+            board = self._boards[metric]
+            return {
+                "rank": board.rank(student_id),
+                "score": board.score(student_id) or 0,
+                "total": len(board)
+            }
+
+    def get_stats(self) -> dict:
+        """获取统计信息"""
+        with self._lock:
+            return {**self.stats, "students": len(self._names), "pending": len(self._dirty)}
+
+leaderboard = LeaderboardService()
+
+cluster.register_handler("data_version", lambda payload: leaderboard.mark_dirty(payload or ()))
+cluster.register_handler("leaderboard", lambda payload: leaderboard.reset())
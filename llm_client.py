@@ -0,0 +1,410 @@
+"""DeepSeek(OpenAI兼容)客户端管理
+
+整个应用共享一个 AsyncOpenAI 客户端及其底层的 httpx 连接池, 连接保持复用,
+避免每次问答都重新建立连接和TLS握手。客户端在 app.py 的 lifespan 中创建和关闭,
+deepseek.* 配置变化时重新创建, 旧客户端在进行中的请求结束后关闭。
+
+所有上游请求还要经过 LLMGovernor 获取并发名额: 同时进行的请求数不超过上限,
+排队的请求按学生轮转分配名额, 队列有长度上限和等待超时。
+StreamStats 统计流式回答的完成和中途放弃情况, 以及因及时取消而节省的token数。
+"""
+import asyncio
+import importlib.util
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from config import config
+
+# 配置变化后旧客户端的关闭延迟(秒), 留给进行中的流式回答结束
+RETIRE_DELAY = 300
+# 单次回答的最大token数
+MAX_ANSWER_TOKENS = 2000
+
+# HTTP/2 依赖 h2 包, 未安装时退回 HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+def _client_settings(snapshot) -> tuple:
+    """提取影响客户端创建的配置项"""
+    return (
+        snapshot.deepseek_api_key,
+        snapshot.deepseek_base_url,
+        snapshot.deepseek_max_connections,
+        snapshot.deepseek_max_keepalive_connections,
+        snapshot.deepseek_keepalive_expiry,
+        snapshot.deepseek_connect_timeout,
+        snapshot.deepseek_read_timeout,
+        snapshot.deepseek_http2,
+    )
+
+class LLMClientManager:
+    """应用级的 AsyncOpenAI 客户端管理器"""
+
+    def __init__(self):
+        self._client: Optional[AsyncOpenAI] = None
+        self._settings = None
+        self._lock = threading.Lock()
+        self._retiring = set()
+        config.add_listener(self._on_config_changed)
+
+    def _build(self, settings: tuple) -> AsyncOpenAI:
+        """根据配置创建客户端"""
+        (api_key, base_url, max_connections, max_keepalive, keepalive_expiry,
+         connect_timeout, read_timeout, http2) = settings
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            http2=bool(http2) and HTTP2_AVAILABLE
+        )
+        return AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=http_client,
+            max_retries=1
+        )
+
+    def get(self) -> AsyncOpenAI:
+        """获取共享客户端, 必须在事件循环中调用"""
+        client = self._client
+        if client is not None:
+            return client
+        with self._lock:
+            if self._client is None:
+                self._settings = _client_settings(config.snapshot)
+                self._client = self._build(self._settings)
+            client = self._client
+            retiring, self._retiring = self._retiring, set()
+        loop = asyncio.get_running_loop()
+        for old_client in retiring:
+            loop.call_later(RETIRE_DELAY, lambda c=old_client: asyncio.ensure_future(self._close(c)))
+        return client
+
+    def _on_config_changed(self, old, new):
+        """deepseek.* 配置变化时丢弃当前客户端, 下次使用时重新创建"""
+        if _client_settings(new) == self._settings:
+            return
+        with self._lock:
+            old_client, self._client = self._client, None
+            if old_client is not None:
+                self._retiring.add(old_client)
+
+    async def _close(self, client: AsyncOpenAI):
+        """关闭客户端及其连接池"""
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"关闭AI客户端失败: {e}")
+
+    async def aclose(self):
+        """关闭所有客户端, 在应用关闭时调用"""
+        with self._lock:
+            clients = list(self._retiring)
+            self._retiring.clear()
+            if self._client is not None:
+                clients.append(self._client)
+            self._client = None
+            self._settings = None
+        for client in clients:
+            await self._close(client)
+
+llm_clients = LLMClientManager()
+
+def get_llm_client() -> AsyncOpenAI:
+    """获取共享的DeepSeek客户端"""
+    return llm_clients.get()
+
+
+class LLMBusyError(Exception):
+    """排队人数已满或等待超时"""
+
+class LLMTicket:
+    """一次上游请求的排队凭证"""
+
+    __slots__ = ("lane", "future", "granted", "finished", "created_at")
+
+    def __init__(self, lane: str):
+        self.lane = lane
+        self.future = asyncio.get_running_loop().create_future()
+        self.granted = False
+        self.finished = False
+        self.created_at = time.monotonic()
+
+class LLMGovernor:
+    """上游请求并发控制
+
+    同时进行的请求数不超过 deepseek.max_concurrent。名额不足时请求进入等待队列,
+    队列按学生分为多条通道, 名额释放时按通道轮转分配, 同一个学生连续提问不会挤占其他学生。
+    该限制按进程生效, 多进程部署时总并发为 进程数 x 上限。运行中调高上限后立即把新增的名额分配给排队的请求。
+    """
+
+    def __init__(self):
+        self._active = 0
+        self._lanes: "OrderedDict[str, Deque[LLMTicket]]" = OrderedDict()
+        self._waiting = 0
+        # 排队凭证所在的事件循环, 配置监视线程通过它调度名额分配
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        config.add_listener(self._on_config_changed)
+
+    @property
+    def active(self) -> int:
+        """正在进行的请求数"""
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        """排队中的请求数"""
+        return self._waiting
+
+    def enqueue(self, lane: str) -> LLMTicket:
+        """申请名额, 有空闲名额时立即获得, 否则进入对应通道排队
+
+        Raises:
+            LLMBusyError: 排队人数已达上限
+        """
+        ticket = LLMTicket(lane)
+        self._loop = ticket.future.get_loop()
+        if self._active < config.deepseek_max_concurrent and not self._waiting:
+            self._grant(ticket)
+            return ticket
+        if self.is_full:
+            raise LLMBusyError("当前提问人数过多,请稍后再试")
+        self._lanes.setdefault(lane, deque()).append(ticket)
+        self._waiting += 1
+        # 上限可能已被调高而队列中还有请求, 按轮转顺序分配空闲名额
+        self._dispatch()
+        return ticket
+
+    def _ahead(self, lane: str, rank: Optional[int] = None) -> int:
+        """计算通道lane中第rank个请求之前会被服务的请求数, rank为空时表示排到通道末尾"""
+        lanes = list(self._lanes.items())
+        lane_index = next((i for i, (name, _) in enumerate(lanes) if name == lane), len(lanes))
+        if rank is None:
+            rank = len(lanes[lane_index][1]) if lane_index < len(lanes) else 0
+        # 轮转分配: 请求在第rank轮被服务, 之前每条通道各服务min(长度, rank)个, 本轮排在前面的通道再各服务一个
+        ahead = 0
+        for i, (_, queue) in enumerate(lanes):
+            if i == lane_index:
+                continue
+            ahead += min(len(queue), rank)
+            if i < lane_index and len(queue) > rank:
+                ahead += 1
+        return ahead + rank
+
+    def position(self, ticket: LLMTicket) -> int:
+        """计算凭证的排队位置(从1开始), 已获得名额时返回0"""
+        if ticket.granted:
+            return 0
+        queue = self._lanes.get(ticket.lane)
+        if queue is None or ticket not in queue:
+            return 0
+        return self._ahead(ticket.lane, queue.index(ticket)) + 1
+
+    def estimate_position(self, lane: str) -> int:
+        """估计该通道新请求的排队位置(从1开始), 可以立即获得名额时返回0"""
+        if self._active < config.deepseek_max_concurrent and not self._waiting:
+            return 0
+        return self._ahead(lane) + 1
+
+    @property
+    def is_full(self) -> bool:
+        """排队人数是否已达上限"""
+        return self._waiting >= config.deepseek_max_queue
+
+    def _grant(self, ticket: LLMTicket):
+        ticket.granted = True
+        self._active += 1
+        ticket.future.set_result(True)
+
+    def _dispatch(self):
+        """把空闲名额按通道轮转分配给排队的请求"""
+        while self._lanes and self._active < config.deepseek_max_concurrent:
+            lane, queue = self._lanes.popitem(last=False)
+            ticket = queue.popleft()
+            self._waiting -= 1
+            if queue:
+                # 该学生还有请求在排队, 移到轮转顺序的末尾
+                self._lanes[lane] = queue
+            if not ticket.future.done():
+                self._grant(ticket)
+
+    def _remove(self, ticket: LLMTicket):
+        """从队列中移除放弃等待的凭证"""
+        queue = self._lanes.get(ticket.lane)
+        if queue is None:
+            return
+        try:
+            queue.remove(ticket)
+        except ValueError:
+            return
+        self._waiting -= 1
+        if not queue:
+            del self._lanes[ticket.lane]
+
+    def _on_config_changed(self, old, new):
+        """deepseek.max_concurrent 调高时把新增的名额分配给排队的请求
+
+        回调在配置监视线程中执行, 分配名额要操作事件循环中的 future, 所以提交到事件循环中执行。
+        """
+        if old is None or new.deepseek_max_concurrent <= old.deepseek_max_concurrent:
+            return
+        loop = self._loop
+        if loop is None or not self._waiting:
+            return
+        try:
+            loop.call_soon_threadsafe(self._dispatch)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def release(self):
+        """释放名额"""
+        self._active -= 1
+        self._dispatch()
+
+    def finish(self, ticket: LLMTicket):
+        """结束凭证: 已获得名额时释放名额, 仍在排队时退出队列, 重复调用无副作用"""
+        if ticket.finished:
+            return
+        ticket.finished = True
+        if ticket.granted:
+            self.release()
+        else:
+            self._remove(ticket)
+            ticket.future.cancel()
+
+    async def _wait_granted(self, ticket: LLMTicket, timeout: float) -> bool:
+        """最多等待timeout秒, 返回是否已获得名额; 被取消(客户端断开连接)时结束凭证"""
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), timeout)
+        except asyncio.TimeoutError:
+            return ticket.granted
+        except asyncio.CancelledError:
+            self.finish(ticket)
+            raise
+        return True
+
+    async def wait(self, ticket: LLMTicket, timeout: Optional[float] = None):
+        """等待获得名额
+
+        Raises:
+            LLMBusyError: 等待超时
+        """
+        if ticket.granted:
+            return
+        if timeout is None:
+            timeout = config.deepseek_queue_timeout
+        if not await self._wait_granted(ticket, timeout):
+            self.finish(ticket)
+            raise LLMBusyError("排队等待超时,请稍后再试")
+
+    async def positions(self, ticket: LLMTicket, interval: float = 1.0) -> AsyncIterator[int]:
+        """等待获得名额, 等待期间排队位置变化时产出新的位置(从1开始)
+
+        Raises:
+            LLMBusyError: 等待超时
+        """
+        deadline = time.monotonic() + config.deepseek_queue_timeout
+        last = None
+        while not ticket.granted:
+            position = self.position(ticket)
+            if position != last:
+                last = position
+                yield position
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.finish(ticket)
+                raise LLMBusyError("排队等待超时,请稍后再试")
+            await self._wait_granted(ticket, min(interval, remaining))
+
+    @asynccontextmanager
+    async def slot(self, lane: str):
+        """获取一个并发名额, 退出时释放
+
+        Args:
+            lane: 排队通道, 一般为学生ID
+
+        Raises:
+            LLMBusyError: 排队人数已满或等待超时
+        """
+        ticket = self.enqueue(lane)
+        try:
+            await self.wait(ticket)
+            yield
+        finally:
+            self.finish(ticket)
+
+    def get_stats(self) -> dict:
+        """获取并发控制状态"""
+        return {
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrent": config.deepseek_max_concurrent,
+            "max_queue": config.deepseek_max_queue
+        }
+
+llm_governor = LLMGovernor()
+
+
+class StreamStats:
+    """流式回答统计(当前进程)
+
+    流式回答的每个增量大约对应一个token。学生中途离开时上游请求会被取消,
+    节省的token数按已完成回答的平均长度估算: 平均长度减去已经生成的部分。
+    """
+
+    def __init__(self):
+        self.completed = 0
+        self.abandoned = 0
+        self.abandoned_in_queue = 0
+        self.tokens_received = 0
+        self.tokens_saved = 0
+        self._completed_tokens = 0
+
+    @property
+    def average_tokens(self) -> float:
+        """已完成回答的平均token数, 还没有完成的回答时按上限的一半估计"""
+        if not self.completed:
+            return MAX_ANSWER_TOKENS / 2
+        return self._completed_tokens / self.completed
+
+    def record_completed(self, tokens: int):
+        """记录一次完整生成的回答"""
+        self.completed += 1
+        self.tokens_received += tokens
+        self._completed_tokens += tokens
+
+    def record_abandoned(self, tokens: int, queued: bool = False):
+        """记录一次被学生放弃的回答
+
+        Args:
+            tokens: 放弃前已经收到的token数
+            queued: 放弃时是否还在排队(上游请求尚未发出)
+        """
+        self.abandoned += 1
+        if queued:
+            self.abandoned_in_queue += 1
+        self.tokens_received += tokens
+        self.tokens_saved += max(0, int(min(self.average_tokens, MAX_ANSWER_TOKENS)) - tokens)
+
+    def get_stats(self) -> dict:
+        """获取统计信息"""
+        total = self.completed + self.abandoned
+        return {
+            "completed": self.completed,
+            "abandoned": self.abandoned,
+            "abandoned_in_queue": self.abandoned_in_queue,
+            "abandon_rate": round(self.abandoned / total * 100, 2) if total else 0.0,
+            "tokens_received": self.tokens_received,
+            "tokens_saved": self.tokens_saved
+        }
+
+stream_stats = StreamStats()
@@ -5,6 +5,18 @@ default_json = """
         "password": "admin123",
         "username": "admin"
     },
+    "answer_cache": {
+        "enabled": true,
+        "max_entries": 1000,
+        "similarity": 0.8,
+        "ttl": 3600
+    },
+    "chat": {
+        "context_enabled": true,
+        "context_max_turns": 6,
+        "context_token_budget": 2000,
+        "context_window_minutes": 60
+    },
     "database": {
         "file": "openjudge.db",
         "max_overflow": 200,
@@ -14,7 +26,21 @@ default_json = """
     "deepseek": {
         "api_key": "sk-esadasdfsdf",
         "base_url": "https://api.deepseek.com",
-        "model": "deepseek-chat"
+        "model": "deepseek-chat",
+        "max_connections": 100,
+        "max_keepalive_connections": 20,
+        "keepalive_expiry": 30,
+        "connect_timeout": 10,
+        "read_timeout": 60,
+        "http2": true,
+        "max_concurrent": 20,
+        "max_queue": 200,
+        "queue_timeout": 60
+    },
+    "explanation": {
+        "enabled": true,
+        "prefetch_min_count": 3,
+        "prefetch_interval": 300
     },
     "features": {
         "enable_exam": false,
@@ -24,9 +50,19 @@ default_json = """
         "default_exam_permission": true
     },
     "rate_limit": {
+        "backend": "memory",
         "max_requests": 5,
         "window": 120
     },
+    "relevance": {
+        "local_enabled": true,
+        "threshold": 3.0,
+        "batch_size": 20,
+        "batch_interval": 5
+    },
+    "server": {
+        "workers": 1
+    },
     "system": {
         "correct_threshold": 3,
         "cycle_days": 3,
@@ -41,7 +77,8 @@ default_json = """
         "ThemeMode": "Auto"
     },
     "token": {
-        "expire_minutes": 300
+        "expire_minutes": 300,
+        "session_minutes": 30
     }
 }
 """
@@ -3,6 +3,7 @@ from fastapi.responses import RedirectResponse
 
 from db import get_ongoing_exam, get_ip_bound_user
 from utils import get_client_ip
+from auth import SESSION_COOKIE
 from config import config
 
 async def exam_check_middleware(request: Request, call_next):
@@ -41,3 +42,18 @@ async def exam_check_middleware(request: Request, call_next):
     
     # 如果没有进行中的考试,继续处理请求
     return await call_next(request)
+
+
+async def session_cookie_middleware(request: Request, call_next):
+    """在认证过程中重新签发了会话token时,将新token写入cookie"""
+    response = await call_next(request)
+    token = getattr(request.state, "session_token", None)
+    if token:
+        response.set_cookie(
+            key=SESSION_COOKIE,
+            value=token,
+            httponly=True,
+            samesite="strict",
+            secure=False  # 本地开发环境设为False
+        )
+    return response
@@ -3,10 +3,11 @@ from enum import Enum
 from typing import Optional, List, Union
 
 from pydantic import BaseModel, Field
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Index
+from sqlalchemy import Column, String, Integer, Boolean, Date, DateTime, ForeignKey, Index, Float, Text, SmallInteger
 from sqlalchemy.ext.declarative import declarative_base
 
-__all__ = ['Base', 'User', 'Record', 'CodeRecord', 'QuestionType', 'Question', 'QuestionResponse', 'LoginRequest', 'AnswerRequest', 'Exam', 'ExamRecord', 'AIChatRecord']
+__all__ = ['Base', 'User', 'Record', 'CodeRecord', 'QuestionType', 'Question', 'QuestionResponse', 'LoginRequest', 'AnswerRequest', 'Exam', 'ExamRecord', 'AIChatRecord', 'RateLimitState', 'CacheInvalidation', 'WorkerLease', 'MistakeExplanation', 'StudentStats',
+           'QuestionStats', 'QuestionAnswerCount', 'ActivityHistory', 'StudentDailyStats']
 
 Base = declarative_base()
 
@@ -15,11 +16,12 @@ class User(Base):
     __tablename__ = 'users'
     
     student_id = Column(String(20), primary_key=True)
-    name = Column(String(50), nullable=False)
+    name = Column(String(50), nullable=False, index=True)
     bound_ip = Column(String(15))
     bound_time = Column(DateTime, index=True)
     enable_ai = Column(Boolean, default=True)  # 是否允许使用AI问答,默认允许
     enable_exam = Column(Boolean, default=False) # 是否允许参加考试,默认关闭
+    session_version = Column(Integer, default=0, nullable=False) # 会话版本,递增后已签发的会话token全部失效
 
 class Record(Base):
     __tablename__ = 'records'
@@ -28,13 +30,15 @@ class Record(Base):
     student_id = Column(String(20), ForeignKey('users.student_id'), index=True)
     question_id = Column(String(20))
     is_correct = Column(Boolean, index=True)
-    student_answer = Column(String(500))  # 存储学生的答案,可能是字符串、列表或布尔值的JSON字符串
+    student_answer = Column(String(500))  # 填空题和问答题规范化后的答案(JSON字符串)
+    answer_mask = Column(SmallInteger)  # 选择题和判断题的答案位掩码, 见 questions.encode_answer_mask
     answer_time = Column(DateTime, default=datetime.now, index=True)
     
     # 复合索引
     __table_args__ = (
         Index('idx_record_student_date', student_id, answer_time),
         Index('idx_record_student_correct', student_id, is_correct),
+        Index('idx_record_question_correct', question_id, is_correct),
     )
 
 class CodeRecord(Base):
@@ -130,10 +134,120 @@ class AIChatRecord(Base):
     question = Column(String(1000))  # 学生的问题
     answer = Column(String(5000))    # AI的回答
     chat_time = Column(DateTime, default=datetime.now, index=True)
-    is_irrelevant = Column(Boolean, default=False, index=True)  # 是否是无关问题
+    is_irrelevant = Column(Boolean, index=True)  # 是否是无关问题, NULL表示待判断
+    labeled_by = Column(String(10))  # 相关性标签的来源: teacher/llm/local/fallback, 旧数据为NULL
+    is_partial = Column(Boolean, default=False)  # 学生中途离开, 回答未生成完整
     
     # 复合索引
     __table_args__ = (
         Index('idx_chat_student_time', student_id, chat_time),
         Index('idx_chat_student_irrelevant', student_id, is_irrelevant),
     )
+
+class RateLimitState(Base):
+    __tablename__ = 'rate_limits'
+    
+    key = Column(String(64), primary_key=True)  # 限流器名称:学生ID
+    window_start = Column(Integer, nullable=False, index=True)  # 当前窗口起点(对齐后的时间戳)
+    prev_count = Column(Integer, default=0, nullable=False)  # 上一窗口请求数
+    curr_count = Column(Integer, default=0, nullable=False)  # 当前窗口请求数
+
+class CacheInvalidation(Base):
+    __tablename__ = 'cache_invalidations'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    topic = Column(String(32), nullable=False)  # 消息主题
+    payload = Column(Text)  # 消息内容(JSON)
+    origin = Column(String(64), nullable=False)  # 发布消息的进程
+    created_at = Column(Float, nullable=False, index=True)  # 发布时间戳
+
+class WorkerLease(Base):
+    __tablename__ = 'worker_leases'
+    
+    name = Column(String(64), primary_key=True)  # 任务名称
+    owner = Column(String(64), nullable=False)  # 持有租约的进程
+    expires_at = Column(Float, nullable=False)  # 租约到期时间戳
+
+class MistakeExplanation(Base):
+    __tablename__ = 'mistake_explanations'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    question_id = Column(String(20), nullable=False)
+    answer_key = Column(String(500), nullable=False)  # 规范化后的错误答案(JSON字符串)
+    explanation = Column(Text, nullable=False)  # AI生成的错因讲解
+    is_prefetched = Column(Boolean, default=False)  # 是否由后台任务预先生成
+    created_at = Column(DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        Index('idx_mistake_question_answer', question_id, answer_key, unique=True),
+    )
+
+class StudentStats(Base):
+    __tablename__ = 'student_stats'
+    
+    # 每个学生的累计统计, 在写入答题记录和完成考试时同步更新, 供管理后台分页排序
+    student_id = Column(String(20), ForeignKey('users.student_id'), primary_key=True)
+    total_questions = Column(Integer, default=0, nullable=False)  # 练习题数
+    correct_questions = Column(Integer, default=0, nullable=False)  # 答对题数
+    accuracy = Column(Float, default=0, nullable=False)  # 正确率(%)
+    exam_count = Column(Integer, default=0, nullable=False)  # 已完成的考试次数
+    last_exam_score = Column(Float)  # 最近一次考试成绩
+    last_exam_time = Column(DateTime)  # 最近一次考试的提交时间
+    # 排行榜使用的指标, 见 leaderboard.py
+    best_exam_score = Column(Float)  # 考试最高分
+    week_start = Column(Date)  # week_mastered 所属的周(周一)
+    week_mastered = Column(Integer, default=0, nullable=False)  # 该周内答对过的不同题目数
+    streak_days = Column(Integer, default=0, nullable=False)  # 截至 last_active_date 的连续练习天数
+    last_active_date = Column(Date)  # 最近一次练习的日期
+    
+    # 排序列和学号的复合索引, 用于键集分页
+    __table_args__ = (
+        Index('idx_stats_total_questions', total_questions, student_id),
+        Index('idx_stats_accuracy', accuracy, student_id),
+        Index('idx_stats_exam_count', exam_count, student_id),
+        Index('idx_stats_last_exam_score', last_exam_score, student_id),
+    )
+
+class QuestionStats(Base):
+    __tablename__ = 'question_stats'
+    
+    # 每道题的练习作答统计, 在写入答题记录时同步更新, 用于题目分析
+    question_id = Column(String(20), primary_key=True)
+    attempts = Column(Integer, default=0, nullable=False)  # 作答次数
+    correct_count = Column(Integer, default=0, nullable=False)  # 答对次数
+    # 区分度(点二列相关)的累计量: x为是否答对, y为学生作答前的练习正确率,
+    # 只统计作答前已有足够练习记录的学生
+    ability_count = Column(Integer, default=0, nullable=False)  # n
+    ability_correct = Column(Integer, default=0, nullable=False)  # Σx
+    ability_sum = Column(Float, default=0, nullable=False)  # Σy
+    ability_square_sum = Column(Float, default=0, nullable=False)  # Σy²
+    ability_correct_sum = Column(Float, default=0, nullable=False)  # Σxy
+    last_answer_time = Column(DateTime)  # 最近一次作答时间
+
+class QuestionAnswerCount(Base):
+    __tablename__ = 'question_answer_counts'
+    
+    # 选择题和判断题每种答案(位掩码)的作答次数
+    question_id = Column(String(20), primary_key=True)
+    answer_mask = Column(SmallInteger, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+class ActivityHistory(Base):
+    __tablename__ = 'activity_history'
+    
+    # 降采样后的活动计数, 由 activity.py 定期从内存中的每分钟计数写入
+    bucket = Column(Integer, primary_key=True)  # 时间段起点, 为Unix时间的分钟数
+    event = Column(String(20), primary_key=True)  # 事件类型, 见 activity.EVENTS
+    count = Column(Integer, default=0, nullable=False)
+
+class StudentDailyStats(Base):
+    __tablename__ = 'student_daily_stats'
+    
+    # 每个学生每天的活动计数, 在写入答题记录、完成考试和AI提问时同步更新, 用于学生的活动时间线
+    student_id = Column(String(20), ForeignKey('users.student_id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    answers = Column(Integer, default=0, nullable=False)  # 练习题数
+    correct_answers = Column(Integer, default=0, nullable=False)  # 答对题数
+    mastered = Column(Integer, default=0, nullable=False)  # 当天答对过的不同题目数
+    exams = Column(Integer, default=0, nullable=False)  # 完成的考试次数
+    chats = Column(Integer, default=0, nullable=False)  # AI提问次数
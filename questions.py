@@ -2,12 +2,14 @@ import json
 import os
 import random
 from functools import lru_cache
-from typing import Union, List, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
 from fastapi import HTTPException
 
-from models import Question, QuestionResponse, QuestionType, Record, ExamRecord
+import cluster
+from models import Question, QuestionResponse, QuestionType, Record, ExamRecord, QuestionStats, QuestionAnswerCount
 from paths import get_base_path
+from versions import data_versions
 
 # 初始化questions.json
 def _init_questions_json():
@@ -34,6 +36,19 @@ def load_questions() -> List[Question]:
     except FileNotFoundError:
         return []
 
+@lru_cache()
+def get_question_map() -> Dict[str, Question]:
+    """获取题目ID到题目的映射, 用于批量查找题目"""
+    return {q.id: q for q in load_questions()}
+
+def _on_questions_changed(payload):
+    """题库有变化: 清除缓存并增加题库版本"""
+    load_questions.cache_clear()
+    get_question_map.cache_clear()
+    data_versions.bump(questions=True)
+
+cluster.register_handler("questions", _on_questions_changed)
+
 def get_total_enabled_questions() -> int:
     """获取题库总启用题目数量"""
     questions = load_questions()
@@ -129,6 +144,55 @@ def check_answer(question_id: str, user_answer: Union[str, List[str], bool]) ->
     
     return correct, question.explanation or ""
 
+def normalize_answer(question: Question, user_answer: Union[str, List[str], bool]) -> str:
+    """把学生答案规范化为JSON字符串, 判分规则下等价的答案得到相同的结果
+
+    多选题忽略选项顺序和重复, 填空题和问答题忽略首尾空白、大小写和多余的空白。
+    """
+    if question.type == QuestionType.MULTIPLE:
+        value = sorted(set(user_answer if isinstance(user_answer, list) else [user_answer]))
+    elif question.type in (QuestionType.BLANK, QuestionType.ESSAY) and isinstance(user_answer, str):
+        value = " ".join(user_answer.lower().split())
+    else:
+        value = user_answer
+    return json.dumps(value, ensure_ascii=False)[:500]
+
+def option_labels(question: Question) -> List[str]:
+    """选择题和判断题的选项标签, 依次对应答案位掩码的各位; 其他题型返回空列表"""
+    if question.type == QuestionType.JUDGE:
+        return ["正确", "错误"]
+    if question.type in (QuestionType.SINGLE, QuestionType.MULTIPLE):
+        return [chr(65 + i) for i in range(len(question.options or []))]
+    return []
+
+def encode_answer_mask(question: Question, user_answer: Union[str, List[str], bool]) -> Optional[int]:
+    """把选择题和判断题的答案编码为位掩码, 第i位表示选择了第i个选项
+
+    判断题第0位表示"正确", 第1位表示"错误"。其他题型或无法识别的答案返回None。
+    """
+    if question.type == QuestionType.JUDGE:
+        if isinstance(user_answer, bool):
+            return 1 if user_answer else 2
+        return None
+    labels = option_labels(question)
+    if not labels:
+        return None
+    mask = 0
+    for value in (user_answer if isinstance(user_answer, list) else [user_answer]):
+        if value not in labels:
+            return None
+        mask |= 1 << labels.index(value)
+    return mask
+
+def decode_answer_mask(question: Question, mask: int) -> Union[str, List[str], bool]:
+    """把位掩码还原为学生提交的答案"""
+    if question.type == QuestionType.JUDGE:
+        return mask == 1
+    chosen = [label for i, label in enumerate(option_labels(question)) if mask >> i & 1]
+    if question.type == QuestionType.SINGLE and len(chosen) == 1:
+        return chosen[0]
+    return chosen
+
 def update_question(question_id: str, question_data: dict) -> None:
     """更新题目或创建新题目
     
@@ -159,8 +223,8 @@ def update_question(question_id: str, question_data: dict) -> None:
     with open(questions_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
     
-    # 清除缓存
-    load_questions.cache_clear()
+    # 通知所有进程清除缓存
+    cluster.publish("questions")
 
 def delete_question(question_id: str) -> None:
     """删除指定ID的题目及其相关记录
@@ -168,14 +232,24 @@ def delete_question(question_id: str) -> None:
     Args:
         question_id: 题目ID
     """
-    from db import get_db
+    from db import get_db, rebuild_student_stats, rebuild_student_daily_stats, mark_changed
     
     # 删除题目相关的记录
     with get_db() as db:
+        # 批量删除不经过会话的对象跟踪, 手动记录答过该题的学生
+        student_ids = {sid for (sid,) in db.query(Record.student_id).filter(Record.question_id == question_id).distinct()}
+        student_ids.update(sid for (sid,) in db.query(ExamRecord.student_id).filter(ExamRecord.question_id == question_id).distinct())
+        mark_changed(db, *student_ids)
         # 删除普通答题记录
         db.query(Record).filter(Record.question_id == question_id).delete()
         # 删除考试记录
         db.query(ExamRecord).filter(ExamRecord.question_id == question_id).delete()
+        # 删除题目统计
+        db.query(QuestionStats).filter(QuestionStats.question_id == question_id).delete()
+        db.query(QuestionAnswerCount).filter(QuestionAnswerCount.question_id == question_id).delete()
+    # 答题记录减少后重新计算学生的统计汇总和每天的活动计数
+    rebuild_student_stats()
+    rebuild_student_daily_stats()
     
     # 读取现有题目
     questions_path = os.path.join(get_base_path(), 'data', 'questions.json')
@@ -189,5 +263,5 @@ def delete_question(question_id: str) -> None:
     with open(questions_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
     
-    # 清除缓存
-    load_questions.cache_clear()
+    # 通知所有进程清除缓存
+    cluster.publish("questions")
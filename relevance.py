@@ -0,0 +1,366 @@
+"""问题相关性判断
+
+先用本地的朴素贝叶斯分类器判断问题是否与Python相关, 只有本地无法确定的问题才交给大模型。
+分类器以字符n-gram为特征, 训练数据来自教师和大模型给出的 AIChatRecord.is_irrelevant 标签,
+再加上少量种子样本补充常见的术语和问法; 分类器自己给出的标签不参与训练, 以免错误被不断强化。两类真实标签都达到 MIN_LABELED_SAMPLES 条之前,
+只有与已有标签完全相同的问题在本地判断, 其余都交给大模型。判断结果按规范化后的问题文本缓存。
+
+本地无法确定的问题不再逐条调用大模型: 问答记录先以"待判断"(is_irrelevant为NULL)状态保存,
+后台任务定期取出待判断的记录, 每次把一批问题放在一个请求里让大模型返回JSON数组,
+结果用一条批量UPDATE写回。同一个问题连续 MAX_LLM_ATTEMPTS 次判断失败后按相关处理,
+避免始终失败的一批问题一直排在队首, 阻塞之后的记录。
+"""
+import asyncio
+import builtins
+import json
+import keyword
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import cluster
+from config import config
+from db import get_chat_relevance_samples, get_pending_relevance_chats, update_chat_relevance_bulk
+from db import LABELED_BY_LLM, LABELED_BY_LOCAL, LABELED_BY_FALLBACK
+from llm_client import get_llm_client, llm_governor
+
+BATCH_RELEVANCE_PROMPT = """你是一个判断问题是否与Python相关的助手。
+用户会给出一个JSON字符串数组, 每个元素是一个学生提出的问题。
+请逐个判断问题是否与Python编程相关, 输出一个与输入等长的JSON布尔数组,
+第i个元素表示第i个问题是否相关: 相关为true, 无关为false。
+只输出JSON数组, 不要有任何其他输出。
+"""
+
+# 冷启动种子: Python关键字、内置名称和常见的中文编程术语, 每个词单独作为一条相关样本
+SEED_KEYWORDS = sorted(
+    {"python", "pip", "list", "dict", "tuple", "set", "str", "append", "split", "join", "numpy", "pandas"}
+    | {word.lower() for word in keyword.kwlist}
+    | {name.lower() for name in dir(builtins) if not name.startswith("_") and not name[0].isupper()}
+) + [
+    "列表", "字典", "元组", "集合", "字符串", "函数", "循环", "变量", "模块", "异常", "报错", "代码",
+    "缩进", "切片", "对象", "方法", "参数", "返回值", "递归", "排序", "索引", "遍历", "编程", "语法",
+    "输出", "输入", "整数", "浮点", "布尔", "运算符", "条件", "迭代", "生成器", "装饰器", "继承",
+]
+# 冷启动种子样本
+SEED_RELEVANT = [
+    "python", "print函数怎么用", "def 定义函数", "import 导入模块", "for循环和while循环",
+    "列表 list 的切片", "字典 dict 怎么遍历", "字符串 str 格式化", "元组和集合的区别",
+    "if elif else 条件判断", "try except 异常处理", "class 类和对象", "range len input int",
+    "这段代码为什么报错", "变量 赋值 运算符", "return 返回值", "lambda 表达式", "文件读写 open",
+    "递归函数", "列表推导式", "pip 安装第三方库", "IndentationError 缩进错误", "SyntaxError",
+    "TypeError", "NameError", "append 方法", "split join", "numpy pandas",
+    # 与无关样本相同的口语化问法, 避免"怎么""今天""为什么"等词单独决定结果
+    "怎么写一个类", "怎么定义函数", "今天作业的while怎么做", "今天的作业代码怎么写", "这道题怎么做",
+    "为什么输出不对", "为什么运行结果是这样", "老师这个程序怎么改", "你好 这个循环怎么写", "谢谢 那列表怎么排序",
+    "怎么把字符串转成整数", "明天考试的编程题怎么复习", "数学计算用python怎么写", "帮我看看这段代码",
+]
+SEED_IRRELEVANT = [
+    "今天天气怎么样", "讲个笑话", "你是谁", "写一篇800字作文", "推荐一部电影", "玩什么游戏好",
+    "中午吃什么", "翻译这句英语", "历史上的今天", "数学题怎么做", "明天考试紧张怎么办",
+    "唱首歌", "你好", "谢谢", "哈哈哈", "我喜欢的明星", "篮球比赛结果", "怎么减肥",
+]
+
+# 相关性判断请求的排队通道
+RELEVANCE_LANE = "__relevance__"
+# 本地训练数据的刷新间隔(秒), 标签被修正后最快也要间隔这么久才重新训练
+RETRAIN_INTERVAL = 60
+# 判断结果缓存大小
+CACHE_SIZE = 4096
+# 平滑系数, 取值较小使只在一类样本中出现过的特征有较强的区分度
+SMOOTHING = 0.2
+# 至少要有这么多个已知特征, 本地判断才可信
+MIN_KNOWN_FEATURES = 2
+# 相关和无关两类都至少有这么多条真实标签(不含种子样本)后才启用本地判断,
+# 此前只有种子样本时分类器的偏差很大, 所有不能直接命中标签的问题都交给大模型
+MIN_LABELED_SAMPLES = 50
+# 每次后台任务最多处理的批次数
+MAX_BATCHES_PER_RUN = 5
+# 同一个问题最多交给大模型判断几次, 之后按相关处理
+MAX_LLM_ATTEMPTS = 3
+
+_SPACE_RE = re.compile(r"[\s　]+")
+_WORD_RE = re.compile(r"[a-z_][a-z0-9_]*")
+
+def normalize_question(question: str) -> str:
+    """规范化问题文本: 全半角统一、转小写、合并空白"""
+    text = unicodedata.normalize("NFKC", question or "").lower()
+    return _SPACE_RE.sub(" ", text).strip()
+
+def extract_features(text: str) -> Counter:
+    """提取特征: 英文单词, 以及非英文部分的字符二元组和三元组"""
+    features = Counter(_WORD_RE.findall(text))
+    rest = _WORD_RE.sub(" ", text)
+    for chunk in rest.split():
+        if len(chunk) == 1:
+            features[chunk] += 1
+        for n in (2, 3):
+            for i in range(len(chunk) - n + 1):
+                features[chunk[i:i + n]] += 1
+    return features
+
+class RelevanceClassifier:
+    """多项式朴素贝叶斯相关性分类器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = ({}, {})  # (相关, 无关) 特征计数
+        self._totals = (0, 0)
+        self._vocab_size = 1
+        self._labels: Dict[str, bool] = {}  # 规范化问题 -> 是否相关(已有标签)
+        self._label_counts = (0, 0)  # (相关, 无关) 真实标签数
+        self._trained_at = 0.0
+        self._dirty = True
+        self._cache: "OrderedDict[str, bool]" = OrderedDict()
+        self.stats = {"cache": 0, "label": 0, "local": 0, "pending": 0, "llm": 0, "batches": 0, "fallback": 0}
+
+    def mark_dirty(self):
+        """标签发生变化, 下次判断前重新训练"""
+        self._dirty = True
+
+    def _train(self):
+        """从数据库标签和种子样本重新训练"""
+        docs = [(q, True) for q in SEED_RELEVANT + SEED_KEYWORDS] + [(q, False) for q in SEED_IRRELEVANT]
+        labels = {}
+        # 样本按时间倒序, 同一问题以最新的标签为准
+        for question, is_irrelevant in get_chat_relevance_samples():
+            text = normalize_question(question)
+            if text and text not in labels:
+                labels[text] = not is_irrelevant
+                docs.append((text, not is_irrelevant))
+
+        counts = ({}, {})
+        totals = [0, 0]
+        vocab = set()
+        for text, relevant in docs:
+            index = 0 if relevant else 1
+            for feature, count in extract_features(normalize_question(text)).items():
+                counts[index][feature] = counts[index].get(feature, 0) + count
+                totals[index] += count
+                vocab.add(feature)
+
+        with self._lock:
+            self._counts = counts
+            self._totals = tuple(totals)
+            self._vocab_size = max(1, len(vocab))
+            self._labels = labels
+            relevant = sum(labels.values())
+            self._label_counts = (relevant, len(labels) - relevant)
+            self._cache.clear()
+
+    def _needs_training(self) -> bool:
+        if self._trained_at == 0.0:
+            return True
+        return self._dirty and time.time() - self._trained_at >= RETRAIN_INTERVAL
+
+    def _ensure_trained(self):
+        """按需重新训练"""
+        if self._needs_training():
+            self._dirty = False
+            self._trained_at = time.time()
+            self._train()
+
+    def score(self, text: str) -> Tuple[float, int]:
+        """计算规范化问题的对数几率
+
+        Returns:
+            (log P(相关|问题) - log P(无关|问题), 训练集中出现过的特征数)
+        """
+        relevant_counts, irrelevant_counts = self._counts
+        relevant_total, irrelevant_total = self._totals
+        relevant_denominator = relevant_total + SMOOTHING * self._vocab_size
+        irrelevant_denominator = irrelevant_total + SMOOTHING * self._vocab_size
+        # 种子样本使两类样本数严重不均衡, 不使用先验概率
+        log_odds = 0.0
+        known = 0
+        for feature, count in extract_features(text).items():
+            rc = relevant_counts.get(feature, 0)
+            ic = irrelevant_counts.get(feature, 0)
+            if not rc and not ic:
+                # 训练集中没出现过的特征不提供信息, 计入反而会因两类语料长度不同引入偏差
+                continue
+            known += 1
+            log_odds += count * (
+                math.log((rc + SMOOTHING) / relevant_denominator)
+                - math.log((ic + SMOOTHING) / irrelevant_denominator)
+            )
+        return log_odds, known
+
+    def classify_local(self, question: str) -> Optional[bool]:
+        """本地判断问题是否相关
+
+        Returns:
+            是否相关, 无法确定时返回None
+        """
+        self._ensure_trained()
+        text = normalize_question(question)
+        if not text:
+            return False
+        cached = self._cache.get(text)
+        if cached is not None:
+            self.stats["cache"] += 1
+            return cached
+        label = self._labels.get(text)
+        if label is not None:
+            self.stats["label"] += 1
+            self._remember(text, label)
+            return label
+        if not config.relevance_local_enabled or min(self._label_counts) < MIN_LABELED_SAMPLES:
+            return None
+        log_odds, known = self.score(text)
+        if known < MIN_KNOWN_FEATURES or abs(log_odds) < config.relevance_threshold:
+            return None
+        self.stats["local"] += 1
+        result = log_odds > 0
+        self._remember(text, result)
+        return result
+
+    def _remember(self, text: str, relevant: bool):
+        """缓存判断结果"""
+        with self._lock:
+            self._cache[text] = relevant
+            self._cache.move_to_end(text)
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    async def ensure_trained(self):
+        """按需重新训练, 训练需要查询数据库, 放到线程中执行避免阻塞事件循环"""
+        if self._needs_training():
+            await asyncio.to_thread(self._ensure_trained)
+
+    async def classify(self, question: str) -> Optional[bool]:
+        """判断问题是否与Python相关, 本地无法确定时返回None, 由后台任务批量判断"""
+        await self.ensure_trained()
+        result = self.classify_local(question)
+        if result is None:
+            self.stats["pending"] += 1
+        return result
+
+    def remember(self, question: str, relevant: bool):
+        """缓存大模型给出的判断结果"""
+        self._remember(normalize_question(question), relevant)
+
+def _parse_labels(content: str, count: int) -> Optional[List[bool]]:
+    """解析大模型返回的JSON布尔数组, 格式不符时返回None"""
+    start, end = content.find("["), content.rfind("]")
+    if start < 0 or end < start:
+        return None
+    try:
+        labels = json.loads(content[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(labels, list) or len(labels) != count or not all(isinstance(x, bool) for x in labels):
+        return None
+    return labels
+
+async def ask_llm_batch(questions: List[str]) -> Optional[List[bool]]:
+    """调用大模型一次判断一批问题是否相关, 失败时返回None"""
+    try:
+        client = get_llm_client()
+        # 相关性判断共用一条排队通道, 与学生的问答请求轮转分配并发名额
+        async with llm_governor.slot(RELEVANCE_LANE):
+            response = await client.chat.completions.create(
+                model=config.deepseek_model,
+                messages=[
+                    {"role": "system", "content": BATCH_RELEVANCE_PROMPT},
+                    {"role": "user", "content": json.dumps(questions, ensure_ascii=False)}
+                ],
+                temperature=0,
+                max_tokens=8 * len(questions) + 16,
+                stream=False
+            )
+        labels = _parse_labels(response.choices[0].message.content or "", len(questions))
+        if labels is None:
+            print(f"相关性判断结果格式错误: {response.choices[0].message.content[:200]}")
+        return labels
+    except Exception as e:
+        print(f"检查相关性失败: {e}")
+        return None
+
+relevance_classifier = RelevanceClassifier()
+
+# 规范化问题 -> 大模型判断失败的次数, 只在运行批量判断任务的进程中使用
+_llm_failures: Dict[str, int] = {}
+
+cluster.register_handler("relevance_labels", lambda payload: relevance_classifier.mark_dirty())
+
+async def check_relevance(question: str) -> Optional[bool]:
+    """检查问题是否与Python相关, 本地无法确定时返回None(待判断)"""
+    return await relevance_classifier.classify(question)
+
+async def classify_pending() -> int:
+    """批量判断待判断的问答记录
+
+    先用本地分类器再判断一次(分类器可能已用新标签重新训练), 剩下的问题去重后
+    按 relevance.batch_size 分批交给大模型, 所有结果用一条UPDATE写回。
+    待判断记录总是从最早的开始取, 一批问题连续 MAX_LLM_ATTEMPTS 次失败后按相关写回,
+    让队列继续向后推进。
+
+    Returns:
+        int: 写回的记录数
+    """
+    batch_size = max(1, config.relevance_batch_size)
+    rows = await asyncio.to_thread(get_pending_relevance_chats, batch_size * MAX_BATCHES_PER_RUN)
+    if not rows:
+        return 0
+    await relevance_classifier.ensure_trained()
+
+    labels: Dict[int, bool] = {}  # 记录ID -> 是否无关
+    sources: Dict[int, str] = {}  # 记录ID -> 标签来源
+    unresolved: Dict[str, List[int]] = {}  # 规范化问题 -> 记录ID
+    originals: Dict[str, str] = {}
+    for chat_id, question in rows:
+        result = relevance_classifier.classify_local(question)
+        if result is not None:
+            labels[chat_id] = not result
+            sources[chat_id] = LABELED_BY_LOCAL
+            continue
+        text = normalize_question(question)
+        unresolved.setdefault(text, []).append(chat_id)
+        originals.setdefault(text, question)
+
+    texts = list(unresolved)
+    # 已不再待判断的问题(教师已标记或其他途径写回)不再计数
+    for text in set(_llm_failures) - set(texts):
+        del _llm_failures[text]
+    for i in range(0, len(texts), batch_size):
+        batch = texts[i:i + batch_size]
+        results = await ask_llm_batch([originals[text] for text in batch])
+        relevance_classifier.stats["batches"] += 1
+        relevance_classifier.stats["llm"] += len(batch)
+        if results is None:
+            # 本批保持待判断状态, 下次重试; 多次失败的问题按相关处理
+            for text in batch:
+                _llm_failures[text] = _llm_failures.get(text, 0) + 1
+                if _llm_failures[text] >= MAX_LLM_ATTEMPTS:
+                    del _llm_failures[text]
+                    relevance_classifier.stats["fallback"] += 1
+                    for chat_id in unresolved[text]:
+                        labels[chat_id] = False
+                        sources[chat_id] = LABELED_BY_FALLBACK
+            continue
+        for text, relevant in zip(batch, results):
+            _llm_failures.pop(text, None)
+            relevance_classifier.remember(text, relevant)
+            for chat_id in unresolved[text]:
+                labels[chat_id] = not relevant
+                sources[chat_id] = LABELED_BY_LLM
+
+    if not labels:
+        return 0
+    return await asyncio.to_thread(update_chat_relevance_bulk, labels, sources)
+
+def start_relevance_worker(loop: asyncio.AbstractEventLoop):
+    """启动批量相关性判断的后台任务
+
+    任务由 cluster.run_periodic 在后台线程中调度(多进程部署时只在一个进程中运行),
+    大模型客户端绑定在应用的事件循环上, 所以判断本身提交到该事件循环中执行。
+    """
+    def job():
+        future = asyncio.run_coroutine_threadsafe(classify_pending(), loop)
+        future.result()
+
+    cluster.run_periodic("relevance_batch", job, config.relevance_batch_interval)
@@ -1,14 +1,29 @@
+import asyncio
 import os
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from typing import Optional
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 from sqlalchemy import case, func, and_, true
 
 from db import get_db, get_base_path, update_user_ai_permission, update_user_exam_permission_no_async
-from models import User, Record, Exam, CodeRecord, AIChatRecord
+from db import set_chat_relevance as set_chat_relevance_record
+from db import get_chat_records as get_chat_record_page, get_chat_counts
+from db import get_users_progress_page, PROGRESS_SORT_COLUMNS, get_codes_signature, get_admin_exam_details
+from db import get_student_timeline, DAILY_COUNTERS
+from events import admin_events, format_sse
+from activity import activity, LIVE_MINUTES, HISTORY_RETENTION_DAYS
+from answer_cache import answer_cache
+from exports import DATASETS, FORMATS, ExportFilters, stream_export, export_filename
+from item_analysis import get_item_analysis, get_question_analysis, FLAG_LABELS
+from leaderboard import leaderboard, METRICS as LEADERBOARD_METRICS
+from llm_client import llm_governor, stream_stats
+from versions import data_versions, conditional
+import cluster
+from models import User, Record, Exam, CodeRecord, AIChatRecord, StudentStats
 from auth import verify_admin_credentials, create_access_token, admin_required
 
 from paths import get_template_path
@@ -35,6 +50,7 @@ class UserProgress(BaseModel):
     has_code: bool = False
     chat_count: int = 0
     today_irrelevant_chats: int = 0
+    today_pending_chats: int = 0
     enable_ai: bool = True
     enable_exam: bool = False
 
@@ -44,6 +60,13 @@ class UpdateAIPermissionRequest(BaseModel):
 class UpdateExamPermissionRequest(BaseModel):
     enable: bool
 
+class UpdateChatRelevanceRequest(BaseModel):
+    is_irrelevant: bool
+
+class UpdateAnswerCacheRequest(BaseModel):
+    enable: Optional[bool] = None
+    clear: bool = False
+
 @api_router.post("/login")
 async def admin_login(login_data: AdminLoginRequest):
     """管理员登录"""
@@ -73,124 +96,50 @@ async def update_user_exam_permission_route(request: Request, student_id: str, p
 
 @api_router.get("/users/progress")
 @admin_required()
-async def get_users_progress(request: Request):
-    """获取所有用户的进度信息,按IP绑定时间排序"""
-    with get_db() as db:
-        today = datetime.now().date()
-
-        # 1. 子查询: 计算每个学生的练习统计
-        practice_stats_sub = (
-            db.query(
-                Record.student_id,
-                func.count(Record.id).label("total_questions"),
-                func.sum(case((Record.is_correct == true(), 1), else_=0)).label("correct_questions")
-            )
-            .group_by(Record.student_id)
-            .subquery()
-        )
-
-        # 2. 子查询: 计算每个学生的考试统计
-        exam_stats_sub = (
-            db.query(
-                Exam.student_id,
-                func.count(Exam.exam_id).label("exam_count")
-            )
-            .filter(Exam.status == "已完成")
-            .group_by(Exam.student_id)
-            .subquery()
-        )
-
-        # 3. 子查询: 获取每个学生的最新一次考试成绩
-        latest_exam_sub = (
-            db.query(
-                Exam.student_id,
-                (Exam.correct_count * 100.0 / Exam.question_count).label("last_exam_score"),
-                func.row_number().over(
-                    partition_by=Exam.student_id,
-                    order_by=Exam.submit_time.desc()
-                ).label("rn")
-            )
-            .filter(Exam.status == "已完成", Exam.question_count > 0)
-            .subquery()
-        )
-        latest_exam_score_sub = (
-            db.query(latest_exam_sub.c.student_id, latest_exam_sub.c.last_exam_score)
-            .filter(latest_exam_sub.c.rn == 1)
-            .subquery()
-        )
-
-        # 4. 子查询: 检查今天是否获得认证码
-        code_today_sub = (
-            db.query(CodeRecord.student_id)
-            .filter(func.date(CodeRecord.get_time) == today)
-            .distinct()
-            .subquery()
-        )
-
-        # 5. 子查询: 计算今天的AI聊天统计
-        chat_stats_sub = (
-            db.query(
-                AIChatRecord.student_id,
-                func.count(AIChatRecord.id).label("chat_count"),
-                func.sum(case((AIChatRecord.is_irrelevant == true(), 1), else_=0)).label("today_irrelevant_chats")
-            )
-            .filter(func.date(AIChatRecord.chat_time) == today)
-            .group_by(AIChatRecord.student_id)
-            .subquery()
+async def get_users_progress(
+    request: Request,
+    sort: str = Query("bound_time", pattern="^(" + "|".join(PROGRESS_SORT_COLUMNS) + ")$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    q: Optional[str] = None,
+    ip: Optional[str] = None,
+    has_code: Optional[bool] = None,
+    min_accuracy: Optional[float] = Query(None, ge=0, le=100),
+    max_accuracy: Optional[float] = Query(None, ge=0, le=100),
+    enable_ai: Optional[bool] = None,
+    enable_exam: Optional[bool] = None
+):
+    """分页获取用户的进度信息, 默认按IP绑定时间倒序
+
+    支持按任意统计列排序, 按学号/姓名前缀、IP前缀、今日认证码、正确率范围和权限筛选。
+    """
+    try:
+        items, next_cursor, total = await asyncio.to_thread(
+            get_users_progress_page,
+            sort=sort, descending=order == "desc", cursor=cursor, limit=limit,
+            q=q.strip() if q else None, ip=ip.strip() if ip else None, has_code=has_code,
+            min_accuracy=min_accuracy, max_accuracy=max_accuracy,
+            enable_ai=enable_ai, enable_exam=enable_exam
         )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
 
-        # 主查询: 联合所有子查询
-        query_result = (
-            db.query(
-                User,
-                practice_stats_sub.c.total_questions,
-                practice_stats_sub.c.correct_questions,
-                exam_stats_sub.c.exam_count,
-                latest_exam_score_sub.c.last_exam_score,
-                code_today_sub.c.student_id.isnot(None).label("has_code"),
-                chat_stats_sub.c.chat_count,
-                chat_stats_sub.c.today_irrelevant_chats
-            )
-            .outerjoin(practice_stats_sub, User.student_id == practice_stats_sub.c.student_id)
-            .outerjoin(exam_stats_sub, User.student_id == exam_stats_sub.c.student_id)
-            .outerjoin(latest_exam_score_sub, User.student_id == latest_exam_score_sub.c.student_id)
-            .outerjoin(code_today_sub, User.student_id == code_today_sub.c.student_id)
-            .outerjoin(chat_stats_sub, User.student_id == chat_stats_sub.c.student_id)
-            .order_by(User.bound_time.desc())
-            .all()
-        )
-
-        progress_list = []
-        for row in query_result:
-            user, total_questions, correct_questions, exam_count, last_exam_score, has_code, chat_count, today_irrelevant_chats = row
-            
-            total_questions = total_questions or 0
-            correct_questions = correct_questions or 0
-            accuracy = (correct_questions / total_questions * 100) if total_questions > 0 else 0
-
-            progress_list.append(UserProgress(
-                student_id=user.student_id,
-                name=user.name,
-                bound_ip=user.bound_ip,
-                bound_time=user.bound_time,
-                total_questions=total_questions,
-                correct_questions=correct_questions,
-                accuracy=accuracy,
-                exam_count=exam_count or 0,
-                last_exam_score=round(last_exam_score, 2) if last_exam_score is not None else None,
-                has_code=has_code,
-                chat_count=chat_count or 0,
-                today_irrelevant_chats=today_irrelevant_chats or 0,
-                enable_ai=user.enable_ai,
-                enable_exam=user.enable_exam
-            ))
-            
-        return progress_list
+    return {
+        "items": [UserProgress(**item) for item in items],
+        "next_cursor": next_cursor,
+        "total": total
+    }
 
 @api_router.get("/stats/overview")
 @admin_required()
 async def get_system_overview(request: Request):
-    """获取系统概览统计信息"""
+    """获取系统概览统计信息, 数据没有变化时返回304"""
+    etag = data_versions.etag("overview", data_versions.global_version, date.today(), get_codes_signature())
+    return conditional.respond(request, ("overview",), etag, _compute_overview)
+
+def _compute_overview() -> dict:
+    """统计系统概览数据"""
     with get_db() as db:
         today = datetime.now().date()
 
@@ -229,7 +178,8 @@ async def get_system_overview(request: Request):
             func.count(AIChatRecord.id).label("total_chats"),
             func.count(case((func.date(AIChatRecord.chat_time) == today, AIChatRecord.id))).label("today_chats"),
             func.sum(case((AIChatRecord.is_irrelevant == true(), 1), else_=0)).label("irrelevant_chats"),
-            func.sum(case((and_(AIChatRecord.is_irrelevant == true(), func.date(AIChatRecord.chat_time) == today), 1), else_=0)).label("today_irrelevant_chats")
+            func.sum(case((and_(AIChatRecord.is_irrelevant == true(), func.date(AIChatRecord.chat_time) == today), 1), else_=0)).label("today_irrelevant_chats"),
+            func.sum(case((AIChatRecord.is_irrelevant.is_(None), 1), else_=0)).label("pending_chats")
         ).one()
 
         # 剩余认证码数量
@@ -271,63 +221,190 @@ async def get_system_overview(request: Request):
             "total_chats": chat_stats.total_chats or 0,
             "today_chats": chat_stats.today_chats or 0,
             "irrelevant_chats": chat_stats.irrelevant_chats or 0,
-            "today_irrelevant_chats": chat_stats.today_irrelevant_chats or 0
+            "today_irrelevant_chats": chat_stats.today_irrelevant_chats or 0,
+            "pending_chats": chat_stats.pending_chats or 0
         }
 
 @api_router.get("/chat/{student_id}")
 @admin_required()
-async def get_chat_records(request: Request, student_id: str):
-    """获取指定学生的问答记录"""
+async def get_chat_records(
+    request: Request,
+    student_id: str,
+    before: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """按时间倒序分页获取指定学生的问答记录"""
     with get_db() as db:
         user = db.query(User).filter(User.student_id == student_id).first()
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        
-        # 联合查询获取统计信息和聊天记录
-        result = db.query(
-            User.student_id,
-            User.name,
-            func.count(AIChatRecord.id).label("total_chats"),
-            func.sum(case((AIChatRecord.is_irrelevant == True, 1), else_=0)).label("irrelevant_chats")
-        ).filter(
-            User.student_id == student_id
-        ).join(
-            AIChatRecord, User.student_id == AIChatRecord.student_id
-        ).group_by(
-            User.student_id
-        ).first()
-        
-        # 单独获取聊天记录列表
-        chats = db.query(AIChatRecord).filter(
-            AIChatRecord.student_id == student_id
-        ).order_by(AIChatRecord.chat_time.desc()).all()
-        
-        return {
-            "student_id": user.student_id,
-            "student_name": user.name,
-            "total_chats": result.total_chats if result else 0,
-            "irrelevant_chats": result.irrelevant_chats if result else 0,
-            "chats": [{
-                "id": chat.id,
-                "question": chat.question,
-                "answer": chat.answer,
-                "chat_time": chat.chat_time,
-                "is_irrelevant": chat.is_irrelevant
-            } for chat in chats]
+        student_name = user.name
+
+    try:
+        chats, next_cursor = get_chat_record_page(student_id, before, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    total_chats, irrelevant_chats, pending_chats = get_chat_counts(student_id)
+
+    return {
+        "student_id": student_id,
+        "student_name": student_name,
+        "total_chats": total_chats,
+        "irrelevant_chats": irrelevant_chats,
+        "pending_chats": pending_chats,
+        "chats": chats,
+        "next_cursor": next_cursor
+    }
+
+@api_router.post("/chat/{chat_id}/relevance")
+@admin_required()
+async def set_chat_relevance(request: Request, chat_id: int, relevance: UpdateChatRelevanceRequest):
+    """设置问题的相关性标记"""
+    if not set_chat_relevance_record(chat_id, relevance.is_irrelevant):
+        raise HTTPException(status_code=404, detail="Chat record not found")
+    return {"success": True}
+
+@api_router.get("/answer-cache")
+@admin_required()
+async def get_answer_cache_stats(request: Request):
+    """获取回答缓存的统计信息(当前进程)"""
+    return answer_cache.get_stats()
+
+@api_router.post("/answer-cache")
+@admin_required()
+async def update_answer_cache(request: Request, update: UpdateAnswerCacheRequest):
+    """切换回答缓存开关或清空缓存"""
+    command = {"clear": update.clear}
+    if update.enable is not None:
+        command["enabled"] = update.enable
+    cluster.publish("answer_cache", command)
+    return answer_cache.get_stats()
+
+@api_router.get("/chat-streams")
+@admin_required()
+async def get_chat_stream_stats(request: Request):
+    """获取流式回答的统计信息(当前进程): 完成/放弃次数、节省的token数和上游并发状态"""
+    return {**stream_stats.get_stats(), "upstream": llm_governor.get_stats()}
+
+@api_router.get("/export")
+@admin_required()
+async def list_exports(request: Request):
+    """获取可导出的数据集及其列"""
+    return [{
+        "name": dataset.name,
+        "title": dataset.title,
+        "columns": [{"key": key, "title": title} for key, title in dataset.columns]
+    } for dataset in DATASETS.values()]
+
+@api_router.get("/export/{dataset}")
+@admin_required()
+async def export_dataset(
+    request: Request,
+    dataset: str,
+    format: str = Query("csv", pattern="^(csv|xlsx|jsonl)$"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    cohort: Optional[str] = Query(None, description="学号前缀"),
+    columns: Optional[str] = Query(None, description="逗号分隔的列名, 为空时导出全部列")
+):
+    """流式导出学生进度、考试成绩、考试答卷、练习记录或问答记录(CSV/XLSX/JSONL)
+
+    数据边从数据库读取边输出, 导出大量记录时内存占用保持不变。
+    """
+    if dataset not in DATASETS:
+        raise HTTPException(status_code=404, detail="未知的导出数据")
+    keys = [key.strip() for key in columns.split(",") if key.strip()] if columns else None
+    try:
+        content = stream_export(dataset, format, ExportFilters(start, end, cohort), keys)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        content,
+        media_type=FORMATS[format][0],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(dataset, format)}"'}
+    )
+
+@api_router.get("/activity")
+@admin_required()
+async def get_live_activity(request: Request, minutes: int = Query(60, ge=1, le=LIVE_MINUTES)):
+    """获取最近每分钟的活动计数(答题、答对、登录、考试、AI提问), 数据来自内存, 不查询数据库"""
+    return activity.live(minutes)
+
+@api_router.get("/activity/history")
+@admin_required()
+async def get_activity_history(request: Request, hours: int = Query(24, ge=1, le=HISTORY_RETENTION_DAYS * 24)):
+    """获取最近若干小时的活动计数, 按时间段合并"""
+    return await asyncio.to_thread(activity.history, hours)
+
+@api_router.get("/leaderboard")
+@admin_required()
+async def get_leaderboard(
+    request: Request,
+    metric: str = Query("mastered_week", pattern="^(" + "|".join(LEADERBOARD_METRICS) + ")$"),
+    limit: int = Query(20, ge=1, le=200),
+    student_id: Optional[str] = Query(None, description="同时返回该学生的名次")
+):
+    """获取排行榜: 本周掌握题数、考试最高分或连续练习天数"""
+    def compute():
+        result = {
+            "metric": metric,
+            "title": LEADERBOARD_METRICS[metric],
+            "metrics": LEADERBOARD_METRICS,
+            "top": leaderboard.top(metric, limit)
         }
+        if student_id:
+            result["student"] = {"student_id": student_id, **leaderboard.rank(metric, student_id)}
+        return result
 
-@api_router.post("/chat/{chat_id}/toggle-relevance")
+    return await asyncio.to_thread(compute)
+
+# 一次批量查看的最大考试数, 更多的答卷请使用导出
+MAX_EXAM_DETAILS = 200
+
+@api_router.get("/exams/details")
 @admin_required()
-async def toggle_chat_relevance(request: Request, chat_id: int):
-    """切换问题的相关性标记"""
-    with get_db() as db:
-        chat = db.query(AIChatRecord).filter(AIChatRecord.id == chat_id).first()
-        if not chat:
-            raise HTTPException(status_code=404, detail="Chat record not found")
-        
-        chat.is_irrelevant = not chat.is_irrelevant
-        db.commit()
-        return {"success": True}
+async def get_exams_details(
+    request: Request,
+    ids: str = Query(..., description="逗号分隔的考试ID")
+):
+    """批量获取考试详情(题目、正确答案、学生答案), 所有考试的答题记录在一次查询中取出
+
+    按日期或班级导出全部答卷请使用 /export/exam_details。
+    """
+    exam_ids = list(dict.fromkeys(exam_id.strip() for exam_id in ids.split(",") if exam_id.strip()))
+    if len(exam_ids) > MAX_EXAM_DETAILS:
+        raise HTTPException(status_code=400, detail=f"一次最多查看{MAX_EXAM_DETAILS}场考试")
+    return await asyncio.to_thread(get_admin_exam_details, exam_ids)
+
+@api_router.get("/questions/analysis")
+@admin_required()
+async def get_questions_analysis(request: Request, flagged: bool = False):
+    """获取所有题目的作答分析: 通过率、区分度、选项分布和提示
+
+    Args:
+        flagged: 只返回有提示(过难、过易、区分度低等)的题目
+    """
+    etag = data_versions.etag(
+        "item_analysis", flagged, data_versions.global_version, data_versions.questions_version
+    )
+
+    def compute():
+        items = get_item_analysis()
+        if flagged:
+            items = [item for item in items if item["flags"]]
+        return {"flag_labels": FLAG_LABELS, "items": items}
+
+    return conditional.respond(request, ("item_analysis", flagged), etag, compute)
+
+@api_router.get("/questions/{question_id}/analysis")
+@admin_required()
+async def get_question_analysis_route(request: Request, question_id: str):
+    """获取一道题的作答分析, 填空题和问答题包含最常见的错误答案"""
+    result = await asyncio.to_thread(get_question_analysis, question_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="题目不存在")
+    return result
 
 @api_router.get("/users/{student_id}/detail")
 @admin_required()
@@ -336,7 +413,7 @@ async def get_user_detail(request: Request, student_id: str):
     with get_db() as db:
         today = datetime.now().date()
 
-        # 联合查询获取用户信息、练习统计和今日认证码信息
+        # 练习统计取自统计汇总表, 今日认证码单独查询, 避免多条认证码记录使答题数成倍计算
         result = db.query(
             User.student_id,
             User.name,
@@ -344,25 +421,22 @@ async def get_user_detail(request: Request, student_id: str):
             User.bound_time,
             User.enable_ai,
             User.enable_exam,
-            func.count(Record.id).label('total_questions'),
-            func.sum(case((Record.is_correct == True, 1), else_=0)).label('correct_questions'),
-            CodeRecord.get_time.label('code_time')
+            StudentStats.total_questions,
+            StudentStats.correct_questions
+        ).outerjoin(
+            StudentStats, User.student_id == StudentStats.student_id
         ).filter(
             User.student_id == student_id
-        ).outerjoin(
-            Record, User.student_id == Record.student_id
-        ).outerjoin(
-            CodeRecord, and_(
-                User.student_id == CodeRecord.student_id,
-                func.date(CodeRecord.get_time) == today
-            )
-        ).group_by(
-            User.student_id
         ).first()
         
         if not result:
             raise HTTPException(status_code=404, detail="User not found")
         
+        code_time = db.query(func.min(CodeRecord.get_time)).filter(
+            CodeRecord.student_id == student_id,
+            func.date(CodeRecord.get_time) == today
+        ).scalar()
+        
         # 获取用户的考试记录
         exams = db.query(Exam).filter(
             Exam.student_id == student_id,
@@ -387,8 +461,8 @@ async def get_user_detail(request: Request, student_id: str):
                 "name": result.name,
                 "bound_ip": result.bound_ip,
                 "bound_time": result.bound_time,
-                "has_code": result.code_time is not None,
-                "code_time": result.code_time,
+                "has_code": code_time is not None,
+                "code_time": code_time,
                 "enable_ai": result.enable_ai,
                 "enable_exam": result.enable_exam
             },
@@ -400,3 +474,69 @@ async def get_user_detail(request: Request, student_id: str):
             },
             "exam_records": exam_records
         }
+
+# 活动时间线默认的天数和最多查询的天数
+TIMELINE_DEFAULT_DAYS = 365
+TIMELINE_MAX_DAYS = 3 * 366
+
+@api_router.get("/users/{student_id}/timeline")
+@admin_required()
+async def get_user_timeline(request: Request, student_id: str, start: Optional[date] = None,
+                            end: Optional[date] = None):
+    """获取学生每天的活动计数(练习、答对、掌握题数、考试、AI提问), 用于绘制活动热力图
+
+    默认返回截至今天的最近一年, 只包含有活动的日期。数据来自按天维护的计数表, 一次按主键的范围查询。
+    """
+    end = end or date.today()
+    start = start or end - timedelta(days=TIMELINE_DEFAULT_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="开始日期不能晚于结束日期")
+    if (end - start).days >= TIMELINE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"最多查询{TIMELINE_MAX_DAYS}天")
+    etag = data_versions.etag("timeline", student_id, data_versions.student(student_id), start, end)
+
+    def compute():
+        return {
+            "student_id": student_id,
+            "start": start,
+            "end": end,
+            "counters": DAILY_COUNTERS,
+            "days": get_student_timeline(student_id, start, end)
+        }
+
+    return conditional.respond(request, ("timeline", student_id, start, end), etag, compute)
+
+# SSE心跳间隔(秒), 防止代理因连接空闲而断开
+EVENT_HEARTBEAT_INTERVAL = 15
+
+@api_router.get("/events")
+@admin_required()
+async def admin_event_stream(request: Request):
+    """管理后台实时事件流(SSE)
+    
+    客户端先通过 /stats/overview 和 /users/progress 拉取一次全量数据,
+    之后只接收答题、问答、考试、用户变更等增量事件。
+    """
+    queue = admin_events.subscribe()
+
+    async def event_generator():
+        try:
+            yield format_sse({"type": "hello"}, event="hello")
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event, event=event["type"], event_id=event["id"])
+        finally:
+            admin_events.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
@@ -1,13 +1,19 @@
+import asyncio
+import time
 from datetime import datetime
-from typing import List, AsyncGenerator
+from typing import List, AsyncGenerator, Optional
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from fastapi.responses import StreamingResponse
-from openai import AsyncOpenAI
 from pydantic import BaseModel
 
 from config import config
-from db import save_chat_record, get_chat_records, get_user_full_info
+from llm_client import get_llm_client, llm_governor, stream_stats, LLMBusyError, LLMTicket, MAX_ANSWER_TOKENS
+from relevance import check_relevance
+from answer_cache import answer_cache
+from chat_context import chat_context, build_messages
+from events import format_sse
+from db import save_chat_record, get_chat_records, find_recent_chat_record
 from auth import get_current_user
 from utils import chat_limiter
 
@@ -15,6 +21,7 @@ router = APIRouter(prefix="/api/chat")
 
 class ChatRequest(BaseModel):
     question: str
+    context: bool = False  # 是否携带最近的问答作为多轮对话上下文
 
 class SaveChatRequest(BaseModel):
     question: str
@@ -39,116 +46,341 @@ CHAT_PROMPT = """你是一个Python编程助手,专门帮助学生解答Python
 5. 代码示例要规范,符合PEP 8标准
 """
 
-RELEVANCE_PROMPT = """你是一个判断问题是否与Python相关的助手。
-你的任务是判断用户的问题是否与Python编程相关。
-如果问题与Python编程相关,回答"相关"。
-如果问题与Python编程无关,回答"无关"。
-只回答"相关"或"无关"这两个词,不要有任何其他输出。
-"""
+class QueuePosition(int):
+    """generate_stream 在排队期间产出的排队位置(从1开始), 与回答内容区分"""
 
-async def generate_stream(messages: list) -> AsyncGenerator[str, None]:
-    """生成流式回答"""
-    # 创建DeepSeek客户端
-    client = AsyncOpenAI(
-        api_key=config.deepseek_api_key,
-        base_url=config.deepseek_base_url
-    )
-    stream = await client.chat.completions.create(
-        model=config.deepseek_model,
-        messages=messages,
-        temperature=0.7,
-        max_tokens=2000,
-        stream=True
-    )
-    async for chunk in stream:
-        if chunk.choices[0].delta.content:
-            yield chunk.choices[0].delta.content
+# 排队位置的刷新间隔(秒)
+QUEUE_UPDATE_INTERVAL = 1.0
 
-async def check_relevance(question: str) -> bool:
-    """检查问题是否与Python相关"""
+async def generate_stream(messages: list, ticket: LLMTicket) -> AsyncGenerator[str, None]:
+    """生成流式回答, 生成期间占用一个上游并发名额
+
+    ticket 由调用方在返回响应前申请, 需要排队时先产出 QueuePosition, 获得名额后产出回答内容。
+    学生中途离开时生成器被取消, 上游的流式响应随之关闭, 不再继续生成。
+    """
+    client = get_llm_client()
+    tokens = 0
     try:
-        # 创建DeepSeek客户端
-        client = AsyncOpenAI(
-            api_key=config.deepseek_api_key,
-            base_url=config.deepseek_base_url
-        )
-        response = await client.chat.completions.create(
+        async for position in llm_governor.positions(ticket, QUEUE_UPDATE_INTERVAL):
+            yield QueuePosition(position)
+        stream = await client.chat.completions.create(
             model=config.deepseek_model,
-            messages=[
-                {"role": "system", "content": RELEVANCE_PROMPT},
-                {"role": "user", "content": question}
-            ],
-            temperature=0,
-            max_tokens=10,
-            stream=False
+            messages=messages,
+            temperature=0.7,
+            max_tokens=MAX_ANSWER_TOKENS,
+            stream=True
         )
-        result = response.choices[0].message.content.strip()
-        return result == "相关"
+        # 退出时关闭上游响应, 中途取消时立即断开与上游的连接
+        async with stream:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    tokens += 1
+                    yield chunk.choices[0].delta.content
+        stream_stats.record_completed(tokens)
+    except (asyncio.CancelledError, GeneratorExit):
+        stream_stats.record_abandoned(tokens, queued=not ticket.granted)
+        raise
+    finally:
+        llm_governor.finish(ticket)
+
+# 回放缓存回答时每次发送的字符数
+REPLAY_CHUNK_SIZE = 16
+
+async def replay_answer(answer: str) -> AsyncGenerator[str, None]:
+    """按流式回答的方式分段发送缓存的回答"""
+    for i in range(0, len(answer), REPLAY_CHUNK_SIZE):
+        yield answer[i:i + REPLAY_CHUNK_SIZE]
+        await asyncio.sleep(0)
+
+async def persist_answer(student_id: str, question: str, answer: str, relevance_task: asyncio.Task,
+                         is_partial: bool = False):
+    """等待相关性判断结果并保存问答记录, 本地无法判断的问题保存为待判断状态"""
+    try:
+        is_relevant = await relevance_task
+        is_irrelevant = None if is_relevant is None else not is_relevant
+        save_chat_record(student_id, question, answer, is_irrelevant, is_partial=is_partial)
     except Exception as e:
-        print(f"检查相关性失败: {e}")
-        return False  # 如果检查失败,默认为无关
+        print(f"保存问答记录失败: {e}")
+
+# 保存部分回答的后台任务, 持有引用防止任务被垃圾回收
+_background_tasks = set()
+
+async def stream_and_persist(student_id: str, question: str, source: AsyncGenerator[str, None],
+                             cache_answer: bool = True) -> AsyncGenerator[str, None]:
+    """转发流式回答, 同时在服务端收集完整回答, 结束后保存问答记录
+
+    相关性判断与回答生成并发进行, 回答结束时通常已经有了结果。
+    学生中途离开时在后台保存已生成的部分回答; 排队超时、上游出错时不保存, 异常继续向上抛出。
+    """
+    relevance_task = asyncio.create_task(check_relevance(question))
+    parts = []
+    completed = False
+    abandoned = False
+    try:
+        async for content in source:
+            if not isinstance(content, QueuePosition):
+                parts.append(content)
+            yield content
+        completed = True
+    except (asyncio.CancelledError, GeneratorExit):
+        abandoned = True
+        raise
+    finally:
+        if abandoned and parts:
+            # 当前任务已被取消, 由后台任务等待相关性判断并保存部分回答
+            task = asyncio.create_task(persist_answer(
+                student_id, question, "".join(parts), relevance_task, is_partial=True
+            ))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        elif not completed:
+            relevance_task.cancel()
+
+    answer = "".join(parts)
+    if cache_answer:
+        answer_cache.store(question, answer)
+    await persist_answer(student_id, question, answer, relevance_task)
+
+# 合并增量的时间窗口(秒): 收到第一个增量后最多再等这么久, 把期间到达的增量合并为一个事件
+COALESCE_INTERVAL = 0.05
+# 合并缓冲区达到该字符数时立即发送
+COALESCE_MAX_CHARS = 512
+# 没有数据时发送心跳的间隔(秒), 防止代理因连接空闲而断开
+HEARTBEAT_INTERVAL = 15
+# 检查客户端是否断开连接的间隔(秒)
+DISCONNECT_CHECK_INTERVAL = 1.0
+
+async def sse_stream(source: AsyncGenerator[str, None],
+                     request: Optional[Request] = None) -> AsyncGenerator[str, None]:
+    """把回答增量编码为SSE事件流
+
+    上游每个token都是一个很小的增量, 逐个写出意味着每个token一次写入和系统调用。
+    这里由后台任务读取上游并写入缓冲区, 发送端按时间窗口和大小上限合并后再写出。
+
+    事件类型:
+        message: {"text": 合并后的回答片段}
+        queue: {"position": 排队位置}
+        error: {"message": 错误提示}
+        done: 回答结束
+    没有数据时发送 ": ping" 注释行作为心跳。
+
+    传入request时定期检查客户端是否已断开连接, 断开后取消上游读取。
+    部署在不主动通知断开的服务器或中间件之后时, 这是及时停止生成的唯一途径。
+    """
+    buffer: List[str] = []
+    state = {"size": 0, "position": None, "finished": False, "error": None}
+    ready = asyncio.Event()
+    flush = asyncio.Event()
+
+    async def pump():
+        try:
+            async for item in source:
+                if isinstance(item, QueuePosition):
+                    state["position"] = int(item)
+                    flush.set()
+                else:
+                    buffer.append(item)
+                    state["size"] += len(item)
+                    if state["size"] >= COALESCE_MAX_CHARS:
+                        flush.set()
+                ready.set()
+        except LLMBusyError as e:
+            state["error"] = str(e)
+        except Exception as e:
+            print(f"生成回答失败: {e}")
+            state["error"] = "AI服务暂时不可用,请稍后再试"
+        finally:
+            state["finished"] = True
+            flush.set()
+            ready.set()
+
+    task = asyncio.create_task(pump())
+    last_check = last_sent = time.monotonic()
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(ready.wait(), DISCONNECT_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            now = time.monotonic()
+            if request is not None and now - last_check >= DISCONNECT_CHECK_INTERVAL:
+                last_check = now
+                if await request.is_disconnected():
+                    return
+            if not ready.is_set():
+                if now - last_sent >= HEARTBEAT_INTERVAL:
+                    last_sent = now
+                    yield ": ping\n\n"
+                continue
+            if not flush.is_set():
+                try:
+                    await asyncio.wait_for(flush.wait(), COALESCE_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            ready.clear()
+            flush.clear()
+
+            frames = []
+            if state["position"] is not None:
+                frames.append(format_sse({"position": state["position"]}, event="queue"))
+                state["position"] = None
+            if buffer:
+                text = "".join(buffer)
+                buffer.clear()
+                state["size"] = 0
+                frames.append(format_sse({"text": text}))
+            if state["finished"]:
+                if state["error"]:
+                    frames.append(format_sse({"message": state["error"]}, event="error"))
+                else:
+                    frames.append(format_sse({}, event="done"))
+            if frames:
+                last_sent = time.monotonic()
+                yield "".join(frames)
+            if state["finished"]:
+                return
+    finally:
+        if not task.done():
+            # 客户端断开连接, 停止读取上游
+            task.cancel()
+
+# 流式回答的响应头, 禁止代理缓冲和缓存
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+class TicketStreamingResponse(StreamingResponse):
+    """持有排队凭证的流式响应, 响应结束时结束凭证
+
+    客户端在响应开始前断开时生成器不会执行, 凭证由这里结束, 不会一直占用名额或排队位置。
+    """
+
+    def __init__(self, content, ticket: LLMTicket, **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            llm_governor.finish(self.ticket)
+
+def check_chat_limit(student_id: str):
+    """检查并占用一次提问限流配额
+
+    Raises:
+        HTTPException: 请求过于频繁
+    """
+    if not chat_limiter.is_allowed(student_id):
+        remaining_time = int(chat_limiter.get_remaining_time(student_id))
+        raise HTTPException(
+            status_code=429,
+            detail=f"请求过于频繁,请等待{remaining_time}秒后再试"
+        )
 
 @router.post("/stream")
 async def chat_stream(request: Request, chat_request: ChatRequest):
-    """处理流式问答请求"""
+    """处理流式问答请求, 以SSE事件流返回回答"""
     user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Unauthorized")
     
-    # 检查AI使用权限
-    user_info = get_user_full_info(user.student_id)
-    if not user_info or not user_info["enable_ai"]:
+    # 检查AI使用权限(权限位已包含在会话token中,权限变更时token会被吊销)
+    if not user.enable_ai:
         raise HTTPException(status_code=403, detail="您的AI问答权限已被禁用")
     
-    # 检查限流
-    if not chat_limiter.is_allowed(user.student_id):
-        remaining_time = int(chat_limiter.get_remaining_time(user.student_id))
-        raise HTTPException(
-            status_code=429,
-            detail=f"请求过于频繁,请等待{remaining_time}秒后再试"
+    # 多轮对话的回答依赖历史, 不查找也不写入回答缓存
+    history = []
+    if chat_request.context and config.chat_context_enabled:
+        history = chat_context.history(user.student_id)
+
+    # 相同或近似的问题直接回放缓存的回答
+    cached_answer = None if history else answer_cache.lookup(chat_request.question)
+    if cached_answer is not None:
+        check_chat_limit(user.student_id)
+        return StreamingResponse(
+            sse_stream(stream_and_persist(
+                user.student_id, chat_request.question,
+                replay_answer(cached_answer), cache_answer=False
+            ), request),
+            media_type='text/event-stream',
+            headers={**SSE_HEADERS, "X-Answer-Cache": "hit"}
         )
 
-    return StreamingResponse(
-        generate_stream([
-            {"role": "system", "content": CHAT_PROMPT},
-            {"role": "user", "content": chat_request.question}
-        ]),
-        media_type='text/event-stream'
+    # 返回响应前申请排队凭证, 排队人数已满时直接拒绝, 不占用限流配额
+    try:
+        ticket = llm_governor.enqueue(user.student_id)
+    except LLMBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    try:
+        check_chat_limit(user.student_id)
+        messages = build_messages(CHAT_PROMPT, chat_request.question, history)
+    except BaseException:
+        llm_governor.finish(ticket)
+        raise
+    return TicketStreamingResponse(
+        sse_stream(stream_and_persist(
+            user.student_id, chat_request.question,
+            generate_stream(messages, ticket), cache_answer=not history
+        ), request),
+        ticket,
+        media_type='text/event-stream',
+        headers={**SSE_HEADERS, "X-Answer-Cache": "miss", "X-Context-Turns": str(len(history))}
     )
 
 @router.post("/save")
 async def save_chat(request: Request, chat_request: SaveChatRequest):
-    """保存问答记录并检查相关性"""
+    """保存问答记录并检查相关性
+
+    问答记录已由 /stream 在服务端保存, 该接口仅为兼容旧版页面保留,
+    对已保存过的问答直接返回, 不会重复保存。相关性待判断时 is_relevant 为null。
+    """
     user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
+    existing = find_recent_chat_record(user.student_id, chat_request.question, chat_request.answer)
+    if existing is not None:
+        is_irrelevant = existing["is_irrelevant"]
+        return {"success": True, "is_relevant": None if is_irrelevant is None else not is_irrelevant}
+
     try:
-        # 检查问题是否与Python相关
+        # 本地无法判断的问题先保存为待判断状态, 由后台任务批量判断
         is_relevant = await check_relevance(chat_request.question)
-        
-        # 保存问答记录
         save_chat_record(
             user.student_id,
             chat_request.question,
             chat_request.answer,
-            not is_relevant  # 如果不相关,设置is_irrelevant为True
+            None if is_relevant is None else not is_relevant
         )
-        
+
         return {"success": True, "is_relevant": is_relevant}
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/history", response_model=List[ChatHistory])
-async def get_history(request: Request):
-    """获取用户的问答历史记录"""
+async def get_history(
+    request: Request,
+    response: Response,
+    before: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """按时间倒序分页获取用户的问答历史记录
+
+    下一页的游标通过 X-Next-Cursor 响应头返回, 没有更多记录时不返回该响应头。
+    """
     user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     try:
-        history = get_chat_records(user.student_id)
-        return history
+        history, next_cursor = get_chat_records(user.student_id, before, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return history
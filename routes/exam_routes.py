@@ -11,6 +11,7 @@ from db import (
 )
 from questions import check_answer, get_question_by_id
 from auth import auth_required
+from versions import data_versions, conditional
 
 router = APIRouter(prefix="/api/exam")
 
@@ -18,14 +19,16 @@ router = APIRouter(prefix="/api/exam")
 @auth_required()
 async def get_exam_config(request: Request):
     """获取考试配置"""
-    return {
-        "examDuration": config.exam_duration,
-        "questionCount": config.exam_question_count,
-        "practiceThreshold": config.practice_threshold,
-        "passScore": config.pass_score,
-        "questionRangeDays": config.question_range_days,
-        "enableExam": config.enable_exam
-    }
+    settings = config.snapshot
+    # 内容只取决于配置, ETag中已带有配置版本
+    return conditional.respond(request, ("exam_config",), data_versions.etag("exam_config"), lambda: {
+        "examDuration": settings.exam_duration,
+        "questionCount": settings.exam_question_count,
+        "practiceThreshold": settings.practice_threshold,
+        "passScore": settings.pass_score,
+        "questionRangeDays": settings.question_range_days,
+        "enableExam": settings.enable_exam
+    })
 
 @router.get("/check")
 @auth_required()
@@ -38,8 +41,9 @@ async def check_exam(request: Request):
 @auth_required()
 async def start_exam(request: Request):
     """开始新考试"""
+    settings = config.snapshot
     # 检查考试功能是否开启
-    if not config.enable_exam:
+    if not settings.enable_exam:
         raise HTTPException(status_code=403, detail="考试功能当前已关闭")
         
     student_id = request.cookies.get("studentId")
@@ -52,11 +56,11 @@ async def start_exam(request: Request):
     # 获取一周内做对的不重复题目列表
     correct_questions = get_correct_questions_last_week(student_id)
     
-    if len(correct_questions) < config.practice_threshold:
-        raise HTTPException(status_code=400, detail=f"{config.question_range_days}天内做对的题目数量不足{config.practice_threshold}道")
+    if len(correct_questions) < settings.practice_threshold:
+        raise HTTPException(status_code=400, detail=f"{settings.question_range_days}天内做对的题目数量不足{settings.practice_threshold}道")
     
     # 随机选择10道题目
-    selected_questions = random.sample(correct_questions, config.exam_question_count)
+    selected_questions = random.sample(correct_questions, settings.exam_question_count)
     
     # 创建新考试
     return create_exam(student_id, selected_questions)
@@ -78,7 +82,8 @@ async def get_exam_questions_route(request: Request, exam_id: str):
 async def get_exam_history(request: Request):
     """获取学生的历史考试记录"""
     student_id = request.cookies.get("studentId")
-    return get_student_exams(student_id)
+    etag = data_versions.etag("exam_history", student_id, data_versions.student(student_id))
+    return conditional.respond(request, ("exam_history", student_id), etag, lambda: get_student_exams(student_id))
 
 @router.get("/{exam_id}/detail")
 @auth_required()
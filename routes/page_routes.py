@@ -4,8 +4,8 @@ from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import FileResponse, HTMLResponse
 from fastapi.templating import Jinja2Templates
 
-from db import get_db, get_admin_exam_detail
-from models import User, AIChatRecord
+from db import get_db, get_admin_exam_detail, get_chat_records, get_chat_counts
+from models import User
 from auth import auth_required, admin_required
 from config import config
 
@@ -73,35 +73,34 @@ async def read_admin_dashboard():
 @router.get("/admin/chat/{student_id}", response_class=HTMLResponse)
 @admin_required()
 async def read_admin_chat_detail(request: Request, student_id: str):
-    """返回管理员查看的学生问答记录页面"""
+    """返回管理员查看的学生问答记录页面, 只渲染第一页, 其余记录由页面按需加载"""
     with get_db() as db:
         user = db.query(User).filter(User.student_id == student_id).first()
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        
-        # 获取该学生的所有问答记录
-        chats = db.query(AIChatRecord).filter(
-            AIChatRecord.student_id == student_id
-        ).order_by(AIChatRecord.chat_time.desc()).all()
-        
-        # 统计总数和无关问题数
-        total_chats = len(chats)
-        irrelevant_chats = sum(1 for chat in chats if chat.is_irrelevant)
-        
-        return templates.TemplateResponse("admin_chat_detail.html", {
-            "request": request,
-            "student_id": user.student_id,
-            "student_name": user.name,
-            "total_chats": total_chats,
-            "irrelevant_chats": irrelevant_chats,
-            "chats": [{
-                "id": chat.id,
-                "question": chat.question,
-                "answer": chat.answer,
-                "chat_time": chat.chat_time.strftime("%Y-%m-%d %H:%M:%S"),
-                "is_irrelevant": chat.is_irrelevant
-            } for chat in chats]
-        })
+        student_name = user.name
+
+    chats, next_cursor = get_chat_records(student_id)
+    total_chats, irrelevant_chats, pending_chats = get_chat_counts(student_id)
+
+    return templates.TemplateResponse("admin_chat_detail.html", {
+        "request": request,
+        "student_id": student_id,
+        "student_name": student_name,
+        "total_chats": total_chats,
+        "irrelevant_chats": irrelevant_chats,
+        "pending_chats": pending_chats,
+        "next_cursor": next_cursor,
+        "chats": [{
+            "id": chat["id"],
+            "question": chat["question"],
+            "answer": chat["answer"],
+            "chat_time": chat["chat_time"].strftime("%Y-%m-%d %H:%M:%S"),
+            "is_irrelevant": chat["is_irrelevant"],
+            "is_pending": chat["is_pending"],
+            "is_partial": chat["is_partial"]
+        } for chat in chats]
+    })
 
 @router.get("/admin/exam/{exam_id}", response_class=HTMLResponse)
 @admin_required()
@@ -1,9 +1,19 @@
+from datetime import datetime
+
 from fastapi import APIRouter, HTTPException, Request
 
+from config import config
 from db import save_answer_record, get_excluded_questions, get_question_record
+from explanations import mistake_explainer
+from llm_client import llm_governor, LLMBusyError
 from models import AnswerRequest
-from questions import get_random_question, check_answer, get_total_enabled_questions, get_question_by_id
-from auth import auth_required
+from questions import (
+    get_random_question, check_answer, get_total_enabled_questions, get_question_by_id,
+    normalize_answer, encode_answer_mask
+)
+from auth import auth_required, get_current_user
+from utils import chat_limiter
+from versions import data_versions, conditional
 
 router = APIRouter(prefix="/api/practice")
 
@@ -25,13 +35,16 @@ async def get_question(request: Request):
 async def get_stats(request: Request):
     """获取题库统计信息"""
     student_id = request.cookies.get("studentId")
+    # 排除的题目按最近几天的答题记录计算, 旧记录会随时间移出统计范围, ETag每小时更新一次
+    etag = data_versions.etag(
+        "practice_stats", student_id, data_versions.student(student_id),
+        data_versions.questions_version, datetime.now().strftime("%Y%m%d%H")
+    )
     try:
-        total_count = get_total_enabled_questions()
-        excluded_count = len(get_excluded_questions(student_id))
-        return {
-            "total_count": total_count,
-            "excluded_count": excluded_count
-        }
+        return conditional.respond(request, ("practice_stats", student_id), etag, lambda: {
+            "total_count": get_total_enabled_questions(),
+            "excluded_count": len(get_excluded_questions(student_id))
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -71,8 +84,11 @@ async def submit_answer(request: Request, answer_data: AnswerRequest):
         # 检查答案
         is_correct, explanation = check_answer(answer_data.question_id, answer_data.answer)
         
-        # 保存答题记录
-        save_answer_record(student_id, answer_data.question_id, is_correct)
+        # 保存答题记录: 选择题和判断题保存答案位掩码, 其他题型保存规范化的答案
+        question = get_question_by_id(answer_data.question_id, include_answer=True)
+        answer_mask = encode_answer_mask(question, answer_data.answer)
+        student_answer = normalize_answer(question, answer_data.answer) if answer_mask is None else None
+        save_answer_record(student_id, answer_data.question_id, is_correct, student_answer, answer_mask)
         
         return {
             "correct": is_correct,
@@ -82,3 +98,45 @@ async def submit_answer(request: Request, answer_data: AnswerRequest):
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/explain")
+@auth_required()
+async def explain_mistake(request: Request, answer_data: AnswerRequest):
+    """AI讲解错误答案的错因
+
+    讲解按题目和规范化后的错误答案缓存, 已有讲解时直接返回, 不占用AI问答次数。
+    """
+    if not config.explanation_enabled:
+        raise HTTPException(status_code=403, detail="错题AI讲解未开启")
+
+    question = get_question_by_id(answer_data.question_id, include_answer=True)
+    is_correct, _ = check_answer(answer_data.question_id, answer_data.answer)
+    if is_correct:
+        raise HTTPException(status_code=400, detail="回答正确,无需讲解")
+
+    answer_key = normalize_answer(question, answer_data.answer)
+    explanation = await mistake_explainer.lookup(question.id, answer_key)
+    if explanation is not None:
+        return {"explanation": explanation, "cached": True}
+
+    # 需要新生成讲解时与AI问答共用权限和限流
+    user = await get_current_user(request)
+    if not user or not user.enable_ai:
+        raise HTTPException(status_code=403, detail="您的AI问答权限已被禁用")
+    if not chat_limiter.is_allowed(user.student_id):
+        remaining_time = int(chat_limiter.get_remaining_time(user.student_id))
+        raise HTTPException(
+            status_code=429,
+            detail=f"请求过于频繁,请等待{remaining_time}秒后再试"
+        )
+    if llm_governor.is_full:
+        raise HTTPException(status_code=503, detail="当前提问人数过多,请稍后再试")
+
+    try:
+        explanation = await mistake_explainer.generate(question, answer_key, user.student_id)
+    except LLMBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(f"生成错题讲解失败: {e}")
+        raise HTTPException(status_code=503, detail="AI服务暂时不可用,请稍后再试")
+    return {"explanation": explanation, "cached": False}
@@ -1,11 +1,17 @@
-from fastapi import APIRouter, HTTPException, Request
+import asyncio
+from datetime import date
+
+from fastapi import APIRouter, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
 
-from db import get_user_stats, get_user_info, create_or_update_user
+from db import get_user_stats, get_user_info, create_or_update_user, get_codes_signature
 from models import LoginRequest
 from utils import get_client_ip
-from auth import verify_user_ip, auth_required
+from auth import verify_user_ip, auth_required, create_session_token, SESSION_COOKIE
+from activity import activity
 from config import config
+from leaderboard import leaderboard, METRICS
+from versions import data_versions, conditional
 
 router = APIRouter(prefix="/api")
 
@@ -23,6 +29,7 @@ async def logout():
     """用户登出"""
     response = JSONResponse(content={"success": True, "message": "登出成功"})
     response.delete_cookie(key="studentId", path="/")
+    response.delete_cookie(key=SESSION_COOKIE, path="/")
     return response
 
 @router.get("/user/stats")
@@ -30,8 +37,12 @@ async def logout():
 async def get_stats(request: Request):
     """获取用户统计信息"""
     student_id = request.cookies.get("studentId")
+    # 今日认证码按天计算, 发放认证码还取决于codes.txt中是否有剩余
+    etag = data_versions.etag(
+        "user_stats", student_id, data_versions.student(student_id), date.today(), get_codes_signature()
+    )
     try:
-        return get_user_stats(student_id)
+        return conditional.respond(request, ("user_stats", student_id), etag, lambda: get_user_stats(student_id))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -40,22 +51,57 @@ async def get_stats(request: Request):
 async def get_info(request: Request):
     """获取用户信息"""
     student_id = request.cookies.get("studentId")
-    name = get_user_info(student_id)
-    if not name:
-        raise HTTPException(status_code=404, detail="用户不存在")
-    
-    return {"student_id": student_id, "name": name}
+
+    def compute():
+        name = get_user_info(student_id)
+        if not name:
+            raise HTTPException(status_code=404, detail="用户不存在")
+        return {"student_id": student_id, "name": name}
+
+    etag = data_versions.etag("user_info", student_id, data_versions.student(student_id))
+    return conditional.respond(request, ("user_info", student_id), etag, compute)
+
+def _mask_name(name: str) -> str:
+    """排行榜中只显示其他学生的姓"""
+    return name[:1] + "*" * (len(name) - 1) if name else ""
+
+@router.get("/user/leaderboard")
+@auth_required()
+async def get_leaderboard(
+    request: Request,
+    metric: str = Query("mastered_week", pattern="^(" + "|".join(METRICS) + ")$"),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """获取排行榜前几名和自己的名次"""
+    student_id = request.cookies.get("studentId")
+
+    def compute():
+        top = leaderboard.top(metric, limit)
+        return {
+            "metric": metric,
+            "title": METRICS[metric],
+            "top": [{
+                "rank": item["rank"],
+                "name": item["name"] if item["student_id"] == student_id else _mask_name(item["name"]),
+                "score": item["score"],
+                "is_me": item["student_id"] == student_id
+            } for item in top],
+            "me": leaderboard.rank(metric, student_id)
+        }
+
+    return await asyncio.to_thread(compute)
 
 @router.post("/auth/login")
 async def login(request: Request, login_data: LoginRequest):
     """用户登录"""
+    settings = config.snapshot
     if not login_data.student_id:
         raise HTTPException(status_code=400, detail="未提供学号")
         
     # 检查是否是新用户
     name = get_user_info(login_data.student_id)
     if not name:
-        if not config.enable_registration:
+        if not settings.enable_registration:
             raise HTTPException(status_code=403, detail="系统当前不允许新用户注册")
         if not login_data.name:
             return {"success": False, "message": "需要输入姓名"}
@@ -72,9 +118,10 @@ async def login(request: Request, login_data: LoginRequest):
             login_data.student_id,
             login_data.name or name,
             get_client_ip(request),
-            default_ai_permission=config.default_ai_permission,
-            default_exam_permission=config.default_exam_permission
+            default_ai_permission=settings.default_ai_permission,
+            default_exam_permission=settings.default_exam_permission
         )
+        activity.record("logins")
         response = {"success": True, "message": "登录成功"}
         # 创建响应对象
         response = JSONResponse(content=response)
@@ -86,6 +133,14 @@ async def login(request: Request, login_data: LoginRequest):
             samesite="strict",
             secure=False  # 本地开发环境设为False
         )
+        # 签发短期会话token,有效期内的请求无需查询数据库即可完成认证
+        response.set_cookie(
+            key=SESSION_COOKIE,
+            value=create_session_token(login_data.student_id),
+            httponly=True,
+            samesite="strict",
+            secure=False
+        )
         return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -48,6 +48,10 @@ document.addEventListener('DOMContentLoaded', () => {
         return 'text-danger';
     }
 
+    // 当前概览数据和学生进度数据,实时事件在此基础上做增量更新
+    let overview = null;
+    const studentCards = new Map();  // student_id -> { student, card }
+
     // 加载系统概览数据
     async function loadOverview() {
         try {
@@ -58,33 +62,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
             const data = await response.json();
-            
-            // 用户统计
-            document.getElementById('total-users').textContent = formatValue(data.total_users);
-            document.getElementById('active-users').textContent = formatValue(data.active_users);
-            
-            // 练习统计
-            document.getElementById('total-answers').textContent = formatValue(data.total_answers);
-            document.getElementById('today-answers').textContent = formatValue(data.today_answers);
-            document.getElementById('accuracy').textContent = formatPercent(data.accuracy);
-            document.getElementById('today-accuracy').textContent = formatPercent(data.today_accuracy);
-            
-            // 考试统计
-            document.getElementById('total-exams').textContent = formatValue(data.total_exams);
-            document.getElementById('today-exams').textContent = formatValue(data.today_exams);
-            document.getElementById('avg-score').textContent = formatValue(data.avg_score);
-            document.getElementById('today-avg-score').textContent = formatValue(data.today_avg_score);
-            
-            // 认证统计
-            document.getElementById('total-codes').textContent = formatValue(data.total_codes);
-            document.getElementById('today-code-users').textContent = formatValue(data.today_code_users);
-            document.getElementById('remaining-codes').textContent = formatValue(data.remaining_codes);
-            
-            // 问答统计
-            document.getElementById('total-chats').textContent = formatValue(data.total_chats);
-            document.getElementById('today-chats').textContent = formatValue(data.today_chats);
-            document.getElementById('irrelevant-chats').textContent = formatValue(data.irrelevant_chats);
-            document.getElementById('today-irrelevant-chats').textContent = formatValue(data.today_irrelevant_chats);
+            // 由正确率反推正确数,便于后续增量计算
+            data.total_correct = Math.round(data.accuracy * data.total_answers / 100);
+            data.today_correct = Math.round(data.today_accuracy * data.today_answers / 100);
+            overview = data;
+            renderOverview();
         } catch (error) {
             console.error('加载概览数据失败:', error);
             if (error.message.includes('登录已过期')) {
@@ -94,6 +76,39 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // 渲染系统概览数据
+    function renderOverview() {
+        const data = overview;
+        if (!data) return;
+        // 用户统计
+        document.getElementById('total-users').textContent = formatValue(data.total_users);
+        document.getElementById('active-users').textContent = formatValue(data.active_users);
+        
+        // 练习统计
+        document.getElementById('total-answers').textContent = formatValue(data.total_answers);
+        document.getElementById('today-answers').textContent = formatValue(data.today_answers);
+        document.getElementById('accuracy').textContent = formatPercent(data.accuracy);
+        document.getElementById('today-accuracy').textContent = formatPercent(data.today_accuracy);
+        
+        // 考试统计
+        document.getElementById('total-exams').textContent = formatValue(data.total_exams);
+        document.getElementById('today-exams').textContent = formatValue(data.today_exams);
+        document.getElementById('avg-score').textContent = formatValue(data.avg_score);
+        document.getElementById('today-avg-score').textContent = formatValue(data.today_avg_score);
+        
+        // 认证统计
+        document.getElementById('total-codes').textContent = formatValue(data.total_codes);
+        document.getElementById('today-code-users').textContent = formatValue(data.today_code_users);
+        document.getElementById('remaining-codes').textContent = formatValue(data.remaining_codes);
+        
+        // 问答统计
+        document.getElementById('total-chats').textContent = formatValue(data.total_chats);
+        document.getElementById('today-chats').textContent = formatValue(data.today_chats);
+        document.getElementById('irrelevant-chats').textContent = formatValue(data.irrelevant_chats);
+        document.getElementById('today-irrelevant-chats').textContent = formatValue(data.today_irrelevant_chats);
+        document.getElementById('pending-chats').textContent = formatValue(data.pending_chats);
+    }
+
     // 创建进度卡片
     function createProgressCard(student) {
         const card = document.createElement('div');
@@ -137,7 +152,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 </div>
                 <div class="stat-item">
                     <div class="stat-label">无关问题</div>
-                    <div class="stat-value ${student.today_irrelevant_chats > 2 ? 'text-danger' : ''}">${formatValue(student.today_irrelevant_chats)}</div>
+                    <div class="stat-value ${student.today_irrelevant_chats > 2 ? 'text-danger' : ''}">${formatValue(student.today_irrelevant_chats)}${student.today_pending_chats ? `<span class="pending-count" title="相关性待判断">+${student.today_pending_chats}?</span>` : ''}</div>
                 </div>
             </div>
         `;
@@ -155,33 +170,181 @@ document.addEventListener('DOMContentLoaded', () => {
         return card;
     }
 
-    // 加载学生进度数据
-    async function loadProgress() {
+    // 学生进度分页和筛选
+    const PROGRESS_PAGE_SIZE = 50;
+    const PROGRESS_MAX_LIMIT = 200;
+    const progressSearch = document.getElementById('progress-search');
+    const progressIp = document.getElementById('progress-ip');
+    const progressHasCode = document.getElementById('progress-has-code');
+    const progressSort = document.getElementById('progress-sort');
+    const progressOrder = document.getElementById('progress-order');
+    const progressTotalEl = document.getElementById('progress-total');
+    const loadMoreContainer = document.getElementById('progress-load-more-container');
+    const loadMoreBtn = document.getElementById('progress-load-more');
+    let progressCursor = null;
+    let progressTotal = null;
+    let progressRequest = 0;  // 只采用最后一次请求的结果
+
+    function progressParams() {
+        const params = new URLSearchParams({
+            sort: progressSort.value,
+            order: progressOrder.value
+        });
+        const q = progressSearch.value.trim();
+        const ip = progressIp.value.trim();
+        if (q) params.set('q', q);
+        if (ip) params.set('ip', ip);
+        if (progressHasCode.value) params.set('has_code', progressHasCode.value);
+        return params;
+    }
+
+    function renderProgressFooter() {
+        progressTotalEl.textContent = progressTotal === null
+            ? ''
+            : `共 ${progressTotal} 名学生, 已显示 ${studentCards.size} 名`;
+        loadMoreContainer.hidden = !progressCursor;
+    }
+
+    // 加载学生进度数据, append为true时加载下一页,否则重新加载已显示的人数
+    async function loadProgress(append = false) {
+        const params = progressParams();
+        if (append) {
+            if (!progressCursor) return;
+            params.set('cursor', progressCursor);
+            params.set('limit', PROGRESS_PAGE_SIZE);
+        } else {
+            params.set('limit', Math.min(PROGRESS_MAX_LIMIT, Math.max(PROGRESS_PAGE_SIZE, studentCards.size)));
+        }
+        const requestId = ++progressRequest;
+        loadMoreBtn.disabled = true;
         try {
-            const response = await fetch('/api/admin/users/progress', { headers });
+            const response = await fetch(`/api/admin/users/progress?${params}`, { headers });
             if (response.status === 401) {
                 localStorage.removeItem('adminToken');
                 window.location.href = '/admin/login';
                 return;
             }
-            const students = await response.json();
-            
-            progressWaterfall.innerHTML = '';
-            students.forEach(student => {
-                progressWaterfall.appendChild(createProgressCard(student));
+            const data = await response.json();
+            if (requestId !== progressRequest) return;
+
+            if (!append) {
+                progressWaterfall.innerHTML = '';
+                studentCards.clear();
+                progressTotal = data.total;
+            }
+            data.items.forEach(student => {
+                if (studentCards.has(student.student_id)) return;
+                const card = createProgressCard(student);
+                studentCards.set(student.student_id, { student, card });
+                progressWaterfall.appendChild(card);
             });
+            progressCursor = data.next_cursor;
+            renderProgressFooter();
         } catch (error) {
             console.error('加载进度数据失败:', error);
             if (error.message.includes('登录已过期')) {
                 // API.js已经处理了跳转，这里不需要额外处理
                 return;
             }
+        } finally {
+            if (requestId === progressRequest) loadMoreBtn.disabled = false;
         }
     }
 
+    // 筛选条件变化时从第一页重新加载
+    function reloadProgress() {
+        studentCards.clear();
+        progressCursor = null;
+        loadProgress();
+    }
+
+    let searchTimer = null;
+    [progressSearch, progressIp].forEach(input => {
+        input.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(reloadProgress, 300);
+        });
+    });
+    [progressHasCode, progressSort, progressOrder].forEach(select => {
+        select.addEventListener('change', reloadProgress);
+    });
+    loadMoreBtn.addEventListener('click', () => loadProgress(true));
+
     // 显示学生详情
+    // 热力图每个格子的边长和间距(像素)
+    const HEATMAP_CELL = 11;
+    const HEATMAP_GAP = 2;
+
+    function parseDay(value) {
+        const [year, month, day] = value.split('-').map(Number);
+        return new Date(year, month - 1, day);
+    }
+
+    function formatDay(day) {
+        return `${day.getFullYear()}-${String(day.getMonth() + 1).padStart(2, '0')}-${String(day.getDate()).padStart(2, '0')}`;
+    }
+
+    // 按练习题数分为5级, 以有活动日期的最大值为参照
+    function heatmapLevel(answers, max) {
+        if (!answers) return 0;
+        return Math.min(4, Math.ceil(answers / max * 4));
+    }
+
+    function renderHeatmap(data) {
+        const days = new Map(data.days.map(day => [day.date, day]));
+        const max = Math.max(1, ...data.days.map(day => day.answers));
+        const start = parseDay(data.start);
+        const end = parseDay(data.end);
+        // 每列一周, 从周一开始
+        const first = new Date(start);
+        first.setDate(first.getDate() - (first.getDay() + 6) % 7);
+        const size = HEATMAP_CELL + HEATMAP_GAP;
+        const cells = [];
+        let week = 0;
+        for (const day = new Date(first); day <= end; day.setDate(day.getDate() + 1)) {
+            const row = (day.getDay() + 6) % 7;
+            if (day >= start) {
+                const key = formatDay(day);
+                const counts = days.get(key);
+                const title = counts
+                    ? `${key}\n` + Object.entries(data.counters).map(([counter, label]) => `${label}: ${counts[counter]}`).join('\n')
+                    : `${key}\n无活动`;
+                cells.push(`<rect x="${week * size}" y="${row * size}" width="${HEATMAP_CELL}" height="${HEATMAP_CELL}" ` +
+                    `class="level-${heatmapLevel(counts ? counts.answers : 0, max)}"><title>${title}</title></rect>`);
+            }
+            if (row === 6) week++;
+        }
+        const width = (week + 1) * size;
+        document.getElementById('detail-heatmap').innerHTML =
+            `<svg width="${width}" height="${7 * size}">${cells.join('')}</svg>`;
+
+        const total = counter => data.days.reduce((sum, day) => sum + day[counter], 0);
+        document.getElementById('detail-heatmap-summary').textContent =
+            `${data.start} 至 ${data.end}: 活跃${data.days.length}天, 练习${total('answers')}题, ` +
+            `掌握${total('mastered')}题, 考试${total('exams')}次, AI提问${total('chats')}次`;
+    }
+
+    let heatmapStudentId = null;
+
+    async function loadHeatmap(studentId) {
+        heatmapStudentId = studentId;
+        document.getElementById('detail-heatmap').innerHTML = '';
+        document.getElementById('detail-heatmap-summary').textContent = '';
+        try {
+            const response = await fetch(`/api/admin/users/${studentId}/timeline`, { headers });
+            // 响应返回前可能已经打开了其他学生的详情
+            if (response.ok && heatmapStudentId === studentId) {
+                renderHeatmap(await response.json());
+            }
+        } catch (error) {
+            console.error('加载活动热力图失败:', error);
+        }
+    }
+
     async function showStudentDetail(studentId) {
         try {
+            // 热力图与详情并行加载
+            loadHeatmap(studentId);
             const response = await fetch(`/api/admin/users/${studentId}/detail`, { headers });
             const data = await response.json();
             
@@ -288,75 +451,357 @@ document.addEventListener('DOMContentLoaded', () => {
         window.location.href = '/admin/login';
     });
 
-    let autoRefreshIntervalId = null;
+    // 回答缓存统计
+    const answerCacheToggle = document.getElementById('answer-cache-toggle');
+
+    function renderAnswerCache(stats) {
+        document.getElementById('answer-cache-hit-rate').textContent =
+            stats.enabled ? formatPercent(stats.hit_rate) : '已关闭';
+        document.getElementById('answer-cache-size').textContent = `${stats.size}条`;
+        answerCacheToggle.checked = stats.enabled;
+    }
+
+    async function loadAnswerCache() {
+        try {
+            const response = await fetch('/api/admin/answer-cache', { headers });
+            if (response.ok) {
+                renderAnswerCache(await response.json());
+            }
+        } catch (error) {
+            console.error('加载回答缓存统计失败:', error);
+        }
+    }
+
+    // 问答事件较密集, 合并后再刷新缓存统计
+    let answerCacheTimer = null;
+    function scheduleAnswerCacheRefresh() {
+        if (answerCacheTimer) return;
+        answerCacheTimer = setTimeout(() => {
+            answerCacheTimer = null;
+            loadAnswerCache();
+        }, 5000);
+    }
+
+    answerCacheToggle.addEventListener('change', async () => {
+        try {
+            const response = await fetch('/api/admin/answer-cache', {
+                method: 'POST',
+                headers,
+                body: JSON.stringify({ enable: answerCacheToggle.checked })
+            });
+            if (!response.ok) throw new Error('切换回答缓存失败');
+            renderAnswerCache(await response.json());
+        } catch (error) {
+            console.error('切换回答缓存失败:', error);
+            answerCacheToggle.checked = !answerCacheToggle.checked;
+            alert('切换回答缓存失败,请重试');
+        }
+    });
+
+    // 实时活动走势
+    const activityRange = document.getElementById('activity-range');
+    let activityTimer = null;
+
+    function sparklineSVG(values, width = 200, height = 40) {
+        const max = Math.max(1, ...values);
+        const step = values.length > 1 ? width / (values.length - 1) : 0;
+        const points = values.map((value, i) =>
+            `${(i * step).toFixed(1)},${(height - 2 - value / max * (height - 4)).toFixed(1)}`
+        ).join(' ');
+        return `<svg viewBox="0 0 ${width} ${height}" preserveAspectRatio="none"><polyline points="${points}"></polyline></svg>`;
+    }
+
+    function renderActivity(data) {
+        const start = new Date(data.start * 1000);
+        const unit = data.interval >= 3600 ? `${data.interval / 3600}小时` : `${data.interval / 60}分钟`;
+        document.getElementById('activity-sparklines').innerHTML = Object.entries(data.labels).map(([event, label]) => {
+            const values = data.series[event];
+            return `
+                <div class="sparkline-card" title="自 ${formatDateTime(start)} 起, 每${unit}一个点">
+                    <div class="sparkline-title">${label}<span>${data.totals[event]}</span></div>
+                    ${sparklineSVG(values)}
+                    <div class="sparkline-latest">最近${unit}: ${values[values.length - 1]}</div>
+                </div>
+            `;
+        }).join('');
+    }
+
+    async function loadActivity() {
+        const [kind, amount] = activityRange.value.split(':');
+        const url = kind === 'live'
+            ? `/api/admin/activity?minutes=${amount}`
+            : `/api/admin/activity/history?hours=${amount}`;
+        try {
+            const response = await fetch(url, { headers });
+            if (response.ok) {
+                renderActivity(await response.json());
+            }
+        } catch (error) {
+            console.error('加载实时活动失败:', error);
+        }
+    }
+
+    // 每分钟的数据来自服务器内存, 页面可见时每15秒刷新; 历史数据每5分钟刷新
+    function scheduleActivity() {
+        clearInterval(activityTimer);
+        const interval = activityRange.value.startsWith('live') ? 15000 : 300000;
+        activityTimer = setInterval(() => {
+            if (!document.hidden) loadActivity();
+        }, interval);
+    }
+
+    activityRange.addEventListener('change', () => {
+        loadActivity();
+        scheduleActivity();
+    });
+    loadActivity();
+    scheduleActivity();
 
     // 刷新数据函数
     function refreshData() {
-        loadOverview();
-        loadProgress();
+        return Promise.all([loadOverview(), loadProgress(), loadAnswerCache()]);
     }
 
-    // 启动自动刷新
-    function startAutoRefresh(interval) {
-        if (autoRefreshIntervalId) {
-            clearInterval(autoRefreshIntervalId);
+    // 重新渲染单个学生的进度卡片
+    function updateStudentCard(studentId, update) {
+        const entry = studentCards.get(studentId);
+        if (!entry) {
+            // 不在已加载的页中, 之后翻页或刷新时会拿到最新数据
+            return;
         }
-        autoRefreshIntervalId = setInterval(refreshData, interval);
+        update(entry.student);
+        const student = entry.student;
+        student.accuracy = student.total_questions > 0
+            ? student.correct_questions / student.total_questions * 100
+            : 0;
+        const card = createProgressCard(student);
+        entry.card.replaceWith(card);
+        entry.card = card;
     }
 
-    // 停止自动刷新
-    function stopAutoRefresh() {
-        if (autoRefreshIntervalId) {
-            clearInterval(autoRefreshIntervalId);
-            autoRefreshIntervalId = null;
+    // 计算增量平均值
+    function addToAverage(avg, count, value) {
+        return Math.round(((avg || 0) * count + value) / (count + 1) * 100) / 100;
+    }
+
+    // 应用一条增量事件
+    function applyEvent(event) {
+        const o = overview;
+        switch (event.type) {
+            case 'answer':
+                if (o) {
+                    o.total_answers += 1;
+                    o.today_answers += 1;
+                    if (event.is_correct) {
+                        o.total_correct += 1;
+                        o.today_correct += 1;
+                    }
+                    o.accuracy = o.total_correct / o.total_answers * 100;
+                    o.today_accuracy = o.today_correct / o.today_answers * 100;
+                }
+                updateStudentCard(event.student_id, s => {
+                    s.total_questions += 1;
+                    if (event.is_correct) s.correct_questions += 1;
+                });
+                break;
+            case 'chat':
+                scheduleAnswerCacheRefresh();
+                if (o) {
+                    o.total_chats += 1;
+                    o.today_chats += 1;
+                    if (event.pending) {
+                        o.pending_chats += 1;
+                    } else if (event.is_irrelevant) {
+                        o.irrelevant_chats += 1;
+                        o.today_irrelevant_chats += 1;
+                    }
+                }
+                updateStudentCard(event.student_id, s => {
+                    s.chat_count += 1;
+                    if (event.pending) s.today_pending_chats += 1;
+                    else if (event.is_irrelevant) s.today_irrelevant_chats += 1;
+                });
+                break;
+            case 'chat_relevance': {
+                // 待判断的记录得到结果时, 判为相关不影响无关数
+                const delta = event.is_irrelevant ? 1 : (event.was_pending ? 0 : -1);
+                if (o) {
+                    o.irrelevant_chats += delta;
+                    if (event.today) o.today_irrelevant_chats += delta;
+                    if (event.was_pending) o.pending_chats = Math.max(0, o.pending_chats - 1);
+                }
+                if (event.today) {
+                    updateStudentCard(event.student_id, s => {
+                        s.today_irrelevant_chats = Math.max(0, s.today_irrelevant_chats + delta);
+                        if (event.was_pending) s.today_pending_chats = Math.max(0, s.today_pending_chats - 1);
+                    });
+                }
+                break;
+            }
+            case 'exam_finished':
+                if (o) {
+                    o.avg_score = addToAverage(o.avg_score, o.total_exams, event.score);
+                    o.today_avg_score = addToAverage(o.today_avg_score, o.today_exams, event.score);
+                    o.total_exams += 1;
+                    o.today_exams += 1;
+                }
+                updateStudentCard(event.student_id, s => {
+                    s.exam_count += 1;
+                    s.last_exam_score = event.score;
+                });
+                break;
+            case 'code':
+                if (o) {
+                    o.total_codes += 1;
+                    o.today_code_users += 1;
+                    o.remaining_codes = Math.max(0, o.remaining_codes - 1);
+                }
+                updateStudentCard(event.student_id, s => { s.has_code = true; });
+                break;
+            case 'user':
+                if ('enable_ai' in event || 'enable_exam' in event) {
+                    updateStudentCard(event.student_id, s => {
+                        if ('enable_ai' in event) s.enable_ai = event.enable_ai;
+                        if ('enable_exam' in event) s.enable_exam = event.enable_exam;
+                    });
+                } else {
+                    // 登录、绑定IP等变化会影响排序和活跃人数,合并后统一重新拉取
+                    scheduleResync();
+                }
+                return;
+            case 'user_deleted': {
+                const entry = studentCards.get(event.student_id);
+                if (entry) {
+                    entry.card.remove();
+                    studentCards.delete(event.student_id);
+                    if (progressTotal !== null) progressTotal = Math.max(0, progressTotal - 1);
+                    renderProgressFooter();
+                }
+                if (o) o.total_users = Math.max(0, o.total_users - 1);
+                break;
+            }
+            case 'resync':
+                scheduleResync(0);
+                return;
+            default:
+                return;
         }
+        renderOverview();
     }
 
-    // 为控件添加事件监听器
-    const refreshBtn = document.getElementById('refresh-btn');
-    const autoRefreshToggle = document.getElementById('auto-refresh-toggle');
-    const refreshIntervalSelect = document.getElementById('refresh-interval');
-    const customIntervalInput = document.getElementById('custom-interval');
+    // 合并短时间内的多次全量刷新请求
+    let resyncTimer = null;
+    function scheduleResync(delay = 3000) {
+        if (resyncTimer) return;
+        resyncTimer = setTimeout(async () => {
+            resyncTimer = null;
+            await refreshData();
+        }, delay);
+    }
 
-    if (refreshBtn) {
-        refreshBtn.addEventListener('click', refreshData);
+    // 实时推送连接
+    let liveController = null;
+    let liveRetryDelay = 1000;
+    const liveToggle = document.getElementById('live-toggle');
+    const liveStatus = document.getElementById('live-status');
+
+    function setLiveStatus(text, connected) {
+        if (!liveStatus) return;
+        liveStatus.textContent = text;
+        liveStatus.classList.toggle('connected', connected);
     }
 
-    if (autoRefreshToggle && refreshIntervalSelect && customIntervalInput) {
-        autoRefreshToggle.addEventListener('change', () => {
-            const isEnabled = autoRefreshToggle.checked;
-            refreshIntervalSelect.disabled = !isEnabled;
-            
-            if (isEnabled) {
-                handleIntervalChange();
-            } else {
-                customIntervalInput.style.display = 'none';
-                customIntervalInput.disabled = true;
-                stopAutoRefresh();
+    // 解析一个SSE事件块
+    function parseSSE(block) {
+        let eventType = 'message';
+        const dataLines = [];
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                eventType = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trimStart());
             }
         });
+        if (!dataLines.length) return null;
+        return { type: eventType, data: JSON.parse(dataLines.join('\n')) };
+    }
 
-        refreshIntervalSelect.addEventListener('change', handleIntervalChange);
-        customIntervalInput.addEventListener('input', handleIntervalChange);
+    async function connectLive() {
+        if (liveController) return;
+        const controller = new AbortController();
+        liveController = controller;
+        try {
+            const response = await fetch('/api/admin/events', { headers, signal: controller.signal });
+            if (response.status === 401) {
+                localStorage.removeItem('adminToken');
+                window.location.href = '/admin/login';
+                return;
+            }
+            if (!response.ok) throw new Error('连接实时推送失败');
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let syncing = true;
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let index;
+                while ((index = buffer.indexOf('\n\n')) >= 0) {
+                    const block = buffer.slice(0, index);
+                    buffer = buffer.slice(index + 2);
+                    const message = parseSSE(block);
+                    if (!message) continue;  // 心跳
+                    if (message.type === 'hello') {
+                        // 订阅成功后拉取一次全量数据,之后只处理增量
+                        setLiveStatus('实时', true);
+                        liveRetryDelay = 1000;
+                        syncing = true;
+                        refreshData().finally(() => { syncing = false; });
+                    } else if (!syncing) {
+                        applyEvent(message.data);
+                    }
+                }
+            }
+        } catch (error) {
+            if (controller.signal.aborted) return;
+            console.error('实时推送连接中断:', error);
+        } finally {
+            if (liveController === controller) liveController = null;
+        }
+        // 连接断开后按退避时间重连
+        if (liveToggle && liveToggle.checked) {
+            setLiveStatus('重连中...', false);
+            setTimeout(connectLive, liveRetryDelay);
+            liveRetryDelay = Math.min(liveRetryDelay * 2, 30000);
+        }
     }
 
-    function handleIntervalChange() {
-        const selectedValue = refreshIntervalSelect.value;
+    function disconnectLive() {
+        if (liveController) {
+            liveController.abort();
+            liveController = null;
+        }
+        setLiveStatus('已暂停', false);
+    }
+
+    // 为控件添加事件监听器
+    const refreshBtn = document.getElementById('refresh-btn');
 
-        if (selectedValue === 'custom') {
-            customIntervalInput.style.display = 'inline-block';
-            customIntervalInput.disabled = false;
-            const customSeconds = parseInt(customIntervalInput.value, 10);
-            if (customSeconds > 0) {
-                startAutoRefresh(customSeconds * 1000);
+    if (refreshBtn) {
+        refreshBtn.addEventListener('click', refreshData);
+    }
+
+    if (liveToggle) {
+        liveToggle.addEventListener('change', () => {
+            if (liveToggle.checked) {
+                connectLive();
             } else {
-                stopAutoRefresh();
+                disconnectLive();
             }
-        } else {
-            customIntervalInput.style.display = 'none';
-            customIntervalInput.disabled = true;
-            startAutoRefresh(parseInt(selectedValue, 10));
-        }
+        });
     }
 
     // 打开问答记录详情
@@ -421,9 +866,12 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    // 初始化
-    loadOverview();
-    loadProgress();
+    // 初始化: 建立实时推送连接,连接成功后会拉取一次全量数据
+    if (liveToggle && liveToggle.checked) {
+        connectLive();
+    } else {
+        refreshData();
+    }
 });
 
 // 打开考试详情
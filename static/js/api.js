@@ -62,6 +62,17 @@ const API = {
         });
     },
 
+    // AI讲解错误答案
+    async explainMistake(questionId, answer) {
+        return this.request('/api/practice/explain', {
+            method: 'POST',
+            body: JSON.stringify({
+                question_id: questionId,
+                answer: answer
+            })
+        });
+    },
+
     // 开始测试
     async startExam() {
         return this.request('/api/exam/start', {
@@ -23,6 +23,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const chatMessages = document.getElementById('chat-messages');
     const chatInput = document.getElementById('chat-input');
     const sendBtn = document.getElementById('send-btn');
+    const contextToggle = document.getElementById('context-toggle');
     const historyList = document.getElementById('history-list');
     const studentId = document.getElementById('student-id');
     const studentName = document.getElementById('student-name');
@@ -114,12 +115,12 @@ document.addEventListener('DOMContentLoaded', () => {
             const response = await fetch('/api/chat/stream', {
                 method: 'POST',
                 headers,
-                body: JSON.stringify({ question })
+                body: JSON.stringify({ question, context: contextToggle.checked })
             });
 
             if (!response.ok) {
                 const data = await response.json();
-                if (response.status === 429 || response.status === 403) {
+                if (response.status === 429 || response.status === 403 || response.status === 503) {
                     throw new Error(data.detail);
                 }
                 throw new Error('发送消息失败');
@@ -127,46 +128,75 @@ document.addEventListener('DOMContentLoaded', () => {
 
             const reader = response.body.getReader();
             const decoder = new TextDecoder();
+            let buffer = '';
             let answer = '';
+            let errorText = null;
 
-            while (true) {
-                const { value, done } = await reader.read();
-                if (done) break;
-                
-                const text = decoder.decode(value);
-                answer += text;
+            // 渲染当前已收到的回答
+            const renderAnswer = () => {
                 contentDiv.innerHTML = marked.parse(answer);
                 // 初始化新添加内容的代码高亮
                 contentDiv.querySelectorAll('pre code').forEach((block) => {
                     hljs.highlightElement(block);
                 });
                 chatMessages.scrollTop = chatMessages.scrollHeight;
-            }
+            };
+
+            // 处理一个SSE事件
+            const handleEvent = (eventType, data) => {
+                if (eventType === 'queue') {
+                    // 需要排队时先显示排队位置, 收到回答后被替换
+                    contentDiv.innerHTML = `<span class="queue-hint">提问人数较多,正在排队(第${data.position}位)...</span>`;
+                } else if (eventType === 'error') {
+                    errorText = data.message;
+                } else if (eventType === 'message') {
+                    answer += data.text;
+                    renderAnswer();
+                }
+            };
 
-            // 保存问答记录
-            const saveResponse = await fetch('/api/chat/save', {
-                method: 'POST',
-                headers,
-                body: JSON.stringify({
-                    question,
-                    answer
-                })
-            });
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
 
-            if (!saveResponse.ok) {
-                if (saveResponse.status === 429) {
-                    const data = await saveResponse.json();
-                    throw new Error(data.detail);
+                buffer += decoder.decode(value, { stream: true });
+                // 事件之间以空行分隔, 最后一段可能还不完整
+                const blocks = buffer.split('\n\n');
+                buffer = blocks.pop();
+                for (const block of blocks) {
+                    let eventType = 'message';
+                    const dataLines = [];
+                    for (const line of block.split('\n')) {
+                        if (line.startsWith('event: ')) {
+                            eventType = line.slice(7);
+                        } else if (line.startsWith('data: ')) {
+                            dataLines.push(line.slice(6));
+                        }
+                    }
+                    // 注释行(心跳)没有数据
+                    if (dataLines.length) {
+                        handleEvent(eventType, JSON.parse(dataLines.join('\n')));
+                    }
+                }
+            }
+
+            if (errorText) {
+                if (answer) {
+                    answer += `\n\n> ${errorText}`;
+                    renderAnswer();
+                } else {
+                    contentDiv.textContent = errorText;
                 }
-                console.error('保存问答记录失败');
             }
 
+            // 问答记录由服务端在回答结束时保存
             // 刷新历史记录
             loadHistory();
         } catch (error) {
             console.error('发送消息失败:', error);
             loadingIndicator.remove();
             const errorMessage = error.message.includes('请等待') || error.message.includes('权限已被禁用')
+                || error.message.includes('人数过多')
                 ? error.message 
                 : '抱歉,发送消息失败,请重试';
             addMessage(errorMessage, false);
@@ -183,69 +213,98 @@ document.addEventListener('DOMContentLoaded', () => {
         return new Date(date).toLocaleDateString('zh-CN');
     }
 
-    // 加载历史记录
-    async function loadHistory() {
-        try {
-            const response = await fetch('/api/chat/history', { headers });
-            let data = await response.json();
-            
-            // 按时间顺序排序
-            data.sort((a, b) => new Date(a.chat_time) - new Date(b.chat_time));
-            
-            // 按日期分组
-            const groupedData = data.reduce((groups, chat) => {
-                const date = formatDate(chat.chat_time);
-                if (!groups[date]) {
-                    groups[date] = [];
-                }
-                groups[date].push(chat);
-                return groups;
-            }, {});
-
-            // 清空聊天区域,只保留系统欢迎消息
-            chatMessages.innerHTML = `
-                <div class="system-message">
-                    欢迎使用AI问答功能!我是你的Python学习助手,请问有什么可以帮你的吗?
+    // 已加载的历史记录(按时间顺序)和更早一页的游标
+    let historyChats = [];
+    let historyCursor = null;
+
+    // 获取一页历史记录(按时间倒序)
+    async function fetchHistoryPage(before = null) {
+        const url = before ? `/api/chat/history?before=${encodeURIComponent(before)}` : '/api/chat/history';
+        const response = await fetch(url, { headers });
+        const chats = await response.json();
+        return { chats, nextCursor: response.headers.get('X-Next-Cursor') };
+    }
+
+    // 渲染已加载的历史记录
+    function renderHistory() {
+        const data = historyChats;
+
+        // 按日期分组
+        const groupedData = data.reduce((groups, chat) => {
+            const date = formatDate(chat.chat_time);
+            if (!groups[date]) {
+                groups[date] = [];
+            }
+            groups[date].push(chat);
+            return groups;
+        }, {});
+
+        // 清空聊天区域,只保留系统欢迎消息
+        chatMessages.innerHTML = `
+            <div class="system-message">
+                欢迎使用AI问答功能!我是你的Python学习助手,请问有什么可以帮你的吗?
+            </div>
+        `;
+        if (historyCursor) {
+            chatMessages.innerHTML += `
+                <button class="load-more-btn" data-action="load-more">加载更早的记录</button>
+            `;
+        }
+
+        // 添加历史消息到聊天区域
+        Object.entries(groupedData).forEach(([date, chats]) => {
+            // 添加日期分割线
+            chatMessages.innerHTML += `
+                <div class="date-divider">
+                    <span>${date}</span>
                 </div>
             `;
 
-            // 添加历史消息到聊天区域
-            Object.entries(groupedData).forEach(([date, chats]) => {
-                // 添加日期分割线
+            // 添加该日期下的所有对话
+            chats.forEach(chat => {
+                const messageId = `message-${chat.id}`;
                 chatMessages.innerHTML += `
-                    <div class="date-divider">
-                        <span>${date}</span>
-                    </div>
+                <div id="${messageId}" class="message user">
+                    <div class="message-content">${chat.question}</div>
+                    <div class="message-time">${formatTime(chat.chat_time)}</div>
+                </div>
+                <div class="message assistant">
+                    <div class="message-content">${marked.parse(chat.answer)}</div>
+                    <div class="message-time">${formatTime(chat.chat_time)}</div>
+                </div>
                 `;
+            });
 
-                // 添加该日期下的所有对话
-                chats.forEach(chat => {
-                    const messageId = `message-${chat.id}`;
-                    chatMessages.innerHTML += `
-                    <div id="${messageId}" class="message user">
-                        <div class="message-content">${chat.question}</div>
-                        <div class="message-time">${formatTime(chat.chat_time)}</div>
-                    </div>
-                    <div class="message assistant">
-                        <div class="message-content">${marked.parse(chat.answer)}</div>
-                        <div class="message-time">${formatTime(chat.chat_time)}</div>
-                    </div>
-                    `;
-                });
-
-                // 初始化历史消息的代码高亮
-                chatMessages.querySelectorAll('pre code').forEach((block) => {
-                    hljs.highlightElement(block);
-                });
+            // 初始化历史消息的代码高亮
+            chatMessages.querySelectorAll('pre code').forEach((block) => {
+                hljs.highlightElement(block);
             });
+        });
 
-            // 更新右侧历史记录列表(倒序显示)
-            historyList.innerHTML = [...data].reverse().map(chat => `
-                <div class="history-item" onclick="scrollToMessage('message-${chat.id}')">
-                    <div class="question">${chat.question}</div>
-                    <div class="time">${new Date(chat.chat_time).toLocaleString('zh-CN')}</div>
-                </div>
-            `).join('');
+        // 更新右侧历史记录列表(倒序显示)
+        historyList.innerHTML = [...data].reverse().map(chat => `
+            <div class="history-item" onclick="scrollToMessage('message-${chat.id}')">
+                <div class="question">${chat.question}</div>
+                <div class="time">${new Date(chat.chat_time).toLocaleString('zh-CN')}</div>
+            </div>
+        `).join('') + (historyCursor
+            ? '<button class="load-more-btn" data-action="load-more">加载更早的记录</button>'
+            : '');
+    }
+
+    // 加载最新的历史记录, 已加载过的更早记录保留
+    async function loadHistory() {
+        try {
+            const page = await fetchHistoryPage();
+            const latest = page.chats.reverse();
+            if (!historyChats.length) {
+                historyChats = latest;
+                historyCursor = page.nextCursor;
+            } else {
+                const lastId = historyChats[historyChats.length - 1].id;
+                historyChats = historyChats.concat(latest.filter(chat => chat.id > lastId));
+            }
+            renderHistory();
 
             // 滚动到底部
             chatMessages.scrollTop = chatMessages.scrollHeight;
@@ -254,6 +313,30 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // 加载更早的一页历史记录
+    async function loadMoreHistory() {
+        if (!historyCursor) return;
+        try {
+            const page = await fetchHistoryPage(historyCursor);
+            historyChats = page.chats.reverse().concat(historyChats);
+            historyCursor = page.nextCursor;
+            // 保持当前可见内容的位置不变
+            const offsetFromBottom = chatMessages.scrollHeight - chatMessages.scrollTop;
+            renderHistory();
+            chatMessages.scrollTop = chatMessages.scrollHeight - offsetFromBottom;
+        } catch (error) {
+            console.error('加载历史记录失败:', error);
+        }
+    }
+
+    [chatMessages, historyList].forEach(container => {
+        container.addEventListener('click', (e) => {
+            if (e.target.closest('[data-action="load-more"]')) {
+                loadMoreHistory();
+            }
+        });
+    });
+
     // 加载用户信息
     async function loadUserInfo() {
         try {
@@ -270,6 +353,12 @@ document.addEventListener('DOMContentLoaded', () => {
     // 事件监听
     sendBtn.addEventListener('click', sendMessage);
 
+    // 记住连续对话开关
+    contextToggle.checked = localStorage.getItem('chatContext') === '1';
+    contextToggle.addEventListener('change', () => {
+        localStorage.setItem('chatContext', contextToggle.checked ? '1' : '0');
+    });
+
     chatInput.addEventListener('keydown', (e) => {
         if (e.key === 'Enter' && !e.shiftKey) {
             e.preventDefault();
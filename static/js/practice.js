@@ -31,6 +31,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const result = document.querySelector('.result');
     const resultText = document.querySelector('.result-text');
     const explanation = document.querySelector('.explanation');
+    const aiExplainBtn = document.getElementById('ai-explain-btn');
+    const aiExplanation = document.querySelector('.ai-explanation');
     
     // 统计元素
     const totalCount = document.getElementById('total-count');
@@ -39,6 +41,8 @@ document.addEventListener('DOMContentLoaded', () => {
     
     // 当前题目信息
     let currentQuestion = null;
+    // 最近一次提交的答案, 用于请求AI讲解
+    let lastAnswer = null;
     
     // 禁用右键菜单
     document.addEventListener('contextmenu', e => e.preventDefault());
@@ -123,6 +127,10 @@ document.addEventListener('DOMContentLoaded', () => {
         essayInput.style.display = 'none';
         result.style.display = 'none';
         nextBtn.style.display = 'none';
+        aiExplainBtn.style.display = 'none';
+        aiExplainBtn.disabled = false;
+        aiExplanation.style.display = 'none';
+        aiExplanation.textContent = '';
         
         // 清除选项
         choiceOptions.innerHTML = '';
@@ -223,6 +231,9 @@ document.addEventListener('DOMContentLoaded', () => {
             document.querySelector('.explanation').textContent = explanation;
         }
         
+        // 答错时可以请求AI讲解错因
+        aiExplainBtn.style.display = isCorrect ? 'none' : 'inline-block';
+        
         // 更新统计
         totalCount.textContent = parseInt(totalCount.textContent) + 1;
         if (isCorrect) {
@@ -300,6 +311,7 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             submitBtn.disabled = true;
             const response = await API.submitAnswer(currentQuestion.id, answer);
+            lastAnswer = answer;
             
             showResult(response.correct, response.explanation);
         } catch (error) {
@@ -310,8 +322,27 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
+    // 请求AI讲解错因
+    async function explainMistake() {
+        aiExplainBtn.disabled = true;
+        aiExplainBtn.textContent = 'AI讲解生成中...';
+        try {
+            const response = await API.explainMistake(currentQuestion.id, lastAnswer);
+            aiExplanation.textContent = response.explanation;
+            aiExplanation.style.display = 'block';
+            aiExplainBtn.style.display = 'none';
+        } catch (error) {
+            console.error('获取AI讲解失败:', error);
+            showMessage('获取AI讲解失败: ' + error.message);
+            aiExplainBtn.disabled = false;
+        } finally {
+            aiExplainBtn.textContent = 'AI讲解错因';
+        }
+    }
+    
     // 事件监听
     submitBtn.addEventListener('click', submitAnswer);
+    aiExplainBtn.addEventListener('click', explainMistake);
     nextBtn.addEventListener('click', () => {
         submitBtn.style.display = 'block';
         clearMessage();
@@ -0,0 +1,21 @@
+"""测试环境
+
+应用模块在导入时读取 config.json 并在基础路径下创建 data 目录和数据库。这里在导入任何应用模块之前
+把基础路径指向临时目录并写入默认配置, 测试不依赖也不修改仓库中的文件。
+"""
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import paths
+
+BASE_PATH = tempfile.mkdtemp(prefix="openjudge-test-")
+with open(os.path.join(BASE_PATH, "config.json"), "w", encoding="utf-8") as f:
+    json.dump({}, f)
+
+paths.get_base_path = lambda: BASE_PATH
@@ -0,0 +1,70 @@
+"""多轮对话上下文的截断测试"""
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import chat_context
+from chat_context import ChatContext, MESSAGE_OVERHEAD
+
+# 约1100个token的回答
+LONG_ANSWER = "答" * 1800
+
+@pytest.fixture
+def context(monkeypatch):
+    """使用默认配置和内存中的问答记录的历史窗口"""
+    records = []
+    monkeypatch.setattr(chat_context, "config", SimpleNamespace(
+        chat_context_max_turns=6,
+        chat_context_token_budget=2000,
+        chat_context_window_minutes=60
+    ))
+    # 与 db.get_recent_chat_turns 相同: 取ID大于 after_id 且未被标记为无关的最新 limit 条, 按时间正序返回
+    monkeypatch.setattr(chat_context, "get_recent_chat_turns", lambda student_id, since, after_id=0, limit=20: [
+        record for record in records if record["id"] > after_id and not record["is_irrelevant"]
+    ][-limit:])
+
+    ctx = ChatContext()
+
+    def add_turn(question: str, answer: str):
+        records.append({"id": len(records) + 1, "question": question, "answer": answer,
+                        "chat_time": datetime.now(), "is_irrelevant": None})
+        ctx.mark_stale("s1")
+
+    ctx.add_turn = add_turn
+    ctx.records = records
+    return ctx
+
+def test_previous_turn_always_present(context):
+    context.history("s1")
+    for n in range(1, 9):
+        context.add_turn(f"问题{n}", LONG_ANSWER)
+        history = context.history("s1")
+        assert history and history[-1].question == f"问题{n}"
+        assert sum(turn.tokens for turn in history) <= 2000
+
+def test_oversized_turn_is_truncated(context):
+    context.history("s1")
+    context.add_turn("问题1", "答" * 5000)
+    history = context.history("s1")
+    assert [turn.question for turn in history] == ["问题1"]
+    assert history[0].answer.startswith("答")
+    assert 2 * MESSAGE_OVERHEAD < history[0].tokens <= 2000
+
+def test_latest_turns_loaded_after_many_new_records(context):
+    context.history("s1")
+    for n in range(1, 10):
+        context.add_turn(f"问题{n}", "答案")
+    history = context.history("s1")
+    assert [turn.question for turn in history][-1] == "问题9"
+    assert len(history) <= 6
+
+def test_relabeled_turn_dropped_after_reset(context):
+    context.history("s1")
+    context.add_turn("问题1", "答案")
+    context.add_turn("无关问题", "答案")
+    assert [turn.question for turn in context.history("s1")] == ["问题1", "无关问题"]
+    # 待判断的记录已在窗口中, 之后被判为无关
+    context.records[1]["is_irrelevant"] = True
+    context.reset(["s1"])
+    assert [turn.question for turn in context.history("s1")] == ["问题1"]
@@ -0,0 +1,44 @@
+"""问答记录按(chat_time, id)键集分页的测试"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+from db import get_chat_records
+from models import AIChatRecord, User
+
+STUDENT_ID = "chatpage01"
+
+@pytest.fixture(scope="module")
+def chat_ids():
+    """一个学生的12条问答记录, 其中几条时间相同, 返回按时间倒序排列的ID"""
+    db.init_db(start_background=False)
+    base = datetime(2024, 3, 1, 8, 0, 0)
+    times = [base + timedelta(minutes=n // 3) for n in range(12)]
+    with db.get_db() as session:
+        session.add(User(student_id=STUDENT_ID, name="分页测试"))
+        records = [AIChatRecord(student_id=STUDENT_ID, question=f"问题{n}", answer="答案", chat_time=chat_time,
+                                is_irrelevant=False) for n, chat_time in enumerate(times)]
+        session.add_all(records)
+        session.flush()
+        ordered = sorted(records, key=lambda record: (record.chat_time, record.id), reverse=True)
+        return [record.id for record in ordered]
+
+def test_pages_cover_all_records_in_order(chat_ids):
+    seen = []
+    cursor = None
+    while True:
+        chats, cursor = get_chat_records(STUDENT_ID, cursor, limit=5)
+        assert len(chats) <= 5
+        seen.extend(chat["id"] for chat in chats)
+        if cursor is None:
+            break
+    assert seen == chat_ids
+
+def test_exact_multiple_of_page_size_has_no_empty_page(chat_ids):
+    chats, cursor = get_chat_records(STUDENT_ID, None, limit=len(chat_ids))
+    assert len(chats) == len(chat_ids) and cursor is None
+
+def test_invalid_cursor(chat_ids):
+    with pytest.raises(ValueError):
+        get_chat_records(STUDENT_ID, "not-a-cursor", limit=5)
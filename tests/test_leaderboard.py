@@ -0,0 +1,51 @@
+"""排行榜跳表和名次的测试"""
+import bisect
+import random
+
+import pytest
+
+from leaderboard import IndexableSkipList, Leaderboard
+
+def test_skip_list_matches_sorted_list():
+    rng = random.Random(7)
+    skip_list = IndexableSkipList()
+    expected = []
+    for _ in range(2000):
+        key = rng.randrange(500)
+        if key in expected and rng.random() < 0.5:
+            skip_list.remove(key)
+            expected.remove(key)
+        elif key not in expected:
+            skip_list.insert(key)
+            bisect.insort(expected, key)
+    assert len(skip_list) == len(expected)
+    assert list(skip_list.iter_from(0)) == expected
+    for index in (0, 1, len(expected) // 2, len(expected) - 1, len(expected)):
+        assert list(skip_list.iter_from(index)) == expected[index:]
+    for key in (-1, 0, 250, 499, 500):
+        assert skip_list.count_less(key) == bisect.bisect_left(expected, key)
+
+def test_skip_list_remove_missing_key():
+    skip_list = IndexableSkipList()
+    skip_list.insert(1)
+    with pytest.raises(KeyError):
+        skip_list.remove(2)
+    skip_list.remove(1)
+    assert len(skip_list) == 0
+    assert list(skip_list.iter_from(0)) == []
+
+def test_tied_scores_share_rank():
+    board = Leaderboard()
+    board.set("s3", 5)
+    board.set("s2", 10)
+    board.set("s1", 10)
+    board.set("s4", 0)
+    assert board.top(10) == [(1, "s1", 10), (1, "s2", 10), (3, "s3", 5)]
+    assert board.top(2) == [(1, "s1", 10), (1, "s2", 10)]
+    assert [board.rank(s) for s in ("s1", "s2", "s3", "s4")] == [1, 1, 3, None]
+
+    # 更新分数会移动位置, 归零后移出排名
+    board.set("s3", 12)
+    board.set("s1", None)
+    assert board.top(10) == [(1, "s3", 12), (2, "s2", 10)]
+    assert len(board) == 2
@@ -0,0 +1,56 @@
+"""管理后台学生进度列表键集分页的测试"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+from db import PROGRESS_SORT_COLUMNS, get_users_progress_page
+from models import StudentStats, User
+
+PREFIX = "progpage"
+
+@pytest.fixture(scope="module", autouse=True)
+def students():
+    """9个学生, 排序列有重复值, 最近考试成绩有NULL"""
+    db.init_db(start_background=False)
+    base = datetime(2024, 3, 1, 8, 0, 0)
+    with db.get_db() as session:
+        for n in range(9):
+            student_id = f"{PREFIX}{n:02d}"
+            session.add(User(student_id=student_id, name=f"学生{n % 4}", bound_time=base + timedelta(hours=n % 3),
+                             enable_ai=n % 2 == 0))
+            session.add(StudentStats(student_id=student_id, total_questions=n % 3, correct_questions=0,
+                                     accuracy=float(n % 4 * 10), exam_count=n % 2,
+                                     last_exam_score=None if n % 3 == 0 else float(n % 2 * 60)))
+
+def _collect(sort: str, descending: bool, limit: int, **filters) -> list:
+    """逐页获取, 返回学号列表"""
+    seen = []
+    cursor = None
+    while True:
+        items, cursor, total = get_users_progress_page(sort, descending, cursor, limit, q=PREFIX, **filters)
+        seen.extend(item["student_id"] for item in items)
+        if cursor is None:
+            return seen
+
+@pytest.mark.parametrize("descending", [True, False])
+@pytest.mark.parametrize("sort", sorted(PROGRESS_SORT_COLUMNS))
+def test_pages_match_single_query(sort, descending):
+    everyone, cursor, total = get_users_progress_page(sort, descending, None, 100, q=PREFIX)
+    assert cursor is None and total == 9
+    expected = [item["student_id"] for item in everyone]
+    assert _collect(sort, descending, 2) == expected
+    assert _collect(sort, descending, 4) == expected
+
+def test_filters_apply_to_every_page():
+    assert _collect("accuracy", True, 2, enable_ai=True) == [
+        item["student_id"] for item in get_users_progress_page("accuracy", True, None, 100, q=PREFIX, enable_ai=True)[0]
+    ]
+    items, _, total = get_users_progress_page("student_id", False, None, 100, q=PREFIX, min_accuracy=20)
+    assert total == len(items) and all(item["accuracy"] >= 20 for item in items)
+
+def test_invalid_sort_and_cursor():
+    with pytest.raises(ValueError):
+        get_users_progress_page("password", True, None, 10)
+    with pytest.raises(ValueError):
+        get_users_progress_page("accuracy", True, "bm90IGpzb24", 10)
@@ -0,0 +1,52 @@
+"""近似滑动窗口限流的测试"""
+import random
+
+from utils import MemoryRateLimitBackend, _estimate, _wait_time, _window_state
+
+WINDOW = 100
+MAX_REQUESTS = 5
+
+def test_window_state_rolls_forward():
+    assert _window_state((1000, 2, 3), 1050, WINDOW) == (1000, 2, 3)
+    # 进入下一个窗口, 当前计数变为上一窗口计数
+    assert _window_state((1000, 2, 3), 1100, WINDOW) == (1100, 3, 0)
+    # 隔了一个以上的窗口, 计数清零
+    assert _window_state((1000, 2, 3), 1200, WINDOW) == (1200, 0, 0)
+
+def test_previous_window_weight_decays():
+    backend = MemoryRateLimitBackend()
+    for i in range(MAX_REQUESTS):
+        assert backend.hit("s1", 1000 + i, WINDOW, MAX_REQUESTS)
+    assert not backend.hit("s1", 1010, WINDOW, MAX_REQUESTS)
+    # 刚进入下一窗口时上一窗口的5次权重为1, 之后线性衰减
+    assert not backend.hit("s1", 1100, WINDOW, MAX_REQUESTS)
+    assert backend.wait_time("s1", 1100, WINDOW, MAX_REQUESTS) > 0
+    # 过半后估算值为 5 * 0.5 = 2.5, 还能再请求3次
+    for _ in range(3):
+        assert backend.hit("s1", 1150, WINDOW, MAX_REQUESTS)
+    assert not backend.hit("s1", 1150, WINDOW, MAX_REQUESTS)
+
+def test_wait_time_is_exact():
+    rng = random.Random(3)
+    for _ in range(500):
+        now = 1000 + rng.uniform(0, WINDOW)
+        state = _window_state((1000, rng.randrange(0, 12), rng.randrange(0, 12)), now, WINDOW)
+        wait = _wait_time(state, now, WINDOW, MAX_REQUESTS)
+        if _estimate(state, now, WINDOW) < MAX_REQUESTS:
+            assert wait == 0
+            continue
+        assert wait > 0
+        # 等待之后恰好允许, 提前一点仍然拒绝
+        later = _window_state(state, now + wait + 1e-6, WINDOW)
+        assert _estimate(later, now + wait + 1e-6, WINDOW) < MAX_REQUESTS
+        earlier = _window_state(state, now + wait - 1e-3, WINDOW)
+        assert _estimate(earlier, now + wait - 1e-3, WINDOW) >= MAX_REQUESTS
+
+def test_wait_time_does_not_count():
+    backend = MemoryRateLimitBackend()
+    assert backend.wait_time("s1", 1000, WINDOW, MAX_REQUESTS) == 0
+    for i in range(MAX_REQUESTS):
+        backend.hit("s1", 1000 + i, WINDOW, MAX_REQUESTS)
+    wait = backend.wait_time("s1", 1010, WINDOW, MAX_REQUESTS)
+    assert wait == backend.wait_time("s1", 1010, WINDOW, MAX_REQUESTS) > 0
+    assert backend.hit("s1", 1010 + wait + 1e-6, WINDOW, MAX_REQUESTS)
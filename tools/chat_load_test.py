@@ -0,0 +1,194 @@
+"""AI问答压力测试
+
+模拟N个学生同时登录并通过 /api/chat/stream 提问, 统计首字时间(TTFT)、
+生成速度(token/秒)和整体延迟的分位数。服务端会合并相邻的增量后再发送, 事件数不等于token数,
+token数按与服务端 chat_context.estimate_tokens 相同的规则由回答文本估计。配合 tools/mock_llm_server.py 使用时不会消耗DeepSeek额度。
+
+用法:
+    python tools/mock_llm_server.py --configure &
+    python app.py
+    python tools/chat_load_test.py --students 50 --questions 3
+
+测试账号通过登录接口创建, 需要开启"允许注册"。同一个学生的问题会受到问答限流,
+每个学生的问题数不要超过 rate_limit.max_requests。
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import statistics
+import time
+from collections import Counter
+from typing import List, Optional
+
+import httpx
+
+QUESTIONS = [
+    "Python中列表和元组有什么区别",
+    "怎么用for循环遍历字典的键和值",
+    "字符串的split和join方法怎么用",
+    "try except 异常处理的写法",
+    "什么是列表推导式, 举个例子",
+    "def定义函数时默认参数有什么需要注意的",
+    "range函数的三个参数分别是什么意思",
+    "怎么读取一个文本文件的所有行",
+]
+
+# 中日韩文字和全角符号, 与 chat_context.py 相同
+_WIDE_RE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计文本的token数: 中文等宽字符约0.6个token, 其他字符约0.3个token"""
+    if not text:
+        return 0
+    wide = len(_WIDE_RE.findall(text))
+    return math.ceil(wide * 0.6 + (len(text) - wide) * 0.3)
+
+class Result:
+    """一次提问的测量结果"""
+
+    __slots__ = ("status", "ttft", "latency", "chars", "tokens", "streamed_tokens", "error")
+
+    def __init__(self, status: int, ttft: Optional[float] = None, latency: float = 0.0,
+                 answer: str = "", error: str = "", first_frame: str = ""):
+        self.status = status
+        self.ttft = ttft
+        self.latency = latency
+        self.chars = len(answer)
+        self.tokens = estimate_tokens(answer)
+        # 首帧在TTFT时刻到达, 不计入其后的生成时间; 服务端合并增量后首帧可能包含大量token
+        self.streamed_tokens = estimate_tokens(answer[len(first_frame):])
+        self.error = error
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """首字之后的生成速度(估计的token/秒): 首帧之后收到的token数除以首帧之后的耗时"""
+        if self.ttft is None or self.latency <= self.ttft or self.streamed_tokens == 0:
+            return None
+        return self.streamed_tokens / (self.latency - self.ttft)
+
+async def login(client: httpx.AsyncClient, student_id: str) -> bool:
+    response = await client.post("/api/auth/login", json={"student_id": student_id, "name": f"压测{student_id}"})
+    return response.status_code == 200 and response.json().get("success", False)
+
+async def iter_sse(response: httpx.Response):
+    """解析SSE事件流, 产出 (事件类型, 数据)"""
+    buffer = ""
+    async for text in response.aiter_text():
+        buffer += text
+        *blocks, buffer = buffer.split("\n\n")
+        for block in blocks:
+            event_type = "message"
+            data_lines = []
+            for line in block.split("\n"):
+                if line.startswith("event: "):
+                    event_type = line[7:]
+                elif line.startswith("data: "):
+                    data_lines.append(line[6:])
+            if data_lines:
+                yield event_type, json.loads("\n".join(data_lines))
+
+async def ask(client: httpx.AsyncClient, question: str, save: bool) -> Result:
+    """提问一次并测量流式回答"""
+    start = time.perf_counter()
+    ttft = None
+    parts = []
+    try:
+        async with client.stream("POST", "/api/chat/stream", json={"question": question}) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return Result(response.status_code, latency=time.perf_counter() - start,
+                              error=response.text[:100])
+            async for event_type, data in iter_sse(response):
+                if event_type == "error":
+                    return Result(-1, ttft, time.perf_counter() - start, "".join(parts), data["message"])
+                if event_type == "message":
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    parts.append(data["text"])
+        latency = time.perf_counter() - start
+        answer = "".join(parts)
+        if save:
+            # 旧版页面在回答结束后调用 /save, 服务端会识别出已保存的记录
+            await client.post("/api/chat/save", json={"question": question, "answer": answer})
+        return Result(200, ttft, latency, answer, first_frame=parts[0] if parts else "")
+    except httpx.HTTPError as e:
+        return Result(0, ttft, time.perf_counter() - start, error=type(e).__name__)
+
+async def run_student(base_url: str, student_id: str, args, results: List[Result]):
+    """一个模拟学生: 登录后依次提问"""
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+        if not await login(client, student_id):
+            results.append(Result(401, error="登录失败"))
+            return
+        for i in range(args.questions):
+            question = random.choice(QUESTIONS)
+            if not args.repeat:
+                # 默认让每个问题都不同, 避免命中回答缓存
+                question = f"{question} ({student_id}-{i})"
+            results.append(await ask(client, question, args.save))
+            if args.think_time:
+                await asyncio.sleep(random.uniform(0, args.think_time))
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+def report(results: List[Result], elapsed: float):
+    statuses = Counter(r.status for r in results)
+    ok = [r for r in results if r.status == 200]
+    print(f"\n共 {len(results)} 次请求, 用时 {elapsed:.2f}s, 吞吐 {len(results) / elapsed:.2f} req/s")
+    # 状态码-1表示回答过程中收到了error事件, 0表示连接异常
+    print("状态码: " + ", ".join(f"{status}={count}" for status, count in sorted(statuses.items())))
+    errors = Counter(r.error for r in results if r.error)
+    for error, count in errors.most_common(5):
+        print(f"  {count} x {error}")
+    if not ok:
+        return
+
+    def line(name: str, values: List[float], unit: str):
+        if not values:
+            return
+        print(f"{name:<10} 平均 {statistics.mean(values):8.3f}{unit}  p50 {percentile(values, 50):8.3f}{unit}"
+              f"  p95 {percentile(values, 95):8.3f}{unit}  p99 {percentile(values, 99):8.3f}{unit}"
+              f"  最大 {max(values):8.3f}{unit}")
+
+    line("TTFT", [r.ttft for r in ok if r.ttft is not None], "s")
+    line("总延迟", [r.latency for r in ok], "s")
+    line("生成速度", [r.tokens_per_second for r in ok if r.tokens_per_second is not None], "t/s")
+    total_chars = sum(r.chars for r in ok)
+    total_tokens = sum(r.tokens for r in ok)
+    print(f"共收到 {total_chars} 个字符(约 {total_tokens} 个token), 合计 {total_tokens / elapsed:.1f} token/秒")
+
+async def main_async(args):
+    results: List[Result] = []
+    students = [f"{args.prefix}{i:04d}" for i in range(args.students)]
+    start = time.perf_counter()
+    tasks = []
+    for student_id in students:
+        tasks.append(asyncio.create_task(run_student(args.url, student_id, args, results)))
+        if args.ramp_up:
+            await asyncio.sleep(args.ramp_up / len(students))
+    await asyncio.gather(*tasks)
+    report(results, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="AI问答压力测试")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="OpenJudge服务地址")
+    parser.add_argument("--students", type=int, default=20, help="并发的模拟学生数")
+    parser.add_argument("--questions", type=int, default=2, help="每个学生的提问次数")
+    parser.add_argument("--prefix", default="load", help="模拟学生的学号前缀")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="在这段时间(秒)内逐步启动所有学生")
+    parser.add_argument("--think-time", type=float, default=0.0, help="两次提问之间的最长随机间隔(秒)")
+    parser.add_argument("--repeat", action="store_true", help="使用重复的问题, 测试回答缓存")
+    parser.add_argument("--save", action="store_true", help="回答结束后再调用 /api/chat/save")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单次请求超时(秒)")
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
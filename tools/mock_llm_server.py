@@ -0,0 +1,206 @@
+"""本地的OpenAI兼容模拟服务
+
+实现 chat.completions 接口(流式和非流式), 用于在不消耗DeepSeek额度的情况下
+对AI问答做压力测试。可以配置首字延迟、生成速度和错误注入比例。
+
+用法:
+    python tools/mock_llm_server.py --port 9100 --tokens-per-second 30 --latency 0.5
+    python tools/mock_llm_server.py --configure   # 同时把config.json中的deepseek.base_url指向本服务
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 模拟回答, 按 token 切分后逐个发送
+SAMPLE_ANSWER = """在Python中, 列表(list)是可变的有序序列, 可以用方括号创建:
+
+```python
+numbers = [3, 1, 2]
+numbers.append(4)
+numbers.sort()
+print(numbers)  # [1, 2, 3, 4]
+```
+
+常用操作包括 append、extend、insert、pop 和切片。如果不需要修改, 可以使用元组(tuple)代替。
+"""
+
+# 相关性判断请求的系统提示词特征
+RELEVANCE_MARKER = "判断问题是否与Python相关"
+
+def tokenize(text: str) -> list:
+    """把文本粗略切分为 token: 英文单词和标点各算一个, 中文每两个字算一个"""
+    tokens = []
+    buffer = ""
+    for char in text:
+        if char.isascii() and (char.isalnum() or char == "_"):
+            buffer += char
+            continue
+        if buffer:
+            tokens.append(buffer)
+            buffer = ""
+        if not char.isascii() and tokens and len(tokens[-1]) == 1 and not tokens[-1].isascii():
+            tokens[-1] += char
+        else:
+            tokens.append(char)
+    if buffer:
+        tokens.append(buffer)
+    return tokens
+
+class MockSettings:
+    """模拟服务的行为参数"""
+
+    def __init__(self, args):
+        self.tokens_per_second = args.tokens_per_second
+        self.latency = args.latency
+        self.jitter = args.jitter
+        self.error_rate = args.error_rate
+        self.error_status = args.error_status
+        self.abort_rate = args.abort_rate
+        self.answer_tokens = tokenize(SAMPLE_ANSWER) * args.answer_repeat
+
+def create_app(settings: MockSettings) -> FastAPI:
+    app = FastAPI(title="OpenJudge Mock LLM")
+    stats = {"requests": 0, "streams": 0, "errors": 0, "aborts": 0, "active": 0}
+
+    def completion_id() -> str:
+        return f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+    def first_token_delay() -> float:
+        return max(0.0, settings.latency + random.uniform(-settings.jitter, settings.jitter))
+
+    def answer_for(body: dict) -> list:
+        system_prompt = next(
+            (m.get("content", "") for m in body.get("messages", []) if m.get("role") == "system"), ""
+        )
+        if RELEVANCE_MARKER in system_prompt:
+            # 批量判断时用户消息是问题的JSON数组, 按数组长度返回判断结果
+            question = next((m.get("content", "") for m in body.get("messages", []) if m.get("role") == "user"), "")
+            try:
+                questions = json.loads(question)
+            except ValueError:
+                return ["相关"]
+            if isinstance(questions, list):
+                return [json.dumps(["python" in str(q).lower() for q in questions])]
+            return ["相关"]
+        max_tokens = body.get("max_tokens")
+        tokens = settings.answer_tokens
+        return tokens[:max_tokens] if max_tokens else tokens
+
+    async def stream_tokens(model: str, tokens: list):
+        cid = completion_id()
+        created = int(time.time())
+        interval = 1.0 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0
+        abort_at = random.randrange(len(tokens)) if random.random() < settings.abort_rate else None
+        stats["active"] += 1
+        try:
+            await asyncio.sleep(first_token_delay())
+            for i, token in enumerate(tokens):
+                if i == abort_at:
+                    # 模拟上游中途断开
+                    stats["aborts"] += 1
+                    return
+                chunk = {
+                    "id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"role": "assistant", "content": token} if i == 0
+                                 else {"content": token}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                if interval:
+                    await asyncio.sleep(interval)
+            done = {
+                "id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+        finally:
+            stats["active"] -= 1
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        if random.random() < settings.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(
+                status_code=settings.error_status,
+                content={"error": {"message": "mock injected error", "type": "server_error", "code": None}}
+            )
+
+        model = body.get("model", "mock")
+        tokens = answer_for(body)
+        if body.get("stream"):
+            stats["streams"] += 1
+            return StreamingResponse(stream_tokens(model, tokens), media_type="text/event-stream")
+
+        await asyncio.sleep(first_token_delay())
+        if settings.tokens_per_second > 0:
+            await asyncio.sleep(len(tokens) / settings.tokens_per_second)
+        return {
+            "id": completion_id(),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": sum(len(tokenize(m.get("content", ""))) for m in body.get("messages", [])),
+                "completion_tokens": len(tokens),
+                "total_tokens": len(tokens)
+            }
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        """模拟服务自身的请求统计"""
+        return stats
+
+    return app
+
+def configure_base_url(base_url: str, config_path: str):
+    """把config.json中的deepseek.base_url指向模拟服务, 运行中的服务会自动重新加载"""
+    with open(config_path, "r", encoding="utf-8") as f:
+        config_data = json.load(f)
+    deepseek = config_data.setdefault("deepseek", {})
+    previous = deepseek.get("base_url")
+    deepseek["base_url"] = base_url
+    deepseek.setdefault("api_key", "mock")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config_data, f, ensure_ascii=False, indent=4)
+    print(f"已将 deepseek.base_url 从 {previous} 修改为 {base_url}, 测试结束后请改回")
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI兼容的本地模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--tokens-per-second", type=float, default=30.0, help="每个流的生成速度, 0表示不限速")
+    parser.add_argument("--latency", type=float, default=0.5, help="首个token之前的延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="首字延迟的随机抖动(秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="直接返回错误的请求比例")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误的HTTP状态码, 如429或500")
+    parser.add_argument("--abort-rate", type=float, default=0.0, help="流式回答中途断开的比例")
+    parser.add_argument("--answer-repeat", type=int, default=1, help="模拟回答重复的次数, 用于加长回答")
+    parser.add_argument("--configure", action="store_true", help="把config.json中的deepseek.base_url指向本服务")
+    parser.add_argument("--config", default=os.path.join(ROOT_DIR, "config.json"), help="config.json路径")
+    args = parser.parse_args()
+
+    if args.configure:
+        configure_base_url(f"http://{args.host}:{args.port}", args.config)
+    uvicorn.run(create_app(MockSettings(args)), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
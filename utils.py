@@ -1,5 +1,10 @@
+import math
+import threading
 import time
-from collections import defaultdict
+from typing import Optional, Tuple
+
+import cluster
+from config import config
 
 def get_client_ip(request) -> str:
     """获取客户端真实IP地址
@@ -40,18 +45,200 @@ def _is_valid_ip(ip: str) -> bool:
         return False
 
 # 限流器实现
+#
+# 采用近似滑动窗口计数: 每个键只保存(当前窗口起点, 上一窗口计数, 当前窗口计数),
+# 估算值 = 上一窗口计数 * 上一窗口在滑动窗口中所占比例 + 当前窗口计数。
+# 窗口起点按窗口大小对齐, 这样不同进程对同一个键的计算结果一致。
+
+def _window_state(state: Tuple[int, int, int], now: float, window: int) -> Tuple[int, int, int]:
+    """将保存的状态推进到当前窗口
+
+    Returns:
+        tuple: (当前窗口起点, 上一窗口计数, 当前窗口计数)
+    """
+    aligned = int(now // window) * window
+    start, prev_count, curr_count = state
+    if start == aligned:
+        return aligned, prev_count, curr_count
+    if start == aligned - window:
+        return aligned, curr_count, 0
+    return aligned, 0, 0
+
+def _estimate(state: Tuple[int, int, int], now: float, window: int) -> float:
+    """估算滑动窗口内的请求数, state必须已推进到当前窗口"""
+    start, prev_count, curr_count = state
+    weight = 1 - (now - start) / window
+    return prev_count * weight + curr_count
+
+def _wait_time(state: Tuple[int, int, int], now: float, window: int, max_requests: int) -> float:
+    """计算估算值降到限制以下所需等待的秒数, state必须已推进到当前窗口"""
+    if _estimate(state, now, window) < max_requests:
+        return 0
+    start, prev_count, curr_count = state
+    elapsed = now - start
+    if curr_count >= max_requests:
+        # 当前窗口已满, 需等到进入下一窗口且本窗口计数的权重衰减到足够小
+        return (window - elapsed) + window * (1 - max_requests / curr_count)
+    # 上一窗口的权重随时间线性衰减; 估算值恰好等于上限时同样被拒绝, 等待时间不能为0
+    return max(0.001, window * (1 - (max_requests - curr_count) / prev_count) - elapsed)
+
+class MemoryRateLimitBackend:
+    """进程内限流状态存储, 单进程部署时使用"""
+
+    def __init__(self, cleanup_interval: float = 60):
+        self.cleanup_interval = cleanup_interval
+        self._states = {}  # key -> (窗口起点, 上一窗口计数, 当前窗口计数)
+        self._lock = threading.Lock()
+        self._last_cleanup = time.time()
+
+    def _cleanup(self, now: float, window: int):
+        """清理两个窗口内没有请求的键"""
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        expire_before = int(now // window) * window - window
+        for key in [k for k, state in self._states.items() if state[0] < expire_before]:
+            del self._states[key]
+
+    def hit(self, key: str, now: float, window: int, max_requests: int) -> bool:
+        """请求一次配额, 允许时计数加一"""
+        with self._lock:
+            self._cleanup(now, window)
+            state = _window_state(self._states.get(key, (0, 0, 0)), now, window)
+            if _estimate(state, now, window) >= max_requests:
+                self._states[key] = state
+                return False
+            self._states[key] = (state[0], state[1], state[2] + 1)
+            return True
+
+    def wait_time(self, key: str, now: float, window: int, max_requests: int) -> float:
+        """获取需要等待的秒数, 不修改状态"""
+        with self._lock:
+            state = self._states.get(key)
+        if state is None:
+            return 0
+        return _wait_time(_window_state(state, now, window), now, window, max_requests)
+
+class SQLiteRateLimitBackend:
+    """基于SQLite表的限流状态存储, 多个工作进程共享同一份计数
+
+    判断和计数在一条UPDATE语句中完成, 由SQLite的写锁保证原子性。
+    """
+
+    def __init__(self, cleanup_interval: float = 60):
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0
+
+    def _cleanup(self, db, now: float, window: int):
+        """删除两个窗口内没有请求的键"""
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        from sqlalchemy import text
+        aligned = int(now // window) * window
+        db.execute(text("DELETE FROM rate_limits WHERE window_start < :before"), {"before": aligned - window})
+
+    def hit(self, key: str, now: float, window: int, max_requests: int) -> bool:
+        """请求一次配额, 允许时计数加一"""
+        from sqlalchemy import text
+        from db import get_db
+        aligned = int(now // window) * window
+        params = {
+            "key": key,
+            "aligned": aligned,
+            "previous": aligned - window,
+            "weight": 1 - (now - aligned) / window,
+            "max": max_requests
+        }
+        with get_db() as db:
+            self._cleanup(db, now, window)
+            db.execute(text(
+                "INSERT OR IGNORE INTO rate_limits (key, window_start, prev_count, curr_count) "
+                "VALUES (:key, :aligned, 0, 0)"
+            ), params)
+            # 先把保存的状态推进到当前窗口, 估算值未超限时才计数
+            result = db.execute(text("""
+                UPDATE rate_limits SET
+                    prev_count = CASE WHEN window_start = :aligned THEN prev_count
+                                      WHEN window_start = :previous THEN curr_count
+                                      ELSE 0 END,
+                    curr_count = CASE WHEN window_start = :aligned THEN curr_count ELSE 0 END + 1,
+                    window_start = :aligned
+                WHERE key = :key AND (
+                    CASE WHEN window_start = :aligned THEN prev_count
+                         WHEN window_start = :previous THEN curr_count
+                         ELSE 0 END * :weight
+                    + CASE WHEN window_start = :aligned THEN curr_count ELSE 0 END
+                ) < :max
+            """), params)
+            return result.rowcount == 1
+
+    def wait_time(self, key: str, now: float, window: int, max_requests: int) -> float:
+        """获取需要等待的秒数, 不修改状态"""
+        from sqlalchemy import text
+        from db import get_db
+        with get_db() as db:
+            row = db.execute(text(
+                "SELECT window_start, prev_count, curr_count FROM rate_limits WHERE key = :key"
+            ), {"key": key}).first()
+        if row is None:
+            return 0
+        state = (row[0], row[1], row[2])
+        return _wait_time(_window_state(state, now, window), now, window, max_requests)
+
+# 可用的限流状态存储
+RATE_LIMIT_BACKENDS = {
+    "memory": MemoryRateLimitBackend,
+    "sqlite": SQLiteRateLimitBackend,
+}
+
 class RateLimiter:
-    def __init__(self, max_requests: int, time_window: int):
+    def __init__(self, max_requests: Optional[int] = None, time_window: Optional[int] = None,
+                 backend: Optional[str] = None, name: str = "default"):
         """
         初始化限流器
         
         Args:
-            max_requests: 时间窗口内允许的最大请求数
-            time_window: 时间窗口大小(秒)
+            max_requests: 时间窗口内允许的最大请求数, 为None时每次从配置读取
+            time_window: 时间窗口大小(秒), 为None时每次从配置读取
+            backend: 状态存储("memory"或"sqlite"), 为None时每次从配置读取
+            name: 限流器名称, 作为共享存储中的键前缀
         """
-        self.max_requests = max_requests
-        self.time_window = time_window
-        self.requests = defaultdict(list)  # student_id -> [timestamp1, timestamp2, ...]
+        self._max_requests = max_requests
+        self._time_window = time_window
+        self._backend_name = backend
+        self.name = name
+        self._backends = {}
+        self._lock = threading.Lock()
+
+    @property
+    def max_requests(self) -> int:
+        """时间窗口内允许的最大请求数"""
+        return self._max_requests if self._max_requests is not None else config.rate_limit_max_requests
+
+    @property
+    def time_window(self) -> int:
+        """时间窗口大小(秒)"""
+        window = self._time_window if self._time_window is not None else config.rate_limit_window
+        return max(1, int(window))
+
+    @property
+    def backend(self):
+        """当前使用的状态存储"""
+        name = self._backend_name or config.rate_limit_backend
+        if name not in RATE_LIMIT_BACKENDS:
+            name = "memory"
+        # 多进程部署时各进程的内存计数互不可见, 必须使用共享存储
+        if name == "memory" and cluster.is_multi_worker():
+            name = "sqlite"
+        backend = self._backends.get(name)
+        if backend is None:
+            with self._lock:
+                backend = self._backends.setdefault(name, RATE_LIMIT_BACKENDS[name]())
+        return backend
+
+    def _key(self, student_id: str) -> str:
+        return f"{self.name}:{student_id}"
     
     def is_allowed(self, student_id: str) -> bool:
         """
@@ -63,21 +250,7 @@ class RateLimiter:
         Returns:
             bool: 是否允许请求
         """
-        now = time.time()
-        
-        # 清理过期的请求记录
-        self.requests[student_id] = [
-            ts for ts in self.requests[student_id]
-            if now - ts < self.time_window
-        ]
-        
-        # 检查是否超过限制
-        if len(self.requests[student_id]) >= self.max_requests:
-            return False
-        
-        # 记录新的请求
-        self.requests[student_id].append(now)
-        return True
+        return self.backend.hit(self._key(student_id), time.time(), self.time_window, self.max_requests)
     
     def get_remaining_time(self, student_id: str) -> float:
         """
@@ -89,21 +262,8 @@ class RateLimiter:
         Returns:
             float: 需要等待的秒数
         """
-        if not self.requests[student_id]:
-            return 0
-            
-        now = time.time()
-        oldest_request = self.requests[student_id][0]
-        time_passed = now - oldest_request
-        
-        if time_passed >= self.time_window:
-            return 0
-            
-        return self.time_window - time_passed
+        wait = self.backend.wait_time(self._key(student_id), time.time(), self.time_window, self.max_requests)
+        return math.ceil(wait)
 
-# 创建限流器实例
-from config import config
-chat_limiter = RateLimiter(
-    max_requests=config.rate_limit_max_requests,
-    time_window=config.rate_limit_window
-)
+# 创建限流器实例, 限流参数随配置文件实时生效
+chat_limiter = RateLimiter(name="chat")
@@ -0,0 +1,143 @@
+"""数据版本号与条件请求
+
+学生端和管理后台的很多只读接口(考试配置、练习统计、考试记录、系统概览等)在每次加载页面和轮询时
+都会重新查询数据库并返回相同的内容。本模块为数据维护三类版本号:
+
+- 全局版本: 任何数据写入都会增加;
+- 学生版本: 某个学生的数据(答题、考试、认证码、问答、账号等)写入时增加;
+- 题库版本: 题库修改时增加。
+
+写入路径提交事务后增加对应的版本号(见 db.py 中的会话事件), 多进程部署时经失效总线合并通知其他进程。
+只读接口用相关的版本号计算ETag: 请求带有相同的 If-None-Match 时直接返回304, 不执行任何查询;
+版本未变但客户端没有缓存时返回上次生成的响应体。
+
+版本号只保存在进程内, ETag中带有进程标识, 其他进程或重启后签发的ETag不会被误认为仍然有效。
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import cluster
+from config import config
+
+# 最多缓存多少个响应体
+MAX_CACHED_BODIES = 4096
+
+class DataVersions:
+    """进程内的数据版本号"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._global = 0
+        self._questions = 0
+        self._students: Dict[str, int] = {}
+
+    @property
+    def global_version(self) -> int:
+        return self._global
+
+    @property
+    def questions_version(self) -> int:
+        return self._questions
+
+    def student(self, student_id: str) -> int:
+        """获取学生的数据版本"""
+        return self._students.get(student_id, 0)
+
+    def bump(self, student_ids: Iterable[Optional[str]] = (), questions: bool = False):
+        """增加本进程的版本号, 全局版本总是增加
+
+        Args:
+            student_ids: 数据有变化的学生, 为None的项只影响全局版本
+            questions: 题库是否有变化
+        """
+        with self._lock:
+            self._global += 1
+            if questions:
+                self._questions += 1
+            for student_id in student_ids:
+                if student_id:
+                    self._students[student_id] = self._students.get(student_id, 0) + 1
+
+    def publish(self, student_ids: Iterable[Optional[str]] = ()):
+        """数据已写入: 增加本进程的版本号并通知其他进程
+
+        多进程部署时通知在短时间内合并发送(见 cluster.publish_batched), 不为每次提交增加一个写事务,
+        其他进程的版本号最多延迟约 cluster.BATCH_INTERVAL 加轮询间隔更新。
+        """
+        cluster.publish_batched("data_version", sorted({s for s in student_ids if s}))
+
+    def etag(self, *parts) -> str:
+        """由进程标识、配置版本和给定的版本号计算ETag"""
+        raw = "|".join(str(part) for part in (cluster.WORKER_ID, config.snapshot.version) + parts)
+        return '"' + hashlib.blake2b(raw.encode("utf-8"), digest_size=12).hexdigest() + '"'
+
+data_versions = DataVersions()
+
+cluster.register_handler("data_version", lambda payload: data_versions.bump(payload or ()))
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否包含给定的ETag(弱比较)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+class ConditionalResponder:
+    """按ETag处理条件请求, 并缓存每个接口最近一个版本的响应体"""
+
+    def __init__(self, max_entries: int = MAX_CACHED_BODIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._bodies: "OrderedDict[Hashable, Tuple[str, bytes]]" = OrderedDict()
+        self.stats = {"not_modified": 0, "cached": 0, "computed": 0}
+
+    def _headers(self, etag: str) -> dict:
+        # 浏览器每次使用缓存前都带上ETag重新验证
+        return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    def respond(self, request: Request, key: Hashable, etag: str, compute: Callable[[], Any]) -> Response:
+        """返回304、缓存的响应体或新生成的JSON响应
+
+        Args:
+            request: 当前请求
+            key: 缓存键, 通常为(接口名, 学号)
+            etag: 由相关版本号计算的ETag
+            compute: 版本变化或没有缓存时生成响应内容的函数
+        """
+        headers = self._headers(etag)
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            self.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+
+        with self._lock:
+            cached = self._bodies.get(key)
+            if cached is not None and cached[0] == etag:
+                self._bodies.move_to_end(key)
+                self.stats["cached"] += 1
+                return Response(content=cached[1], media_type="application/json", headers=headers)
+
+        body = JSONResponse(content=jsonable_encoder(compute())).body
+        self.stats["computed"] += 1
+        with self._lock:
+            self._bodies[key] = (etag, body)
+            self._bodies.move_to_end(key)
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def get_stats(self) -> dict:
+        """获取统计信息"""
+        return {**self.stats, "size": len(self._bodies)}
+
+conditional = ConditionalResponder()